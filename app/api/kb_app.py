@@ -2,6 +2,7 @@ import re
 from flask import request
 import logging
 import uuid
+import json
 import PIL.Image as Image
 from io import BytesIO
 
@@ -10,9 +11,22 @@ from app.utils.api_utils import validate_request
 from app.utils.api_utils import get_json_result
 from app.utils.file_utils import pil_to_fileobj
 from app.database.services.knowledgebase_service import KnowledgebaseService
+from app.database.services.content_index import KbContentIndex
+from app.database.index_spec import normalize_index_spec, get_kb_index_spec, get_kb_vector_dtype
+from app.database.vector_database import PARTITION_KEY_FIELDS, VECTOR_DTYPES, build_vector_row
 from app.database.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE
-from app.models import EmbeddingModelFactory
+from app.database.vector_writer import VECTOR_WRITER, VectorWriteError
+from app.database import FileType, TaskStatus
+from app.database.db_models import File
+from app.database.services.file_service import FileService, get_file_vector_ids
+from app.database.services.task_service import TaskService, queue_tasks
+from app.database.settings import FILE_MAXIMUM_SIZE
+from app.database.url_cache import PRESIGNED_URL_CONF
+from app.models.registry import MODEL_REGISTRY
 from app.models.settings import BAAI_VL_MODEL_PATH
+from app.task.bulk_ingest import BULK_CONF, BULK_UNLIMITED_CONTENT_LENGTH, IMAGE_SUFFIXES, BulkIngestJob, iter_jsonl, iter_multipart, iter_tar, iter_zip
+
+UPLOAD_URL_EXPIRES = int(PRESIGNED_URL_CONF.get("upload_expires", 900))
 
 @manager.route('/list', methods=['GET'])
 def list_knowledge_base():
@@ -27,7 +41,9 @@ def list_knowledge_base():
             "kb_name": kb.name,
             "bucket": kb.bucket,
             "collection": kb.collection,
-            "model": kb.model
+            "model": kb.model,
+            "index": get_kb_index_spec(kb.parser_config),
+            "vector_dtype": get_kb_vector_dtype(kb.parser_config)
             })
 
     return get_json_result(data=result)
@@ -45,6 +61,26 @@ def create_knowledge_base():
     except (TypeError, ValueError):
         return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="vector_size must be an integer")
 
+    # 索引配置：index_type 为 HNSW/IVF_FLAT/IVF_SQ8/IVF_PQ/DISKANN/FLAT/AUTOINDEX，index_params 为 JSON 格式的构建参数
+    try:
+        index_spec = None
+        if request.form.get("index_type"):
+            index_spec = {
+                "index_type": request.form.get("index_type"),
+                "params": json.loads(request.form.get("index_params") or "{}"),
+            }
+        index_spec = normalize_index_spec(index_spec, vector_size)
+    except ValueError as e:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=str(e))
+    # 分区键：file_id 按文件分区，为空时不分区
+    partition_key = request.form.get("partition_key") or None
+    if partition_key and partition_key not in PARTITION_KEY_FIELDS:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"partition_key must be one of {', '.join(PARTITION_KEY_FIELDS)}")
+    # 向量存储精度，float16/bfloat16 可减半内存与传输量
+    vector_dtype = request.form.get("vector_dtype") or "float32"
+    if vector_dtype not in VECTOR_DTYPES:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"vector_dtype must be one of {', '.join(VECTOR_DTYPES)}")
+
     # kb_name必须为英文和数字组成
     if not re.match(r'^[a-zA-Z0-9]+$', kb_name):
         return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="knowledge base name must be composed of English and numbers")
@@ -57,15 +93,17 @@ def create_knowledge_base():
         bucket_name = f'{STORAGE_IMPL_TYPE.lower()}-{kb_name}-{uid[:8]}'
         collection_name = f'{settings.VECTOR_ENGINE.lower()}_{kb_name}_{uid[:8]}'
 
-        STORAGE_IMPL.conn.make_bucket(bucket_name)
+        STORAGE_IMPL.ensure_bucket(bucket_name)
 
-        settings.vectorDatabase.createCollection(collectionName=collection_name, vectorSize=vector_size, knowledgebaseId='')
+        if not settings.vectorDatabase.createCollection(collection_name, '', vector_size, index_spec, partition_key, vector_dtype):
+            raise Exception(f"collection {collection_name} can not be created")
         
         kb = {
             "name": kb_name,
             "bucket": bucket_name,
             "collection": collection_name,
-            "model": model
+            "model": model,
+            "parser_config": json.dumps({"index": index_spec, "partition_key": partition_key, "vector_dtype": vector_dtype}),
         }
         kb = KnowledgebaseService.insert(**kb)
     except Exception as e:
@@ -89,28 +127,212 @@ def insert_multi_model_data():
         return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="image is required")
     kb = KnowledgebaseService.get_or_none(id=kb_id)
     if kb:
+        content_index = KbContentIndex(kb.id)
         if image:
             # 图片数据
             # 读取二进制数据
             img_bytes = image.read()
-            
-            # 保存图片到对象存储中
-            pic_name = f'{uuid.uuid4().hex}.{image.filename.split('.')[-1]}'
-            STORAGE_IMPL.put(bucket=kb.bucket, fnm=pic_name, binary=img_bytes)
+            img_digest = KbContentIndex.image_digest(img_bytes)
+            entry_digest = KbContentIndex.entry_digest(img_digest, text)
+            if content_index.has_entry(entry_digest):
+                # 图片与文本均已入库，跳过存储、编码与写入
+                content_index.count("duplicate_entries")
+                return get_json_result(message="duplicate", data={"file_name": content_index.get_object(img_digest), "duplicate": True})
+
+            # 保存图片到对象存储中，相同图片只保存一次
+            pic_name = content_index.get_object(img_digest)
+            if pic_name:
+                content_index.count("duplicate_objects")
+            else:
+                pic_name = KbContentIndex.object_name(img_digest, image.filename.split(".")[-1])
+                if STORAGE_IMPL.put(bucket=kb.bucket, fnm=pic_name, binary=img_bytes) is None:
+                    # 对象未写入时不编码、不写向量，客户端重试同一上传时可以重新入库
+                    return get_json_result(code=settings.RetCode.SERVER_ERROR, message=f"fail to put {kb.bucket}/{pic_name}")
+                content_index.add_object(img_digest, pic_name)
             
         if video:
             # 视频数据，
             pass
         # 模型处理图片数据并插入到向量数据库中
         if kb.model == "BaaiVl":
-            embed_model = EmbeddingModelFactory[kb.model](BAAI_VL_MODEL_PATH)
+            embed_model = MODEL_REGISTRY.get_batcher("BAAI", model_path=BAAI_VL_MODEL_PATH)
             v, _ = embed_model.encode_queries(text if text else None, img_bytes)
         elif kb.model == "Qwen":
-            embed_model = EmbeddingModelFactory[kb.model](key="sk-83e82632fcca46b388b454c5efa116fa", model="multimodal-embedding-v1")
+            embed_model = MODEL_REGISTRY.get("Tongyi-Qianwen", model_name="multimodal-embedding-v1", key="sk-83e82632fcca46b388b454c5efa116fa")
             v, _ = embed_model.encode_queries(text if text else None, img_bytes, image.mimetype.split("/")[-1])
         else:
             return get_json_result(message=f'model {kb.model} not support')
-        settings.vectorDatabase.insert(collection_name=kb.collection, data=[{"vector": v, "bucket": kb.bucket, "file_name": pic_name, "text": text}])
-        return get_json_result(message="success")
+        tags = [t.strip() for t in request.form.get("tags", "").split(",") if t.strip()]
+        row = build_vector_row(v, bucket=kb.bucket, file_name=pic_name, text=text, kb_id=kb.id, content_hash=img_digest, tags=tags,
+                               vector_dtype=get_kb_vector_dtype(kb.parser_config))
+        try:
+            VECTOR_WRITER.write(kb.collection, [row], immediate=True).result()
+        except VectorWriteError as e:
+            return get_json_result(code=settings.RetCode.SERVER_ERROR, message=str(e))
+        content_index.add_entry(entry_digest)
+        return get_json_result(message="success", data={"file_name": pic_name, "duplicate": False})
     else:
         return get_json_result(message=f'kb {kb_id} is not exists')
+
+@manager.route('/upload_url', methods=['POST'])
+@validate_request("kb_id")
+def create_upload_url():
+    """
+        申请客户端直传对象存储的预签名 PUT URL，数据不经过 API 服务
+
+        客户端用返回的 url 以 PUT 方式上传文件后，调用 /upload_complete 提交编码任务。
+        表单字段：kb_id，可选 file_name（用于确定后缀）、text（与图片一起编码的文本）。
+    """
+    kb_id = request.form.get("kb_id")
+    kb = KnowledgebaseService.get_or_none(id=kb_id)
+    if not kb:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'kb {kb_id} is not exists')
+    suffix = request.form.get("file_name", "").rpartition(".")[2].lower()
+    if suffix not in IMAGE_SUFFIXES:
+        suffix = "jpg"
+    object_name = f"uploads/{uuid.uuid4().hex}.{suffix}"
+    url = STORAGE_IMPL.get_presigned_url(kb.bucket, object_name, UPLOAD_URL_EXPIRES, method="PUT")
+    if not url:
+        return get_json_result(code=settings.RetCode.SERVER_ERROR, message="fail to create upload url")
+    file = {
+        "id": uuid.uuid4().int >> 65,
+        "kb_id": kb.id,
+        "name": object_name,
+        "location": object_name,
+        "size": 0,
+        "content": request.form.get("text", ""),
+        "parser_config": "{}",
+        "parser_type": "",
+        "type": FileType.IMAGE.value,
+        "source_type": "presigned",
+        "run": TaskStatus.UNSTART.value,
+    }
+    FileService.insert(**file)
+    return get_json_result(data={"file_id": str(file["id"]), "url": url, "method": "PUT", "expires": UPLOAD_URL_EXPIRES})
+
+@manager.route('/upload_complete', methods=['POST'])
+@validate_request("file_id")
+def complete_upload():
+    """
+        客户端直传完成后调用：校验对象已上传且大小合法，然后提交编码任务
+    """
+    file_id = request.form.get("file_id")
+    file = FileService.get_or_none(id=file_id)
+    if not file:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'file {file_id} is not exists')
+    if file.run != TaskStatus.UNSTART.value:
+        return get_json_result(code=settings.RetCode.OPERATING_ERROR, message=f'file {file_id} has already been submitted')
+    kb = KnowledgebaseService.get_or_none(id=file.kb_id)
+    if not kb:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'kb {file.kb_id} is not exists')
+    size = STORAGE_IMPL.stat(kb.bucket, file.location)
+    if size is None:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'file {file_id} has not been uploaded')
+    if size > FILE_MAXIMUM_SIZE:
+        STORAGE_IMPL.rm(kb.bucket, file.location)
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"file size exceeds {FILE_MAXIMUM_SIZE} bytes")
+    # 只有仍处于未提交状态的文件才会被提交，重复调用不会产生重复任务
+    if not FileService.filter_update([File.id == file.id, File.run == TaskStatus.UNSTART.value],
+                                     {"size": size, "run": TaskStatus.RUNNING.value}):
+        return get_json_result(code=settings.RetCode.OPERATING_ERROR, message=f'file {file_id} has already been submitted')
+    tasks = queue_tasks({"id": file.id, "type": file.type}, kb.bucket, file.location)
+    return get_json_result(data={"file_id": str(file.id), "task_ids": [t["id"] for t in tasks]})
+
+@manager.route('/file_vector_ids', methods=['GET'])
+def file_vector_ids():
+    """
+        查询文件写入向量库后得到的向量 id
+    """
+    file_id = request.args.get("file_id")
+    if not file_id:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="required argument are missing: file_id; ")
+    file = FileService.get_or_none(id=file_id)
+    if not file:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'file {file_id} is not exists')
+    return get_json_result(data={"file_id": str(file.id), "vector_ids": [str(i) for i in get_file_vector_ids(file.id)]})
+
+@manager.route('/delete_file', methods=['POST'])
+@validate_request("file_id")
+def delete_file():
+    """
+        删除文件：按记录的向量 id 删除其向量，并删除对象存储中的原始文件、任务与文件记录
+    """
+    file_id = request.form.get("file_id")
+    file = FileService.get_or_none(id=file_id)
+    if not file:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'file {file_id} is not exists')
+    # 处理中的任务可能在删除后写入向量，需先取消并等待任务结束
+    if any(0 <= t["progress"] < 1 for t in TaskService.get_tasks(file.id) or []):
+        return get_json_result(code=settings.RetCode.OPERATING_ERROR, message=f'file {file_id} is being processed')
+    kb = KnowledgebaseService.get_or_none(id=file.kb_id)
+    try:
+        deleted = FileService.delete_file(file)
+    except Exception as e:
+        logging.exception(f"delete file {file_id} failed")
+        return get_json_result(code=settings.RetCode.SERVER_ERROR, message=str(e))
+    if kb:
+        STORAGE_IMPL.rm(kb.bucket, file.location)
+    return get_json_result(data={"file_id": str(file.id), "deleted_vectors": deleted})
+
+@manager.route('/bulk_insert', methods=['POST'])
+def bulk_insert_multi_model_data():
+    """
+        批量插入多模态数据到知识库中，返回任务 id，可通过 /bulk_insert/<job_id> 轮询进度
+
+        支持的请求体（kb_id 通过 query 参数传入，multipart 时也可放在表单中）：
+            - multipart/form-data：多个 images 文件字段及同序的 texts 字段
+            - application/x-tar、application/gzip：同名图片与 .txt 相邻存放的 tar 包
+            - application/zip：同名图片与 .txt 组成的 zip 包
+            - application/x-ndjson、application/jsonl：每行 {"text", "image"(base64), "suffix"}
+        请求体以流的方式读取，不会整体缓存在内存中。
+    """
+    # 为 None 时会回退到应用级的 MAX_CONTENT_LENGTH，0 表示不限制，需要显式给出一个足够大的上限
+    request.max_content_length = int(BULK_CONF.get("max_content_length") or 0) or BULK_UNLIMITED_CONTENT_LENGTH
+    mimetype = request.mimetype
+    if mimetype == "multipart/form-data":
+        kb_id = request.args.get("kb_id") or request.form.get("kb_id")
+    else:
+        kb_id = request.args.get("kb_id")
+    if not kb_id:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="required argument are missing: kb_id; ")
+    kb = KnowledgebaseService.get_or_none(id=kb_id)
+    if not kb:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'kb {kb_id} is not exists')
+
+    if mimetype == "multipart/form-data":
+        samples = iter_multipart(request.files, request.form)
+    elif mimetype in ("application/x-tar", "application/gzip", "application/x-gzip"):
+        samples = iter_tar(request.stream)
+    elif mimetype in ("application/zip", "application/x-zip-compressed"):
+        samples = iter_zip(request.stream)
+    elif mimetype in ("application/x-ndjson", "application/jsonl", "application/jsonlines"):
+        samples = iter_jsonl(request.stream)
+    else:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"content type {mimetype} not support")
+
+    job = BulkIngestJob(kb)
+    job.feed(samples)
+    return get_json_result(data=job.to_dict())
+
+@manager.route('/bulk_insert/<job_id>', methods=['GET'])
+def bulk_insert_progress(job_id):
+    """
+        查询批量插入任务的进度
+    """
+    progress = BulkIngestJob.get_progress(job_id)
+    if not progress:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'job {job_id} is not exists')
+    return get_json_result(data=progress)
+
+@manager.route('/dedup_stats', methods=['GET'])
+def dedup_stats():
+    """
+        查询知识库的去重统计：跳过的对象存储写入次数与跳过的重复数据条数
+    """
+    kb_id = request.args.get("kb_id")
+    if not kb_id:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="required argument are missing: kb_id; ")
+    kb = KnowledgebaseService.get_or_none(id=kb_id)
+    if not kb:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'kb {kb_id} is not exists')
+    return get_json_result(data=KbContentIndex(kb.id).stats())
@@ -1,21 +1,177 @@
 import re
-from flask import request
+from flask import request, Response, stream_with_context
 import logging
 import uuid
 import PIL.Image as Image
 from io import BytesIO
 import json
+import base64
+from timeit import default_timer as timer
+
+import numpy as np
 
 from app import settings
+from app.utils import get_base_config
 from app.utils.api_utils import validate_request
 from app.utils.api_utils import get_json_result
 from app.utils.file_utils import pil_to_fileobj
+from app.database import LLMType
 from app.database.services.knowledgebase_service import KnowledgebaseService
-from app.database.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE, STORAGE_URL
-from app.models import EmbeddingModelFactory
+from app.database.services.model_cache import BOUND_MODEL_CACHE
+from app.database.index_spec import build_search_params, get_kb_index_spec, get_kb_vector_dtype
+from app.database.vector_database import build_filter_expr, encode_vector, decode_vector
+from app.database.storage_factory import STORAGE_IMPL, STORAGE_IMPL_TYPE
+from app.database.url_cache import PRESIGNED_URL_CACHE
+from app.models.registry import MODEL_REGISTRY
+from app.models.embedding_cache import EMBEDDING_CACHE
 from app.models.settings import BAAI_VL_MODEL_PATH
 
 
+RETRIEVAL_CONF = get_base_config('retrieval', {}) or {}
+BATCH_CHUNK_SIZE = int(RETRIEVAL_CONF.get("batch_chunk_size", 64))
+BATCH_MAX_QUERIES = int(RETRIEVAL_CONF.get("batch_max_queries", 10000))
+RERANK_METHODS = ("exact", "model")
+RERANK_OVERSAMPLE = int(RETRIEVAL_CONF.get("rerank_oversample", 5))
+RERANK_MAX_CANDIDATES = int(RETRIEVAL_CONF.get("rerank_max_candidates", 200))
+RERANK_LATENCY_BUDGET_MS = float(RETRIEVAL_CONF.get("rerank_latency_budget_ms", 0))
+
+
+def _split_values(params, name):
+    """同名字段可以重复出现（表单），也可以是列表（JSON）或用逗号分隔的字符串"""
+    if hasattr(params, "getlist"):
+        raw = params.getlist(name)
+    else:
+        raw = params.get(name) or []
+        raw = raw if isinstance(raw, list) else [raw]
+    values = []
+    for value in raw:
+        values.extend(v.strip() for v in str(value).split(",") if v.strip())
+    return values
+
+
+def get_filter_expr(params):
+    """
+    从检索请求（表单或 JSON）中读取结构化过滤条件：file_id、modality、start_time/end_time（毫秒时间戳）、tags，
+    转换为下推到向量库的过滤表达式
+    """
+    start_time, end_time = params.get("start_time"), params.get("end_time")
+    try:
+        start_time = int(start_time) if start_time else None
+        end_time = int(end_time) if end_time else None
+    except ValueError:
+        raise ValueError("start_time and end_time must be timestamps in milliseconds")
+    return build_filter_expr(
+        file_ids=_split_values(params, "file_id"),
+        modality=params.get("modality"),
+        start_time=start_time,
+        end_time=end_time,
+        tags=_split_values(params, "tags"),
+    )
+
+
+def _model_cache_name(kb):
+    """查询向量缓存中区分模型的标识"""
+    if kb.model == "BaaiVl":
+        return f"BaaiVl:{BAAI_VL_MODEL_PATH}"
+    return f"{kb.model}:multimodal-embedding-v1"
+
+
+def _hit_to_dict(hit):
+    return {
+        "id": hit.id,
+        "score": hit.distance,
+        "bucket": hit.bucket,
+        "file_name": hit.file_name,
+        "text": hit.text,
+        "url": PRESIGNED_URL_CACHE.get(hit.bucket, hit.file_name)
+    }
+
+
+def rerank_exact(query_vector, hits, score, max_score=None, vector_dtype="float32"):
+    """用候选的原始向量重新计算内积并排序，弥补量化索引的精度损失"""
+    if not hits:
+        return []
+    vectors = np.stack([decode_vector(hit["entity"]["vector"], vector_dtype) for hit in hits])
+    scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+    retrieval_data = []
+    for i in np.argsort(-scores):
+        s = float(scores[i])
+        if s < score or (max_score is not None and s > max_score):
+            continue
+        item = _hit_to_dict(hits[i])
+        item["vector_score"], item["score"] = item["score"], s
+        retrieval_data.append(item)
+    return retrieval_data
+
+
+def rerank_with_model(rerank_model, query, hits, timeout=None):
+    """用 RERANK 模型对候选文本重新打分，返回按相关性排序的结果，score 为重排分数；timeout 为剩余的延迟预算（秒）"""
+    if not hits:
+        return []
+    reranker = BOUND_MODEL_CACHE.get_bundle(LLMType.RERANK, rerank_model)
+    scores = reranker.similarity(query, [hit.text or "" for hit in hits], timeout=timeout)
+    retrieval_data = []
+    for i in np.argsort(-np.asarray(scores)):
+        item = _hit_to_dict(hits[i])
+        item["vector_score"], item["score"] = item["score"], float(scores[i])
+        retrieval_data.append(item)
+    return retrieval_data
+
+
+def _decode_query_image(index, data):
+    """
+    参数: index — 查询在请求中的下标；data — base64 编码的图片。
+    返回值: 图片二进制。
+    功能: 解析请求时逐条解码校验图片，无法解码时抛出带下标的 ValueError，避免坏图在批量编码时拖累同一块内的其他查询。
+    """
+    try:
+        image = base64.b64decode(data)
+        with Image.open(BytesIO(image)) as img:
+            img.load()
+    except Exception as e:
+        raise ValueError(f"queries[{index}] has an invalid image: {e}")
+    return image
+
+
+def embed_queries(kb, queries):
+    """
+    参数:
+        kb — 知识库记录。
+        queries — (text, image_bytes) 列表，二者至少有一个。
+    返回值: 与 queries 同序的 float32 numpy 向量列表。
+    功能: 先查查询向量缓存；未命中的查询按模态（是否有文本、是否有图片）分组，每组一次批量前向。
+    """
+    model_name = _model_cache_name(kb)
+    vectors, groups, keys = [None] * len(queries), {}, [None] * len(queries)
+    for i, (text, image) in enumerate(queries):
+        if EMBEDDING_CACHE.enabled:
+            keys[i] = EMBEDDING_CACHE.make_key(model_name, text, image)
+            cached = EMBEDDING_CACHE.get(keys[i])
+            if cached is not None:
+                vectors[i] = cached.astype(np.float32)
+                continue
+        groups.setdefault((bool(text), bool(image)), []).append(i)
+
+    for (with_text, with_image), idxs in groups.items():
+        texts = [queries[i][0] for i in idxs] if with_text else None
+        images = [queries[i][1] for i in idxs] if with_image else None
+        if kb.model == "BaaiVl":
+            res = MODEL_REGISTRY.get("BAAI", model_path=BAAI_VL_MODEL_PATH).encode_batch(texts, images)
+        elif kb.model == "Qwen":
+            embed_model = MODEL_REGISTRY.get("Tongyi-Qianwen", model_name="multimodal-embedding-v1", key="sk-83e82632fcca46b388b454c5efa116fa")
+            res, _ = embed_model.encode(texts, images)
+        else:
+            raise LookupError(f'model {kb.model} not support')
+        if len(res) != len(idxs):
+            raise Exception(f"model {kb.model} returned {len(res)} embeddings for {len(idxs)} queries")
+        for i, v in zip(idxs, res):
+            # 使用按缓存精度舍入后的向量，首次查询与之后命中缓存时的分数一致
+            if keys[i]:
+                v = EMBEDDING_CACHE.put(keys[i], v)
+            vectors[i] = np.asarray(v, dtype=np.float32)
+    return vectors
+
+
 @manager.route('/retrieval', methods=['POST'])
 @validate_request("kb_id",)
 def retrieval():
@@ -29,45 +185,163 @@ def retrieval():
     image = request.files.get("image")
     top_k = int(request.form.get("top_k", 5))
     score = float(request.form.get("score", 0.2))
+    # 召回参数：HNSW/DiskANN 使用 ef，IVF 系列使用 nprobe，越大召回越高、延迟越大
+    ef = request.form.get("ef", type=int)
+    nprobe = request.form.get("nprobe", type=int)
+    # 相似度上限，与 score 一起构成范围检索
+    max_score = request.form.get("max_score", type=float)
+    if max_score is not None and max_score <= score:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="max_score must be greater than score")
+    # 二阶段重排：exact 用原始向量精确重算内积，model 用 RERANK 模型按文本重新打分
+    rerank = request.form.get("rerank") or None
+    oversample = request.form.get("oversample", type=int) or RERANK_OVERSAMPLE
+    rerank_model = request.form.get("rerank_model") or settings.RERANK_MDL
+    latency_budget_ms = request.form.get("latency_budget_ms", type=float) or RERANK_LATENCY_BUDGET_MS
+    if rerank and rerank not in RERANK_METHODS:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"rerank must be one of {', '.join(RERANK_METHODS)}")
+    if rerank == "model" and not rerank_model:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message="rerank_model is required")
+    try:
+        filter_expr = get_filter_expr(request.form)
+    except ValueError as e:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=str(e))
     
     kb = KnowledgebaseService.get_or_none(id=kb_id)
     if kb:
+        start_ts = timer()
+        timings = {}
         vector = []
+        img_bytes = None
         if image:
             # 图片数据
             # 读取二进制数据
             img_bytes = image.read()
                 
                 # 模型处理图片数据
+        # 相同的查询内容直接复用缓存中的向量，跳过模型前向
         if kb.model == "BaaiVl":
-            embed_model = EmbeddingModelFactory[kb.model](BAAI_VL_MODEL_PATH)
-            v, _ = embed_model.encode_queries(text if text else None, img_bytes if image else None)
+            embed_model = MODEL_REGISTRY.get_batcher("BAAI", model_path=BAAI_VL_MODEL_PATH)
+            v = EMBEDDING_CACHE.get_or_compute(_model_cache_name(kb), text, img_bytes,
+                                               lambda: embed_model.encode_queries(text if text else None, img_bytes)[0])
             vector = [v]
         elif kb.model == "Qwen":
-            embed_model = EmbeddingModelFactory[kb.model](key="sk-83e82632fcca46b388b454c5efa116fa", model="multimodal-embedding-v1")
-            v, _ = embed_model.encode_queries(text if text else None, img_bytes if image else None, image.mimetype.split("/")[-1] if image else None)
+            embed_model = MODEL_REGISTRY.get("Tongyi-Qianwen", model_name="multimodal-embedding-v1", key="sk-83e82632fcca46b388b454c5efa116fa")
+            v = EMBEDDING_CACHE.get_or_compute(_model_cache_name(kb), text, img_bytes,
+                                               lambda: embed_model.encode_queries(text if text else None, img_bytes, image.mimetype.split("/")[-1] if image else None)[0])
             vector = [v]
         else:
             return get_json_result(message=f'model {kb.model} not support')
+        timings["embed"] = timer() - start_ts
         
         # 在向量数据库中进行检索
-        results = settings.vectorDatabase.search(collection_name=kb.collection, data=vector, limit=top_k, output_fields=["bucket", "file_name", "text"], search_params={"metric_type": "IP"})
+        # 过滤条件与相似度阈值都下推到向量库，由引擎完成剪枝；重排时按 oversample 倍数多取候选
+        limit = max(min(top_k * oversample, RERANK_MAX_CANDIDATES), top_k) if rerank else top_k
+        # 量化索引的近似分数不适合做剪枝，精确重排时阈值在重算后再应用
+        radius, range_filter = (None, None) if rerank == "exact" else (score, max_score)
+        output_fields = ["bucket", "file_name", "text"] + (["vector"] if rerank == "exact" else [])
+        search_params = build_search_params(get_kb_index_spec(kb.parser_config), limit=limit, ef=ef, nprobe=nprobe,
+                                            radius=radius, range_filter=range_filter)
+        stage_ts = timer()
+        vector_dtype = get_kb_vector_dtype(kb.parser_config)
+        results = settings.vectorDatabase.search(collection_name=kb.collection, data=[encode_vector(v, vector_dtype) for v in vector],
+                                                 limit=limit, output_fields=output_fields,
+                                                 search_params=search_params, filter=filter_expr)
+        timings["search"] = timer() - stage_ts
         if results:
-            retrieval_data = []
-            for result in results:
-                for hit in result:
-                    if hit.distance >= score:
-                        retrieval_data.append({
-                            "id": hit.id,
-                            "score": hit.distance,
-                            "bucket": hit.bucket,
-                            "file_name": hit.file_name,
-                            "text": hit.text,
-                            "url": f"{STORAGE_URL}/{hit.bucket}/{hit.file_name}"
-                        })
-            return get_json_result(message=f'success', data=retrieval_data)
+            hits = [hit for result in results for hit in result]
+            if rerank and (timer() - start_ts) * 1000 >= latency_budget_ms > 0:
+                # 已超出延迟预算，直接返回一阶段结果
+                logging.warning(f"retrieval on kb {kb_id} exceeded latency budget {latency_budget_ms}ms, skip rerank")
+                timings["rerank_skipped"] = 0
+                rerank = None
+            if rerank == "model" and not text:
+                # 纯图片查询没有文本可供重排模型打分
+                rerank = None
+            stage_ts = timer()
+            retrieval_data = None
+            if rerank == "exact":
+                retrieval_data = rerank_exact(vector[0], hits, score, max_score, vector_dtype)
+            elif rerank == "model":
+                # 重排请求只能使用剩余的延迟预算，超时后退回一阶段结果
+                remaining = (latency_budget_ms - (timer() - start_ts) * 1000) / 1000 if latency_budget_ms > 0 else None
+                try:
+                    retrieval_data = rerank_with_model(rerank_model, text, hits, timeout=remaining)
+                except Exception as e:
+                    if remaining is None or (timer() - start_ts) * 1000 < latency_budget_ms:
+                        raise
+                    logging.warning(f"retrieval on kb {kb_id} rerank exceeded latency budget {latency_budget_ms}ms: {e}")
+                    timings["rerank_skipped"] = 0
+                    rerank = None
+            if retrieval_data is None:
+                retrieval_data = [_hit_to_dict(hit) for hit in hits if hit.distance >= score]
+            if rerank:
+                timings["rerank"] = timer() - stage_ts
+            response = get_json_result(message=f'success', data=retrieval_data[:top_k])
         else:
-            return get_json_result(message=f'No matching data found')
+            response = get_json_result(message=f'No matching data found')
+        timings["total"] = timer() - start_ts
+        response.headers["Server-Timing"] = ", ".join(f"{k};dur={v * 1000:.2f}" for k, v in timings.items())
+        return response
 
     return get_json_result(message=f'insert success')
 
+
+@manager.route('/retrieval/batch', methods=['POST'])
+@validate_request("kb_id", "queries")
+def batch_retrieval():
+    """
+        批量检索，请求体为 JSON：
+            {"kb_id": ..., "queries": [{"text": "...", "image": "<base64>"}, ...],
+             "top_k": 5, "score": 0.2, "max_score": null, "ef": null, "nprobe": null,
+             "file_id"/"modality"/"start_time"/"end_time"/"tags": 过滤条件, "stream": false}
+        查询按 batch_chunk_size 分块，每块一次批量编码、一次多向量检索；
+        stream 为 true 时以 NDJSON 逐行返回 {"index": i, "data": [...]}，否则一次性返回全部结果。
+    """
+    req = request.json
+    kb = KnowledgebaseService.get_or_none(id=req["kb_id"])
+    if not kb:
+        return get_json_result(code=settings.RetCode.DATA_ERROR, message=f'kb {req["kb_id"]} is not exists')
+    try:
+        top_k = int(req.get("top_k", 5))
+        score = float(req.get("score", 0.2))
+        max_score = float(req["max_score"]) if req.get("max_score") is not None else None
+        if max_score is not None and max_score <= score:
+            raise ValueError("max_score must be greater than score")
+        filter_expr = get_filter_expr(req)
+        queries = []
+        for i, q in enumerate(req["queries"]):
+            text = q.get("text") or None
+            image = _decode_query_image(i, q["image"]) if q.get("image") else None
+            if not text and not image:
+                raise ValueError(f"queries[{i}] needs text or image")
+            queries.append((text, image))
+    except (AttributeError, TypeError, ValueError) as e:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=str(e))
+    if len(queries) > BATCH_MAX_QUERIES:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"at most {BATCH_MAX_QUERIES} queries per request")
+    if kb.model not in ("BaaiVl", "Qwen"):
+        return get_json_result(message=f'model {kb.model} not support')
+
+    vector_dtype = get_kb_vector_dtype(kb.parser_config)
+    search_params = build_search_params(get_kb_index_spec(kb.parser_config), limit=top_k, ef=req.get("ef"),
+                                        nprobe=req.get("nprobe"), radius=score, range_filter=max_score)
+
+    def search_chunks():
+        for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+            chunk = queries[start:start + BATCH_CHUNK_SIZE]
+            try:
+                vectors = embed_queries(kb, chunk)
+                results = settings.vectorDatabase.search(collection_name=kb.collection, data=[encode_vector(v, vector_dtype) for v in vectors], limit=top_k,
+                                                         output_fields=["bucket", "file_name", "text"],
+                                                         search_params=search_params, filter=filter_expr)
+                for i, result in enumerate(results):
+                    yield {"index": start + i, "data": [_hit_to_dict(hit) for hit in result if hit.distance >= score]}
+            except Exception as e:
+                logging.exception(f"batch retrieval of queries {start}-{start + len(chunk) - 1} failed")
+                for i in range(len(chunk)):
+                    yield {"index": start + i, "error": str(e)}
+
+    if req.get("stream"):
+        return Response(stream_with_context(json.dumps(res, ensure_ascii=False) + "\n" for res in search_chunks()),
+                        mimetype="application/x-ndjson")
+    return get_json_result(message='success', data=list(search_chunks()))
@@ -0,0 +1,55 @@
+from flask import request, send_file
+
+from app import settings
+from app.utils.api_utils import get_json_result
+from app.database.local_storage import LocalStorage, ObjectTooLargeError
+from app.database.settings import FILE_MAXIMUM_SIZE, LOCAL_STORAGE
+from app.database.storage_factory import STORAGE_IMPL
+
+
+def _local_storage():
+    """仅在 STORAGE_IMPL=LOCAL 时提供存储接口"""
+    storage = getattr(STORAGE_IMPL, "storage", STORAGE_IMPL)
+    return storage if isinstance(storage, LocalStorage) else None
+
+
+@manager.route('/<bucket>/<path:name>', methods=['GET'])
+def download_object(bucket, name):
+    """
+        按预签名 URL 下载本地存储中的对象；由 WSGI 服务器的 file_wrapper 以 sendfile 零拷贝发送，支持 Range 请求
+    """
+    storage = _local_storage()
+    if not storage:
+        return get_json_result(code=settings.RetCode.NOT_FOUND, message="local storage is not enabled"), 404
+    if not LOCAL_STORAGE.get("public") and not storage.verify("GET", bucket, name, request.args.get("expires"), request.args.get("signature")):
+        return get_json_result(code=settings.RetCode.FORBIDDEN, message="invalid or expired signature"), 403
+    try:
+        path = storage.path_of(bucket, name)
+    except ValueError as e:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=str(e)), 400
+    if not storage.obj_exist(bucket, name):
+        return get_json_result(code=settings.RetCode.NOT_FOUND, message=f"{bucket}/{name} is not exists"), 404
+    return send_file(path, download_name=name.rpartition("/")[2], conditional=True, max_age=3600)
+
+
+@manager.route('/<bucket>/<path:name>', methods=['PUT'])
+def upload_object(bucket, name):
+    """
+        按预签名 URL 直接上传对象，请求体以流的方式写入临时文件后原子重命名；
+        没有 Content-Length 的分块上传在写入过程中检查 FILE_MAXIMUM_SIZE
+    """
+    storage = _local_storage()
+    if not storage:
+        return get_json_result(code=settings.RetCode.NOT_FOUND, message="local storage is not enabled"), 404
+    if not storage.verify("PUT", bucket, name, request.args.get("expires"), request.args.get("signature")):
+        return get_json_result(code=settings.RetCode.FORBIDDEN, message="invalid or expired signature"), 403
+    length = request.content_length
+    if length is not None and length > FILE_MAXIMUM_SIZE:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"file size exceeds {FILE_MAXIMUM_SIZE} bytes"), 413
+    try:
+        size = storage.put_stream(bucket, name, request.stream, length if length is not None else -1, max_size=FILE_MAXIMUM_SIZE)
+    except ObjectTooLargeError:
+        return get_json_result(code=settings.RetCode.ARGUMENT_ERROR, message=f"file size exceeds {FILE_MAXIMUM_SIZE} bytes"), 413
+    if size is None:
+        return get_json_result(code=settings.RetCode.SERVER_ERROR, message=f"fail to put {bucket}/{name}"), 500
+    return get_json_result(data={"bucket": bucket, "name": name, "size": size})
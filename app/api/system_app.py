@@ -0,0 +1,76 @@
+import json
+import time
+
+from app.utils.api_utils import get_json_result
+from app.models.registry import MODEL_REGISTRY
+from app.models.embedding_cache import EMBEDDING_CACHE
+from app.database.url_cache import PRESIGNED_URL_CACHE
+from app.database.redis_database import REDIS_CONN
+from app.database.settings import (
+    SVR_QUEUE_NAME, SVR_TASK_BROKER_NAME, SVR_EXECUTOR_SET_NAME, SVR_HEARTBEAT_INTERVAL
+)
+
+
+@manager.route('/models', methods=['GET'])
+def list_loaded_models():
+    """
+    列出当前进程已加载的模型及其加载耗时、内存占用
+    """
+    return get_json_result(data=MODEL_REGISTRY.stats())
+
+
+@manager.route('/embedding_cache', methods=['GET'])
+def embedding_cache_stats():
+    """
+    查询向量缓存的容量与命中率
+    """
+    return get_json_result(data=EMBEDDING_CACHE.stats())
+
+
+@manager.route('/presigned_url_cache', methods=['GET'])
+def presigned_url_cache_stats():
+    """
+    查询检索结果预签名 URL 缓存的容量与命中率
+    """
+    return get_json_result(data=PRESIGNED_URL_CACHE.stats())
+
+
+@manager.route('/status', methods=['GET'])
+def cluster_status():
+    """
+    汇总所有任务执行器的最新心跳，给出集群视图：队列积压、存活执行器数、总吞吐等，
+    超过 3 个心跳周期没有上报的执行器标记为不存活
+    """
+    now = time.time()
+    executors = []
+    for name in sorted(REDIS_CONN.smembers(SVR_EXECUTOR_SET_NAME) or []):
+        heartbeats = REDIS_CONN.zrangebyscore(name, now - 3 * SVR_HEARTBEAT_INTERVAL, now)
+        if heartbeats:
+            heartbeat = json.loads(heartbeats[-1])
+            heartbeat["alive"] = True
+        else:
+            heartbeat = {"name": name, "alive": False}
+        executors.append(heartbeat)
+
+    alive = [e for e in executors if e["alive"]]
+    group_info = REDIS_CONN.queue_info(SVR_QUEUE_NAME, SVR_TASK_BROKER_NAME) or {}
+    data = {
+        "queue": {
+            "name": SVR_QUEUE_NAME,
+            "group": SVR_TASK_BROKER_NAME,
+            "pending": int(group_info.get("pending", 0)),
+            "lag": int(group_info.get("lag") or 0),
+            "consumers": int(group_info.get("consumers", 0)),
+        },
+        "executors": {
+            "total": len(executors),
+            "alive": len(alive),
+        },
+        "done": sum(e.get("done", 0) for e in alive),
+        "failed": sum(e.get("failed", 0) for e in alive),
+        "in_flight": sum(e.get("in_flight", 0) for e in alive),
+        "tasks_per_second": round(sum(e.get("tasks_per_second", 0) for e in alive), 3),
+        "rss": sum(e.get("rss", 0) for e in alive),
+        "executor_details": executors,
+    }
+    return get_json_result(data=data)
@@ -0,0 +1,214 @@
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import xxhash
+
+CHUNK_SIZE = 1024 * 1024
+# 超过该时长未被修改的临时文件视为崩溃遗留；缓存目录可能被多个执行器共享，进行中的下载不能删除
+STALE_TMP_SECONDS = 3600
+
+
+class BlobCache:
+    """
+    对象存储前的本地磁盘缓存，供执行器使用。
+
+    缓存文件以 xxhash(bucket/对象名) 命名并按前两位分目录存放，先写临时文件再原子重命名，
+    读取时通过 mmap 映射，重复读取热对象只需一次页缓存查找。总字节数超过 max_bytes 时
+    按最近最少使用淘汰。写入与删除先失效本地副本，其余未被缓存的方法直接转发给被包装的存储实现。
+    """
+
+    def __init__(self, storage, path, max_bytes=10 * 1024 ** 3):
+        self.storage = storage
+        self.path = path
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_bytes = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def _load(self):
+        """启动时按修改时间恢复缓存条目，只清理长时间未更新的遗留临时文件"""
+        files = []
+        now = time.time()
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                fpath = os.path.join(root, name)
+                try:
+                    st = os.stat(fpath)
+                    if name.startswith("."):
+                        if now - st.st_mtime > STALE_TMP_SECONDS:
+                            os.remove(fpath)
+                        continue
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    @staticmethod
+    def _key(bucket, filename):
+        return xxhash.xxh3_128_hexdigest(f"{bucket}/{filename}".encode("utf-8"))
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._file(key))
+            except FileNotFoundError:
+                pass
+
+    def _invalidate(self, bucket, filename):
+        key = self._key(bucket, filename)
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._size -= size
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def _open_cached(self, key):
+        """命中时返回 (mmap 映射的文件对象, 字节数)；已被淘汰或不存在时返回 (None, 0)"""
+        with self._lock:
+            size = self._entries.get(key)
+            if size is None:
+                return None, 0
+            self._entries.move_to_end(key)
+        try:
+            with open(self._file(key), "rb") as f:
+                if size == 0:
+                    return BytesIO(), 0
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size
+        except FileNotFoundError:
+            with self._lock:
+                if self._entries.pop(key, None) is not None:
+                    self._size -= size
+            return None, 0
+
+    def _fetch(self, bucket, filename, key, max_size=None):
+        """从对象存储流式下载到临时文件，原子重命名后加入缓存"""
+        fpath = self._file(key)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=os.path.dirname(fpath))
+        try:
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.storage.iter_chunks(bucket, filename, CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_size and size > max_size:
+                        raise ValueError(f"{bucket}/{filename} size exceeds {max_size} bytes")
+                    f.write(chunk)
+            os.replace(tmp, fpath)
+        except Exception:
+            os.remove(tmp)
+            raise
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old
+            self._entries[key] = size
+            self._size += size
+            self._evict()
+
+    def spool(self, bucket, filename, max_memory=None, max_size=None):
+        """
+        参数:
+            bucket/filename — 对象所在的桶与对象名。
+            max_size — 对象大小上限，超出时抛出 ValueError。
+        返回值: 指针位于开头的只读文件对象（mmap），调用方负责关闭。
+        功能: 命中时直接映射本地缓存文件；未命中时先下载到缓存再映射。
+        """
+        key = self._key(bucket, filename)
+        f, size = self._open_cached(key)
+        if f is not None:
+            if max_size and size > max_size:
+                f.close()
+                raise ValueError(f"{bucket}/{filename} size exceeds {max_size} bytes")
+            with self._lock:
+                self.hits += 1
+                self.hit_bytes += size
+            return f
+        with self._lock:
+            self.misses += 1
+        self._fetch(bucket, filename, key, max_size)
+        f, _ = self._open_cached(key)
+        if f is None:
+            # 刚写入即被淘汰（对象大于整个缓存容量），直接读取对象存储
+            return self.storage.spool(bucket, filename, max_size=max_size)
+        return f
+
+    def get(self, bucket, filename):
+        try:
+            f = self.spool(bucket, filename)
+        except Exception:
+            logging.exception(f"BlobCache get {bucket}/{filename} failed")
+            return
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    # 所有写入路径在写入前后都失效本地副本：写入期间并发读取可能把旧内容重新缓存
+    def put(self, bucket, fnm, binary):
+        self._invalidate(bucket, fnm)
+        try:
+            return self.storage.put(bucket, fnm, binary)
+        finally:
+            self._invalidate(bucket, fnm)
+
+    def put_stream(self, bucket, fnm, stream, length=-1, **kwargs):
+        self._invalidate(bucket, fnm)
+        try:
+            return self.storage.put_stream(bucket, fnm, stream, length, **kwargs)
+        finally:
+            self._invalidate(bucket, fnm)
+
+    def put_async(self, bucket, fnm, binary):
+        self._invalidate(bucket, fnm)
+        future = self.storage.put_async(bucket, fnm, binary)
+        future.add_done_callback(lambda _: self._invalidate(bucket, fnm))
+        return future
+
+    def put_many(self, bucket, objects):
+        futures = [self.put_async(bucket, fnm, binary) for fnm, binary in objects]
+        return [f.result() for f in futures]
+
+    def rm(self, bucket, fnm):
+        self._invalidate(bucket, fnm)
+        return self.storage.rm(bucket, fnm)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_bytes": self.hit_bytes,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0,
+            }
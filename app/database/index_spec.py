@@ -0,0 +1,97 @@
+import json
+
+# 各索引类型的默认构建参数
+INDEX_DEFAULT_PARAMS = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 8, "nbits": 8},
+    "DISKANN": {},
+}
+
+DEFAULT_INDEX_SPEC = {"index_type": "HNSW", "metric_type": "IP", "params": INDEX_DEFAULT_PARAMS["HNSW"]}
+
+
+def normalize_index_spec(spec=None, vector_size=None):
+    """
+    参数:
+        spec — 索引配置，例如 {"index_type": "IVF_PQ", "params": {"nlist": 2048, "m": 16}}；为空时使用 HNSW 默认配置。
+        vector_size — 向量维度，用于校验 IVF_PQ 的 m。
+    返回值: 补全默认值后的索引配置。
+    功能: 校验索引类型与参数，非法时抛出 ValueError。
+    """
+    if not spec:
+        return json.loads(json.dumps(DEFAULT_INDEX_SPEC))
+    index_type = str(spec.get("index_type", "HNSW")).upper()
+    if index_type not in INDEX_DEFAULT_PARAMS:
+        raise ValueError(f"index type {index_type} not supported, supported: {', '.join(INDEX_DEFAULT_PARAMS)}")
+    params = dict(INDEX_DEFAULT_PARAMS[index_type])
+    for k, v in (spec.get("params") or {}).items():
+        if k not in params:
+            raise ValueError(f"unknown param {k} for index type {index_type}")
+        try:
+            params[k] = int(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"param {k} of index type {index_type} must be an integer")
+    if index_type == "IVF_PQ" and vector_size and int(vector_size) % params["m"] != 0:
+        raise ValueError(f"IVF_PQ param m={params['m']} must divide vector size {vector_size}")
+    return {"index_type": index_type, "metric_type": "IP", "params": params}
+
+
+def get_kb_parser_config(parser_config):
+    """把知识库的 parser_config（JSON 字符串或字典）解析为字典，无法解析时返回空字典"""
+    if not parser_config:
+        return {}
+    if isinstance(parser_config, str):
+        try:
+            parser_config = json.loads(parser_config)
+        except ValueError:
+            return {}
+    return parser_config if isinstance(parser_config, dict) else {}
+
+
+def get_kb_index_spec(parser_config):
+    """读取知识库的索引配置，老知识库没有配置时返回 None"""
+    return get_kb_parser_config(parser_config).get("index")
+
+
+def get_kb_vector_dtype(parser_config):
+    """读取知识库的向量存储精度，老知识库为 float32"""
+    return get_kb_parser_config(parser_config).get("vector_dtype") or "float32"
+
+
+def get_kb_partition_key(parser_config):
+    """读取知识库向量集合的分区键，未分区时返回 None"""
+    return get_kb_parser_config(parser_config).get("partition_key")
+
+
+def build_search_params(index_spec=None, limit=10, ef=None, nprobe=None, radius=None, range_filter=None):
+    """
+    参数:
+        index_spec — 知识库的索引配置。
+        limit — 返回条数，HNSW 的 ef 不能小于它。
+        ef/nprobe — 请求级别的召回参数，为空时使用引擎默认值。
+        radius/range_filter — 范围检索的相似度下限（不含）与上限（含），由引擎完成剪枝。
+    返回值: 传给 vectorDatabase.search 的 search_params。
+    功能: 按索引类型把召回参数换算为对应的检索参数。
+    """
+    index_type = (index_spec or {}).get("index_type", "")
+    params = {}
+    if ef:
+        if index_type == "DISKANN":
+            params["search_list"] = max(int(ef), limit)
+        elif index_type == "HNSW":
+            params["ef"] = max(int(ef), limit)
+    if nprobe and index_type.startswith("IVF"):
+        nlist = (index_spec.get("params") or {}).get("nlist")
+        params["nprobe"] = min(int(nprobe), nlist) if nlist else int(nprobe)
+    if radius is not None:
+        params["radius"] = float(radius)
+        if range_filter is not None:
+            params["range_filter"] = float(range_filter)
+    search_params = {"metric_type": "IP"}
+    if params:
+        search_params["params"] = params
+    return search_params
@@ -0,0 +1,222 @@
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from urllib.parse import quote, urlencode
+
+import xxhash
+
+from app.utils import singleton, get_base_config
+from app.constants import SERVICE_NAME
+from . import settings
+
+CHUNK_SIZE = 1024 * 1024
+BUCKET_PATTERN = re.compile(r"^[a-z0-9][a-z0-9._-]{0,62}$")
+
+
+class ObjectTooLargeError(ValueError):
+    """写入的对象超过 max_size"""
+
+
+@singleton
+class LocalStorage(object):
+    """
+    基于本地文件系统的对象存储，接口与 MinioDatabase 一致，适合单机部署与测试。
+
+    对象存放在 <path>/<bucket>/<xx>/<yy>/<对象名的 xxh3_128>，文件名定长，不受对象名长度与 "."、".." 等特殊名字影响；
+    写入先落临时文件再原子重命名。预签名 URL 指向 /v1/storage 接口，使用 HMAC 签名校验。
+    """
+
+    def __init__(self):
+        conf = settings.LOCAL_STORAGE
+        self.root = os.path.abspath(conf.get("path") or "/tmp/mme_storage")
+        self.secret = (os.getenv("LOCAL_STORAGE_SECRET") or conf.get("secret") or "").encode("utf-8")
+        if not self.secret:
+            logging.warning("local_storage.secret is not set, presigned urls are signed with a random per-process key")
+            self.secret = os.urandom(32)
+        self.base_url = conf.get("base_url") or ""
+        self._upload_pool = None
+        self._pool_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def health(self):
+        bucket, fnm, binary = "txtxtxtxt1", "txtxtxtxt1", b"_t@@@1"
+        return self.put(bucket, fnm, binary)
+
+    def _bucket_dir(self, bucket):
+        if not BUCKET_PATTERN.match(bucket or ""):
+            raise ValueError(f"invalid bucket name {bucket}")
+        return os.path.join(self.root, bucket)
+
+    def path_of(self, bucket, fnm):
+        """对象在本地文件系统中的路径，文件名为对象名的哈希"""
+        digest = xxhash.xxh3_128_hexdigest(fnm.encode("utf-8"))
+        return os.path.join(self._bucket_dir(bucket), digest[:2], digest[2:4], digest)
+
+    def ensure_bucket(self, bucket):
+        os.makedirs(self._bucket_dir(bucket), exist_ok=True)
+
+    def put(self, bucket, fnm, binary):
+        return self.put_stream(bucket, fnm, BytesIO(binary), len(binary))
+
+    def put_stream(self, bucket, fnm, stream, length=-1, max_size=None):
+        """
+        参数:
+            bucket/fnm — 目标桶与对象名。
+            stream — 可读的文件对象。
+            length — 对象长度，-1 表示读到流结束。
+            max_size — 对象大小上限，边读边检查，超出时丢弃临时文件并抛出 ObjectTooLargeError。
+        返回值: 写入的字节数，其他失败时返回 None。
+        功能: 写入同目录下的临时文件后原子重命名，读者不会看到写了一半的对象。
+        """
+        try:
+            path = self.path_of(bucket, fnm)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    size = 0
+                    while length < 0 or size < length:
+                        chunk = stream.read(CHUNK_SIZE if length < 0 else min(CHUNK_SIZE, length - size))
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if max_size and size > max_size:
+                            raise ObjectTooLargeError(f"{bucket}/{fnm} size exceeds {max_size} bytes")
+                        f.write(chunk)
+                if 0 <= length != size:
+                    raise IOError(f"expect {length} bytes, got {size}")
+                os.replace(tmp, path)
+            except Exception:
+                os.remove(tmp)
+                raise
+            return size
+        except ObjectTooLargeError:
+            raise
+        except Exception:
+            logging.exception(f"Fail to put {bucket}/{fnm}:")
+
+    def put_many(self, bucket, objects):
+        futures = [self.put_async(bucket, fnm, binary) for fnm, binary in objects]
+        return [f.result() for f in futures]
+
+    def put_async(self, bucket, fnm, binary):
+        if self._upload_pool is None:
+            with self._pool_lock:
+                if self._upload_pool is None:
+                    workers = int(settings.LOCAL_STORAGE.get("upload_workers", 4))
+                    self._upload_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="local_upload")
+        return self._upload_pool.submit(self.put, bucket, fnm, binary)
+
+    def rm(self, bucket, fnm):
+        try:
+            os.remove(self.path_of(bucket, fnm))
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.exception(f"Fail to remove {bucket}/{fnm}:")
+
+    def get(self, bucket, filename):
+        try:
+            with open(self.path_of(bucket, filename), "rb") as f:
+                return f.read()
+        except Exception:
+            logging.exception(f"Fail to get {bucket}/{filename}")
+        return
+
+    @contextmanager
+    def open_stream(self, bucket, filename, offset=0, length=0):
+        """返回定位到 offset 的只读文件对象，退出时关闭"""
+        f = open(self.path_of(bucket, filename), "rb")
+        try:
+            f.seek(offset)
+            yield f
+        finally:
+            f.close()
+
+    def iter_chunks(self, bucket, filename, chunk_size=CHUNK_SIZE, offset=0, length=0):
+        with self.open_stream(bucket, filename, offset=offset) as f:
+            remaining = length or None
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def get_range(self, bucket, filename, offset, length):
+        with self.open_stream(bucket, filename, offset=offset) as f:
+            return f.read(length)
+
+    def spool(self, bucket, filename, max_memory=None, max_size=None):
+        """
+        参数:
+            bucket/filename — 对象所在的桶与对象名。
+            max_size — 对象大小上限，超出时抛出 ValueError。
+        返回值: mmap 映射的只读文件对象，调用方负责关闭；对象内容由页缓存共享，不复制到进程内存。
+        """
+        with open(self.path_of(bucket, filename), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if max_size and size > max_size:
+                raise ValueError(f"{bucket}/{filename} size {size} exceeds {max_size} bytes")
+            if size == 0:
+                return BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def stat(self, bucket, filename):
+        try:
+            return os.path.getsize(self.path_of(bucket, filename))
+        except FileNotFoundError:
+            return None
+
+    def obj_exist(self, bucket, filename):
+        try:
+            return os.path.isfile(self.path_of(bucket, filename))
+        except Exception:
+            logging.exception(f"obj_exist {bucket}/{filename} got exception")
+            return False
+
+    def sign(self, method, bucket, fnm, expires_at):
+        msg = f"{method}\n{bucket}\n{fnm}\n{expires_at}".encode("utf-8")
+        return hmac.new(self.secret, msg, hashlib.sha256).hexdigest()
+
+    def verify(self, method, bucket, fnm, expires_at, signature):
+        """校验预签名 URL 的签名与有效期"""
+        try:
+            if int(expires_at) < time.time():
+                return False
+        except (TypeError, ValueError):
+            return False
+        return hmac.compare_digest(self.sign(method, bucket, fnm, expires_at), signature or "")
+
+    def get_presigned_url(self, bucket, fnm, expires, method="GET"):
+        """
+        参数:
+            bucket/fnm — 对象所在的桶与对象名。
+            expires — 有效期，秒数或 timedelta。
+            method — GET 用于下载，PUT 用于客户端直传。
+        返回值: 指向 /v1/storage 接口的预签名 URL。
+        """
+        if isinstance(expires, timedelta):
+            expires = expires.total_seconds()
+        expires_at = int(time.time() + int(expires))
+        query = urlencode({"expires": expires_at, "signature": self.sign(method, bucket, fnm, expires_at)})
+        return f"{storage_base_url(self.base_url)}/{bucket}/{quote(fnm)}?{query}"
+
+
+def storage_base_url(base_url=""):
+    """本地存储对外的访问地址，未配置 base_url 时使用服务监听地址"""
+    if base_url:
+        return base_url.rstrip("/")
+    conf = get_base_config(SERVICE_NAME, {}) or {}
+    return f"http://{conf.get('host', '127.0.0.1')}:{conf.get('port', 9090)}/v1/storage"
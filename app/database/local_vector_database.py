@@ -0,0 +1,510 @@
+import ast
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import List, Optional, Union
+
+import numpy as np
+
+from app.database import settings
+from app.database.vector_database import VectorDatabase, decode_vector
+from app.database.index_spec import normalize_index_spec
+from app.utils.file_utils import get_project_base_directory
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger('mme.local_vector_database')
+
+META_FILE = "meta.json"
+VECTOR_FILE = "vectors.f32"
+ROW_LOG_FILE = "rows.jsonl"
+HNSW_FILE = "hnsw.bin"
+
+
+class Hit(dict):
+    """与 pymilvus 的检索结果保持一致：支持 hit.id、hit.distance、hit["entity"] 以及 hit.<字段名>"""
+
+    def __init__(self, id, distance, entity):
+        super().__init__(id=id, distance=distance, entity=entity)
+
+    def __getattr__(self, item):
+        if item in self:
+            return self[item]
+        entity = self["entity"]
+        if item in entity:
+            return entity[item]
+        raise AttributeError(item)
+
+
+_COMPARE_OPS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a is not None and a < b,
+    ast.LtE: lambda a, b: a is not None and a <= b,
+    ast.Gt: lambda a, b: a is not None and a > b,
+    ast.GtE: lambda a, b: a is not None and a >= b,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _contains_any(values, candidates):
+    return bool(values) and any(v in values for v in candidates)
+
+
+def _contains_all(values, candidates):
+    return bool(values) and all(v in values for v in candidates)
+
+
+_CALLS = {
+    "json_contains": lambda values, v: bool(values) and v in values,
+    "array_contains": lambda values, v: bool(values) and v in values,
+    "json_contains_any": _contains_any,
+    "array_contains_any": _contains_any,
+    "json_contains_all": _contains_all,
+    "array_contains_all": _contains_all,
+}
+
+
+def compile_filter(expr: str):
+    """
+    参数: expr — Milvus 风格的布尔表达式，例如 'file_name == "a.jpg" and id in [1, 2]'。
+    返回值: 接收一行数据（dict）并返回 bool 的函数；表达式为空时返回 None。
+    功能: 只支持比较、in/not in、and/or/not、json/array_contains 系列函数及字面量，不执行任意代码。
+    """
+    if not expr or not expr.strip():
+        return None
+    source = expr.replace("&&", " and ").replace("||", " or ")
+    tree = ast.parse(source.strip(), mode="eval").body
+
+    def build(node):
+        if isinstance(node, ast.BoolOp):
+            parts = [build(v) for v in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda row: all(p(row) for p in parts)
+            return lambda row: any(p(row) for p in parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = build(node.operand)
+            return lambda row: not inner(row)
+        if isinstance(node, ast.Compare):
+            operands = [build(node.left)] + [build(c) for c in node.comparators]
+            ops = []
+            for op in node.ops:
+                if type(op) not in _COMPARE_OPS:
+                    raise ValueError(f"unsupported operator in filter: {expr}")
+                ops.append(_COMPARE_OPS[type(op)])
+
+            def compare(row):
+                values = [o(row) for o in operands]
+                return all(op(values[i], values[i + 1]) for i, op in enumerate(ops))
+            return compare
+        if isinstance(node, ast.Name):
+            if node.id in ("true", "True"):
+                return lambda row: True
+            if node.id in ("false", "False"):
+                return lambda row: False
+            return lambda row, name=node.id: row.get(name)
+        if isinstance(node, ast.Subscript):
+            target, key = build(node.value), build(node.slice)
+            return lambda row: (target(row) or {}).get(key(row))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _CALLS and not node.keywords:
+            func, args = _CALLS[node.func.id], [build(a) for a in node.args]
+            return lambda row: func(*[a(row) for a in args])
+        if isinstance(node, (ast.Constant, ast.List, ast.Tuple)):
+            value = ast.literal_eval(node)
+            if isinstance(value, list):
+                value = tuple(value)
+            return lambda row: value
+        raise ValueError(f"unsupported filter expression: {expr}")
+
+    return build(tree)
+
+
+class LocalCollection:
+    """
+    单个本地集合。
+
+    向量保存在按容量倍增的 float32 内存映射矩阵中，每行对应一个槽位；标量字段与删除操作
+    以追加日志的方式落盘，启动时回放。行数达到 hnsw_threshold 且安装了 hnswlib 时
+    建立 HNSW 图索引，否则使用向量化的暴力内积检索。
+    """
+
+    def __init__(self, path, dim=None, index_spec=None, vector_dtype="float32", hnsw_threshold=20000, hnsw_m=16,
+                 hnsw_ef_construction=200, hnsw_ef=64):
+        self.path = path
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef = hnsw_ef
+        self.lock = threading.RLock()
+        self.rows = {}          # 槽位 -> 行数据（含 id）
+        self.id_to_slot = {}
+        self.hnsw = None
+        self._hnsw_dirty = False
+        if dim is not None:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"dim": int(dim), "count": 0, "capacity": 0, "next_id": 1, "metric_type": "IP", "index": index_spec,
+                         "vector_dtype": vector_dtype}
+            self.vectors = None
+            self._save_meta()
+        else:
+            self._load()
+        index_spec = self.meta.get("index") or {}
+        if index_spec.get("index_type") == "HNSW":
+            self.hnsw_m = index_spec["params"].get("M", self.hnsw_m)
+            self.hnsw_ef_construction = index_spec["params"].get("efConstruction", self.hnsw_ef_construction)
+        if dim is None:
+            self._load_hnsw()
+
+    def _save_meta(self):
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def _load(self):
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.vectors = None
+        if self.meta["capacity"]:
+            self.vectors = np.memmap(os.path.join(self.path, VECTOR_FILE), dtype=self.storage_dtype, mode="r+",
+                                     shape=(self.meta["capacity"], self.meta["dim"]))
+        log_path = os.path.join(self.path, ROW_LOG_FILE)
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    op = json.loads(line)
+                    if op["op"] == "insert":
+                        self.rows[op["slot"]] = op["row"]
+                        self.id_to_slot[op["row"]["id"]] = op["slot"]
+                    elif op["op"] == "delete":
+                        for slot in op["slots"]:
+                            row = self.rows.pop(slot, None)
+                            if row:
+                                self.id_to_slot.pop(row["id"], None)
+
+    @property
+    def dim(self):
+        return self.meta["dim"]
+
+    @property
+    def vector_dtype(self):
+        return self.meta.get("vector_dtype") or "float32"
+
+    @property
+    def storage_dtype(self):
+        """numpy 没有 bfloat16，16 位精度统一按 float16 保存"""
+        return np.float32 if self.vector_dtype == "float32" else np.float16
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _append_log(self, ops):
+        with open(os.path.join(self.path, ROW_LOG_FILE), "a") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _reserve(self, n):
+        """保证矩阵还有 n 个空槽位，不足时按倍数扩容并重新映射"""
+        need = self.meta["count"] + n
+        if need <= self.meta["capacity"]:
+            return
+        capacity = max(need, self.meta["capacity"] * 2, 1024)
+        file_path = os.path.join(self.path, VECTOR_FILE)
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(file_path, "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(self.storage_dtype).itemsize)
+        self.vectors = np.memmap(file_path, dtype=self.storage_dtype, mode="r+", shape=(capacity, self.dim))
+        self.meta["capacity"] = capacity
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def insert(self, data):
+        vectors = np.stack([decode_vector(row["vector"], self.vector_dtype) for row in data]).astype(self.storage_dtype)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"vector dim mismatch, expect {self.dim}, got {vectors.shape}")
+        with self.lock:
+            self._reserve(len(data))
+            start = self.meta["count"]
+            slots = list(range(start, start + len(data)))
+            self.vectors[start:start + len(data)] = vectors
+            self.vectors.flush()
+            ids, ops = [], []
+            for slot, row in zip(slots, data):
+                fields = {k: v for k, v in row.items() if k != "vector"}
+                if fields.get("id") is None:
+                    fields["id"] = self.meta["next_id"]
+                    self.meta["next_id"] += 1
+                old_slot = self.id_to_slot.get(fields["id"])
+                if old_slot is not None:
+                    ops.append({"op": "delete", "slots": [old_slot]})
+                    self._remove_slot(old_slot)
+                self.rows[slot] = fields
+                self.id_to_slot[fields["id"]] = slot
+                ids.append(fields["id"])
+                ops.append({"op": "insert", "slot": slot, "row": fields})
+            self._append_log(ops)
+            self.meta["count"] += len(data)
+            self._save_meta()
+            if self.hnsw is not None:
+                self.hnsw.add_items(vectors, slots)
+                self._hnsw_dirty = True
+            elif hnswlib is not None and len(self.rows) >= self.hnsw_threshold:
+                self._build_hnsw()
+        return ids
+
+    def _remove_slot(self, slot):
+        row = self.rows.pop(slot, None)
+        if row:
+            self.id_to_slot.pop(row["id"], None)
+        if self.hnsw is not None:
+            try:
+                self.hnsw.mark_deleted(slot)
+                self._hnsw_dirty = True
+            except RuntimeError:
+                pass
+
+    def delete(self, row_filter):
+        with self.lock:
+            slots = [slot for slot, row in self.rows.items() if row_filter(row)]
+            if not slots:
+                return 0
+            self._append_log([{"op": "delete", "slots": slots}])
+            for slot in slots:
+                self._remove_slot(slot)
+            return len(slots)
+
+    def get(self, id):
+        with self.lock:
+            slot = self.id_to_slot.get(id)
+            if slot is None:
+                return None
+            res = dict(self.rows[slot])
+            res["vector"] = self.vectors[slot].astype(np.float32).tolist()
+            return res
+
+    def _build_hnsw(self):
+        slots = np.fromiter(self.rows.keys(), dtype=np.int64, count=len(self.rows))
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=self.meta["capacity"], M=self.hnsw_m, ef_construction=self.hnsw_ef_construction)
+        index.set_ef(self.hnsw_ef)
+        if len(slots):
+            index.add_items(np.asarray(self.vectors[slots]), slots)
+        self.hnsw = index
+        self._hnsw_dirty = True
+        logger.info(f"local vector collection {self.path} built hnsw index over {len(slots)} rows")
+
+    def _load_hnsw(self):
+        if hnswlib is None or len(self.rows) < self.hnsw_threshold:
+            return
+        hnsw_path = os.path.join(self.path, HNSW_FILE)
+        if os.path.exists(hnsw_path) and self.meta.get("hnsw_count") == self.meta["count"] \
+                and self.meta.get("hnsw_rows") == len(self.rows):
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.load_index(hnsw_path, max_elements=self.meta["capacity"])
+            index.set_ef(self.hnsw_ef)
+            self.hnsw = index
+        else:
+            # 索引文件缺失或落后于数据，从向量矩阵重建
+            self._build_hnsw()
+            self.save()
+
+    def save(self):
+        """把 HNSW 图持久化到磁盘，向量与行数据在写入时已经落盘"""
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            if self.hnsw is not None and self._hnsw_dirty:
+                self.hnsw.save_index(os.path.join(self.path, HNSW_FILE))
+                self.meta["hnsw_count"] = self.meta["count"]
+                self.meta["hnsw_rows"] = len(self.rows)
+                self._save_meta()
+                self._hnsw_dirty = False
+
+    def _brute_force(self, queries, limit, row_filter):
+        if row_filter:
+            slots = [slot for slot, row in self.rows.items() if row_filter(row)]
+        else:
+            slots = list(self.rows.keys())
+        if not slots:
+            return [[] for _ in range(len(queries))]
+        if len(slots) == self.meta["count"]:
+            # 没有删除过数据时直接在映射矩阵上计算，不产生拷贝
+            slots = np.arange(self.meta["count"])
+            matrix = self.vectors[:self.meta["count"]]
+        else:
+            slots = np.sort(np.asarray(slots, dtype=np.int64))
+            matrix = self.vectors[slots]
+        scores = queries @ matrix.T
+        k = min(limit, len(slots))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        res = []
+        for qi in range(len(queries)):
+            order = top[qi][np.argsort(-scores[qi, top[qi]])]
+            res.append([(int(slots[j]), float(scores[qi, j])) for j in order])
+        return res
+
+    def search(self, queries, limit, row_filter=None, ef=None):
+        with self.lock:
+            if not self.rows:
+                return [[] for _ in range(len(queries))]
+            if self.hnsw is not None and row_filter is None:
+                k = min(limit, len(self.rows))
+                if ef:
+                    self.hnsw.set_ef(max(int(ef), k))
+                labels, distances = self.hnsw.knn_query(queries, k=k)
+                if ef:
+                    self.hnsw.set_ef(self.hnsw_ef)
+                # hnswlib 的 ip 距离为 1 - 内积
+                return [[(int(s), float(1 - d)) for s, d in zip(ls, ds)] for ls, ds in zip(labels, distances)]
+            return self._brute_force(queries, limit, row_filter)
+
+
+class LocalVectorDatabase(VectorDatabase):
+    """
+    进程内向量库，适用于单机部署、边缘环境及小规模知识库，无需 Milvus 集群。
+
+    每个集合对应 path 下的一个目录，接口与 MilvusDatabase 的 search/insert/delete 保持一致。
+    """
+
+    def __init__(self):
+        conf = settings.LOCAL_VECTOR
+        self.path = conf.get("path") or get_project_base_directory("data", "vector")
+        self.options = {
+            "hnsw_threshold": int(conf.get("hnsw_threshold", 20000)),
+            "hnsw_m": int(conf.get("hnsw_m", 16)),
+            "hnsw_ef_construction": int(conf.get("hnsw_ef_construction", 200)),
+            "hnsw_ef": int(conf.get("hnsw_ef", 64)),
+        }
+        os.makedirs(self.path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+        if hnswlib is None:
+            logger.warning("hnswlib is not installed, local vector database falls back to brute force search")
+
+    def _collection_path(self, collection_name):
+        return os.path.join(self.path, collection_name)
+
+    def _get_collection(self, collection_name) -> LocalCollection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(collection_name)
+                if collection is None:
+                    path = self._collection_path(collection_name)
+                    if not os.path.exists(os.path.join(path, META_FILE)):
+                        raise LookupError(f"collection {collection_name} not exists")
+                    collection = LocalCollection(path, **self.options)
+                    self._collections[collection_name] = collection
+        return collection
+
+    def dbType(self) -> str:
+        return "local"
+
+    def health(self):
+        return {"type": "local", "path": self.path, "hnsw": hnswlib is not None}
+
+    def createCollection(self, collection_name, knowledgebase_id: str, vector_size, index_params: Optional[dict] = None,
+                         partition_key: Optional[str] = None, vector_dtype: str = "float32"):
+        """只有 HNSW 的 M/efConstruction 对本地库有意义，其余索引类型使用默认配置；本地库不分区"""
+        if self.collectionExist(collection_name, knowledgebase_id):
+            return True
+        try:
+            index_spec = normalize_index_spec(index_params, vector_size)
+            with self._lock:
+                self._collections[collection_name] = LocalCollection(
+                    self._collection_path(collection_name), dim=vector_size, index_spec=index_spec,
+                    vector_dtype=vector_dtype, **self.options)
+            return True
+        except Exception as e:
+            logger.error(f"local create collection failed, error: {e}")
+
+    def deleteCollection(self, collection_name: str, knowledgebase_id: str):
+        try:
+            with self._lock:
+                self._collections.pop(collection_name, None)
+                shutil.rmtree(self._collection_path(collection_name), ignore_errors=True)
+        except Exception as e:
+            logger.error(f"local delete collection failed, error: {e}")
+
+    def collectionExist(self, collection_name: str, knowledgebase_id: str) -> bool:
+        return collection_name in self._collections or \
+            os.path.exists(os.path.join(self._collection_path(collection_name), META_FILE))
+
+    def search(self,
+               collection_name: str,
+               data: Union[List[list], list],
+               limit: int = 10,
+               output_fields: Optional[List[str]] = None,
+               search_params: Optional[dict] = None,
+               filter: str = ""):
+        try:
+            collection = self._get_collection(collection_name)
+            queries = np.stack([decode_vector(q, collection.vector_dtype) for q in data]).reshape(-1, collection.dim)
+            metric_type = (search_params or {}).get("metric_type", "IP")
+            if metric_type != "IP":
+                raise ValueError(f"metric type {metric_type} not supported by local vector database")
+            params = (search_params or {}).get("params") or {}
+            radius, range_filter = params.get("radius"), params.get("range_filter")
+            results = collection.search(queries, limit, compile_filter(filter), ef=params.get("ef"))
+            res = []
+            for hits in results:
+                res.append([])
+                for slot, score in hits:
+                    row = collection.rows.get(slot)
+                    if row is None:
+                        continue
+                    if (radius is not None and score <= radius) or (range_filter is not None and score > range_filter):
+                        continue
+                    entity = {k: row.get(k) for k in output_fields} if output_fields else {}
+                    if output_fields and "vector" in output_fields:
+                        entity["vector"] = np.array(collection.vectors[slot], dtype=np.float32)
+                    res[-1].append(Hit(row["id"], score, entity))
+            return res
+        except Exception as e:
+            logger.error(f"local search failed, error: {e}")
+            raise e
+
+    def get(self, collection_name, id):
+        return self._get_collection(collection_name).get(id)
+
+    def insert(self, collection_name: str, data: Union[List[list], list]):
+        res = []
+        try:
+            ids = self._get_collection(collection_name).insert(data)
+            res = {"insert_count": len(ids), "ids": ids}
+        except Exception as e:
+            logger.warning(f"local insert failed, error: {e}")
+        return res
+
+    def update(self, collection_name, data):
+        """带 id 的数据会覆盖同 id 的旧数据"""
+        return self.insert(collection_name, data)
+
+    def delete(self, collection_name, filter):
+        try:
+            row_filter = compile_filter(filter)
+            if row_filter is None:
+                raise ValueError("filter is required")
+            return self._get_collection(collection_name).delete(row_filter)
+        except Exception as e:
+            logger.warning(f"local delete failed, error: {e}")
+        return 0
+
+    def save(self):
+        for collection in list(self._collections.values()):
+            try:
+                collection.save()
+            except Exception as e:
+                logger.warning(f"local save collection {collection.path} failed, error: {e}")
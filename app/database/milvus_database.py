@@ -1,14 +1,21 @@
 import logging
-from pymilvus import MilvusClient
+from pymilvus import MilvusClient, DataType
 from typing import Dict, List, Optional, Union
 
 from app.database import settings
-from app.database.vector_database import VectorDatabase
+from app.database.vector_database import VectorDatabase, PARTITION_KEY_FIELDS, TEXT_MAX_BYTES, FILE_NAME_MAX_BYTES
+from app.database.index_spec import normalize_index_spec
 
 logger = logging.getLogger('mme.milvus_database')
 
 ATTEMPT_TIME = 2
 
+VECTOR_FIELD_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "bfloat16": DataType.BFLOAT16_VECTOR,
+}
+
 class MilvusDatabase(VectorDatabase):
     def __init__(self):
         self.client = MilvusClient(settings.MILVUS['url'])
@@ -21,17 +28,54 @@ class MilvusDatabase(VectorDatabase):
         health_dict["type"] = "milvus"
         return health_dict
     
-    def createCollection(self, collection_name, knowledgebase_id: str, vector_size):
+    def createCollection(self, collection_name, knowledgebase_id: str, vector_size, index_params: Optional[dict] = None,
+                         partition_key: Optional[str] = None, vector_dtype: str = "float32"):
+        """
+        index_params 为知识库的索引配置（见 app.database.index_spec），为空时使用 HNSW 默认配置；
+        partition_key 为 file_id 时按该字段自动分区，按文件删除和过滤检索只访问对应分区；
+        vector_dtype 为 float16/bfloat16 时使用 FLOAT16_VECTOR/BFLOAT16_VECTOR 字段
+        """
         if self.client.has_collection(collection_name):
             return True
         try:
-            return self.client.create_collection(
+            if partition_key and partition_key not in PARTITION_KEY_FIELDS:
+                raise ValueError(f"partition key {partition_key} not supported")
+            if vector_dtype not in VECTOR_FIELD_TYPES:
+                raise ValueError(f"vector dtype {vector_dtype} not supported")
+            index_spec = normalize_index_spec(index_params, vector_size)
+            # 保留动态字段，兼容写入 schema 以外的字段
+            schema = MilvusClient.create_schema(auto_id=True, enable_dynamic_field=True)
+            schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+            schema.add_field(field_name="vector", datatype=VECTOR_FIELD_TYPES[vector_dtype], dim=int(vector_size))
+            schema.add_field(field_name="kb_id", datatype=DataType.VARCHAR, max_length=64)
+            schema.add_field(field_name="file_id", datatype=DataType.VARCHAR, max_length=64, is_partition_key=partition_key == "file_id")
+            schema.add_field(field_name="hash", datatype=DataType.VARCHAR, max_length=64)
+            schema.add_field(field_name="create_time", datatype=DataType.INT64)
+            schema.add_field(field_name="modality", datatype=DataType.VARCHAR, max_length=16)
+            schema.add_field(field_name="bucket", datatype=DataType.VARCHAR, max_length=128)
+            schema.add_field(field_name="file_name", datatype=DataType.VARCHAR, max_length=FILE_NAME_MAX_BYTES)
+            schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=TEXT_MAX_BYTES)
+
+            milvus_index_params = self.client.prepare_index_params()
+            milvus_index_params.add_index(
+                field_name="vector",
+                index_type=index_spec["index_type"],
+                metric_type=index_spec["metric_type"],  # Inner product distance
+                params=index_spec["params"],
+            )
+            for field_name in ("kb_id", "file_id", "hash", "modality"):
+                milvus_index_params.add_index(field_name=field_name, index_type="INVERTED")
+            milvus_index_params.add_index(field_name="create_time", index_type="STL_SORT")
+
+            kwargs = {"num_partitions": int(settings.MILVUS.get("num_partitions", 64))} if partition_key else {}
+            self.client.create_collection(
                 collection_name=collection_name,
-                dimension=vector_size,
-                auto_id=True,
-                metric_type="IP",  # Inner product distance
+                schema=schema,
+                index_params=milvus_index_params,
                 consistency_level="Bounded",  # Supported values are (`"Strong"`, `"Session"`, `"Bounded"`, `"Eventually"`). See https://milvus.io/docs/consistency.md#Consistency-Level for more details.
+                **kwargs
             )
+            return True
         except Exception as e:
             logger.error(f"milvus create collection failed, error: {e}")
         
@@ -54,13 +98,15 @@ class MilvusDatabase(VectorDatabase):
                data: Union[List[list], list], 
                limit: int = 10, 
                output_fields: Optional[List[str]] = None,
-               search_params: Optional[dict] = None):
+               search_params: Optional[dict] = None,
+               filter: str = ""):
         
         try:
             search_res = self.client.search(
                 collection_name=collection_name,
                 data=data,  
                 limit=limit,  
+                filter=filter,
                 search_params=search_params, 
                 output_fields=output_fields, 
             )
@@ -1,16 +1,38 @@
 from minio import Minio
 import logging
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
 from io import BytesIO
+import certifi
+import urllib3
 from minio.error import S3Error
 
 from app.utils import singleton
 from . import settings
 
+STREAM_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_MEMORY = int(settings.MINIO.get("spool_max_memory", 16 * 1024 * 1024))
+# 连接池大小，Flask 各线程与上传线程池共用同一个池
+POOL_MAXSIZE = int(settings.MINIO.get("pool_maxsize", 32))
+CONNECT_TIMEOUT = float(settings.MINIO.get("connect_timeout", 5))
+READ_TIMEOUT = float(settings.MINIO.get("read_timeout", 60))
+# 分片上传：分片大小（最小 5MiB）与每个对象并行上传的分片数
+MULTIPART_PART_SIZE = max(int(settings.MINIO.get("part_size", 16 * 1024 * 1024)), 5 * 1024 * 1024)
+MULTIPART_PARALLEL = int(settings.MINIO.get("parallel_parts", 4))
+UPLOAD_WORKERS = int(settings.MINIO.get("upload_workers", 16))
+PUT_RETRIES = 3
+
 @singleton
 class MinioDatabase(object):
     def __init__(self):
         self.conn = None
+        self._buckets = set()
+        self._bucket_lock = threading.Lock()
+        self._upload_pool = None
         self.__open__()
 
     def __open__(self):
@@ -21,10 +43,19 @@ class MinioDatabase(object):
             pass
 
         try:
+            http_client = urllib3.PoolManager(
+                maxsize=POOL_MAXSIZE,
+                block=True,
+                timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+                cert_reqs="CERT_REQUIRED",
+                ca_certs=certifi.where(),
+                retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            )
             self.conn = Minio(settings.MINIO["host"],
                               access_key=settings.MINIO["user"],
                               secret_key=settings.MINIO["password"],
-                              secure=settings.MINIO["ssl"])
+                              secure=settings.MINIO["ssl"],
+                              http_client=http_client)
         except Exception:
             logging.exception(
                 "Fail to connect %s " % settings.MINIO["host"])
@@ -35,27 +66,72 @@ class MinioDatabase(object):
 
     def health(self):
         bucket, fnm, binary = "txtxtxtxt1", "txtxtxtxt1", b"_t@@@1"
-        if not self.conn.bucket_exists(bucket):
-            self.conn.make_bucket(bucket)
+        self.ensure_bucket(bucket)
         r = self.conn.put_object(bucket, fnm,
                                  BytesIO(binary),
                                  len(binary)
                                  )
         return r
     
+    def ensure_bucket(self, bucket):
+        """桶不存在时创建；已确认存在的桶缓存在进程内，之后的写入不再访问服务端"""
+        if bucket in self._buckets:
+            return
+        with self._bucket_lock:
+            if bucket in self._buckets:
+                return
+            if not self.conn.bucket_exists(bucket):
+                self.conn.make_bucket(bucket)
+            self._buckets.add(bucket)
+
     def put(self, bucket, fnm, binary):
-        for _ in range(3):
+        return self.put_stream(bucket, fnm, BytesIO(binary), len(binary))
+
+    def put_stream(self, bucket, fnm, stream, length=-1):
+        """
+        参数:
+            bucket/fnm — 目标桶与对象名。
+            stream — 可读的文件对象，大视频、音频可直接传入打开的文件。
+            length — 对象长度，未知时为 -1。
+        返回值: 上传结果，重试后仍失败时返回 None。
+        功能: 超过分片大小的对象按分片并行上传。
+        """
+        start = stream.tell() if hasattr(stream, "seekable") and stream.seekable() else None
+        for i in range(PUT_RETRIES):
             try:
-                if not self.conn.bucket_exists(bucket):
-                    self.conn.make_bucket(bucket)
-                r = self.conn.put_object(bucket, fnm,
-                                         BytesIO(binary),
-                                         len(binary))
-                return r
+                self.ensure_bucket(bucket)
+                return self.conn.put_object(bucket, fnm, stream, length,
+                                            part_size=MULTIPART_PART_SIZE,
+                                            num_parallel_uploads=MULTIPART_PARALLEL)
+            except S3Error as e:
+                logging.exception(f"Fail to put {bucket}/{fnm}:")
+                if e.code == "NoSuchBucket":
+                    self._buckets.discard(bucket)
             except Exception:
                 logging.exception(f"Fail to put {bucket}/{fnm}:")
-                self.__open__()
-                time.sleep(1)
+            if start is None:
+                break
+            stream.seek(start)
+            time.sleep(0.5 * 2 ** i)
+
+    def put_many(self, bucket, objects):
+        """
+        参数:
+            bucket — 目标桶。
+            objects — (对象名, 二进制) 列表。
+        返回值: 与 objects 同序的上传结果列表，失败项为 None。
+        功能: 通过有界线程池并发上传多个对象。
+        """
+        futures = [self.put_async(bucket, fnm, binary) for fnm, binary in objects]
+        return [f.result() for f in futures]
+
+    def put_async(self, bucket, fnm, binary):
+        """提交到共享上传线程池，返回结果的 Future"""
+        if self._upload_pool is None:
+            with self._bucket_lock:
+                if self._upload_pool is None:
+                    self._upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="minio_upload")
+        return self._upload_pool.submit(self.put, bucket, fnm, binary)
 
     def rm(self, bucket, fnm):
         try:
@@ -66,17 +142,71 @@ class MinioDatabase(object):
     def get(self, bucket, filename):
         for _ in range(1):
             try:
-                r = self.conn.get_object(bucket, filename)
-                return r.read()
+                with self.open_stream(bucket, filename) as r:
+                    return r.read()
             except Exception:
                 logging.exception(f"Fail to get {bucket}/{filename}")
                 self.__open__()
                 time.sleep(1)
         return
+
+    @contextmanager
+    def open_stream(self, bucket, filename, offset=0, length=0):
+        """
+        参数:
+            bucket/filename — 对象所在的桶与对象名。
+            offset/length — 范围读取的起始字节与长度，length 为 0 表示读到对象末尾。
+        返回值: 上下文管理器，产出可 read()/stream() 的响应对象。
+        功能: 退出时关闭响应并把连接归还连接池，避免连接泄漏。
+        """
+        r = self.conn.get_object(bucket, filename, offset=offset, length=length)
+        try:
+            yield r
+        finally:
+            r.close()
+            r.release_conn()
+
+    def iter_chunks(self, bucket, filename, chunk_size=STREAM_CHUNK_SIZE, offset=0, length=0):
+        """按块迭代对象内容，内存中同时只保留一个块"""
+        with self.open_stream(bucket, filename, offset=offset, length=length) as r:
+            for chunk in r.stream(chunk_size):
+                yield chunk
+
+    def get_range(self, bucket, filename, offset, length):
+        """读取对象从 offset 开始的 length 个字节"""
+        with self.open_stream(bucket, filename, offset=offset, length=length) as r:
+            return r.read()
+
+    def spool(self, bucket, filename, max_memory=SPOOL_MAX_MEMORY, max_size=None):
+        """
+        参数:
+            bucket/filename — 对象所在的桶与对象名。
+            max_memory — 超过该字节数后转存到临时文件，适合大视频等对象。
+            max_size — 对象大小上限，超出时抛出 ValueError；为空表示不限制。
+        返回值: 指针位于开头的 SpooledTemporaryFile，调用方负责关闭。
+        功能: 流式下载对象，对象内容在内存中只保留一份。
+        """
+        f = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        try:
+            with self.open_stream(bucket, filename) as r:
+                content_length = r.headers.get("Content-Length")
+                if max_size and content_length and int(content_length) > max_size:
+                    raise ValueError(f"{bucket}/{filename} size {content_length} exceeds {max_size} bytes")
+                size = 0
+                for chunk in r.stream(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_size and size > max_size:
+                        raise ValueError(f"{bucket}/{filename} size exceeds {max_size} bytes")
+                    f.write(chunk)
+            f.seek(0)
+            return f
+        except Exception:
+            f.close()
+            raise
     
     def obj_exist(self, bucket, filename):
         try:
-            if not self.conn.bucket_exists(bucket):
+            if bucket not in self._buckets and not self.conn.bucket_exists(bucket):
                 return False
             if self.conn.stat_object(bucket, filename):
                 return True
@@ -89,10 +219,30 @@ class MinioDatabase(object):
             logging.exception(f"obj_exist {bucket}/{filename} got exception")
             return False
         
-    def get_presigned_url(self, bucket, fnm, expires):
+    def stat(self, bucket, filename):
+        """返回对象大小（字节），对象不存在时返回 None"""
+        try:
+            return self.conn.stat_object(bucket, filename).size
+        except S3Error as e:
+            if e.code in ["NoSuchKey", "NoSuchBucket", "ResourceNotFound"]:
+                return None
+            raise
+
+    def get_presigned_url(self, bucket, fnm, expires, method="GET"):
+        """
+        参数:
+            bucket/fnm — 对象所在的桶与对象名。
+            expires — 有效期，秒数或 timedelta。
+            method — GET 用于下载，PUT 用于客户端直传。
+        返回值: 预签名 URL，失败时返回 None。
+        """
+        if not isinstance(expires, timedelta):
+            expires = timedelta(seconds=int(expires))
         for _ in range(10):
             try:
-                return self.conn.get_presigned_url("GET", bucket, fnm, expires)
+                if method == "PUT":
+                    self.ensure_bucket(bucket)
+                return self.conn.get_presigned_url(method, bucket, fnm, expires)
             except Exception:
                 logging.exception(f"Fail to get_presigned {bucket}/{fnm}:")
                 self.__open__()
@@ -25,12 +25,17 @@ class Payload:
     
     def get_message(self):
         return self.__message
+
+    def get_msg_id(self):
+        return self.__msg_id
     
 @singleton
 class RedisDB:
     def __init__(self):
         self.REDIS = None
+        self.REDIS_BINARY = None
         self.config = settings.REDIS
+        self.__known_groups = set()
         self.__open__()
 
     def __open__(self):
@@ -42,6 +47,14 @@ class RedisDB:
                 password=self.config.get("password"),
                 decode_responses=True,
             )
+            # 存取二进制值（如向量）时使用，不做解码
+            self.REDIS_BINARY = redis.StrictRedis(
+                host=self.config["host"],
+                port=int(self.config.get("port", "6379")),
+                db=int(self.config.get("db", 1)),
+                password=self.config.get("password"),
+                decode_responses=False,
+            )
         except Exception:
             logging.warning("Redis can't be connected.")
         return self.REDIS
@@ -80,6 +93,37 @@ class RedisDB:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def get_bytes(self, k):
+        """
+        参数: k — 要获取其值的键名。
+        返回值: 未解码的二进制值；若键不存在、未建立连接或发生异常则返回None。
+        功能: 获取二进制值。
+        """
+        if not self.REDIS_BINARY:
+            return
+        try:
+            return self.REDIS_BINARY.get(k)
+        except Exception as e:
+            logging.warning("RedisDB.get_bytes " + str(k) + " got exception: " + str(e))
+            self.__open__()
+
+    def set_bytes(self, k, v: bytes, exp=3600):
+        """
+        参数:
+            k — 要设置的键名。
+            v — 二进制值。
+            exp — 过期时间（秒），默认为3600秒。
+        返回值: True表示成功设置；否则为False。
+        功能: 存储二进制值，支持设置过期时间。
+        """
+        try:
+            self.REDIS_BINARY.set(k, v, exp)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.set_bytes " + str(k) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def set_obj(self, k, obj, exp=3600):
         """
         参数:
@@ -115,16 +159,16 @@ class RedisDB:
             self.__open__()
         return False
     
-    def sadd(self, key: str, member: str):
+    def sadd(self, key: str, *members: str):
         """
         参数:
             key — 集合的键名。
-            member — 要添加到集合中的元素。
+            members — 要添加到集合中的元素，可以一次添加多个。
         返回值: True表示添加成功；否则为False。
-        功能: 向指定的集合中添加一个新成员。
+        功能: 向指定的集合中添加新成员。
         """
         try:
-            self.REDIS.sadd(key, member)
+            self.REDIS.sadd(key, *members)
             return True
         except Exception as e:
             logging.warning("RedisDB.sadd " + str(key) + " got exception: " + str(e))
@@ -147,6 +191,21 @@ class RedisDB:
             self.__open__()
         return False
 
+    def sismember(self, key: str, member: str):
+        """
+        参数:
+            key — 集合的键名。
+            member — 要检查的元素。
+        返回值: True表示元素在集合中；否则（包括出错）为False。
+        功能: 判断元素是否属于指定集合。
+        """
+        try:
+            return bool(self.REDIS.sismember(key, member))
+        except Exception as e:
+            logging.warning("RedisDB.sismember " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def smembers(self, key: str):
         """
         参数: key — 集合的键名。
@@ -163,6 +222,64 @@ class RedisDB:
             self.__open__()
         return None
 
+    def hget(self, key: str, field: str):
+        """
+        参数:
+            key — 哈希表的键名。
+            field — 字段名。
+        返回值: 字段的值；若不存在或出错则返回None。
+        功能: 获取哈希表中指定字段的值。
+        """
+        try:
+            return self.REDIS.hget(key, field)
+        except Exception as e:
+            logging.warning("RedisDB.hget " + str(key) + " got exception: " + str(e))
+            self.__open__()
+
+    def hset(self, key: str, field: str, value):
+        """
+        参数:
+            key — 哈希表的键名。
+            field — 字段名。
+            value — 字段的值。
+        返回值: True表示设置成功；否则为False。
+        功能: 设置哈希表中指定字段的值。
+        """
+        try:
+            self.REDIS.hset(key, field, value)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.hset " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def hincrby(self, key: str, field: str, amount: int = 1):
+        """
+        参数:
+            key — 哈希表的键名。
+            field — 字段名。
+            amount — 增量，默认为1。
+        返回值: 增加后的值；若出错则返回None。
+        功能: 对哈希表中指定字段做原子自增。
+        """
+        try:
+            return self.REDIS.hincrby(key, field, amount)
+        except Exception as e:
+            logging.warning("RedisDB.hincrby " + str(key) + " got exception: " + str(e))
+            self.__open__()
+
+    def hgetall(self, key: str):
+        """
+        参数: key — 哈希表的键名。
+        返回值: 包含所有字段的字典；若出错则返回None。
+        功能: 获取哈希表的所有字段及其值。
+        """
+        try:
+            return self.REDIS.hgetall(key)
+        except Exception as e:
+            logging.warning("RedisDB.hgetall " + str(key) + " got exception: " + str(e))
+            self.__open__()
+
     def zadd(self, key: str, member: str, score: float):
         """
         参数:
@@ -232,6 +349,41 @@ class RedisDB:
             self.__open__()
         return None
 
+    def zremrangebyscore(self, key: str, min: float, max: float):
+        """
+        参数:
+            key — 有序集合的键名。
+            min — 最小分数边界。
+            max — 最大分数边界。
+        返回值: 被删除的元素数量；若出错则返回0。
+        功能: 删除有序集合中分数落在指定区间内的所有元素。
+        """
+        try:
+            res = self.REDIS.zremrangebyscore(key, min, max)
+            return res
+        except Exception as e:
+            logging.warning(
+                "RedisDB.zremrangebyscore " + str(key) + " got exception: " + str(e)
+            )
+            self.__open__()
+        return 0
+
+    def publish(self, channel: str, message: str):
+        """
+        参数:
+            channel — 频道名称。
+            message — 要发布的消息。
+        返回值: True表示发布成功；否则为False。
+        功能: 向指定频道发布一条消息。
+        """
+        try:
+            self.REDIS.publish(channel, message)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.publish " + str(channel) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def transaction(self, key, value, exp=3600):
         """
         参数:
@@ -286,9 +438,7 @@ class RedisDB:
         功能: 从指定的消费组中读取一条消息，如果相应的消费组不存在则先创建它。
         """
         try:
-            group_info = self.REDIS.xinfo_groups(queue_name)
-            if not any(e["name"] == group_name for e in group_info):
-                self.REDIS.xgroup_create(queue_name, group_name, id="0", mkstream=True)
+            self.create_consumer_group(queue_name, group_name)
             args = {
                 "groupname": group_name,
                 "consumername": consumer_name,
@@ -297,7 +447,7 @@ class RedisDB:
                 "streams": {queue_name: msg_id},
             }
             messages = self.REDIS.xreadgroup(**args)
-            if not messages:
+            if not messages or not messages[0][1]:
                 return None
             stream, element_list = messages[0]
             msg_id, payload = element_list[0]
@@ -315,6 +465,161 @@ class RedisDB:
                 )
         return None
     
+    def create_consumer_group(self, queue_name, group_name) -> bool:
+        """
+        参数:
+            queue_name — 队列名称。
+            group_name — 消费组名称。
+        返回值: True表示消费组已存在或创建成功；否则为False。
+        功能: 创建消费组（队列不存在时一并创建）；每个进程对同一消费组只创建一次，之后读取无需再探测。
+        """
+        if (queue_name, group_name) in self.__known_groups:
+            return True
+        try:
+            self.REDIS.xgroup_create(queue_name, group_name, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                logging.warning(
+                    "RedisDB.create_consumer_group " + str(queue_name) + " got exception: " + str(e)
+                )
+                self.__open__()
+                return False
+        self.__known_groups.add((queue_name, group_name))
+        return True
+
+    def queue_consumer_batch(self, queue_name, group_name, consumer_name, count=16, block=10000, msg_id=">") -> list[Payload]:
+        """
+        参数:
+            queue_name — 消费的目标队列名称。
+            group_name — 消费者所属的消费组名称。
+            consumer_name — 当前消费者的标识符。
+            count — 单次最多读取的消息数。
+            block — 无消息时阻塞等待的毫秒数。
+            msg_id — 起始读取的消息ID，默认为">"；传入"0"等具体ID时读取本消费者未确认的历史消息。
+        返回值: Payload对象列表；没有消息时返回空列表。
+        功能: 通过一次阻塞的XREADGROUP批量读取消息，消费组需事先通过create_consumer_group创建。
+        """
+        try:
+            messages = self.REDIS.xreadgroup(
+                groupname=group_name,
+                consumername=consumer_name,
+                count=count,
+                block=block,
+                streams={queue_name: msg_id},
+            )
+            if not messages:
+                return []
+            _, element_list = messages[0]
+            return [Payload(self.REDIS, queue_name, group_name, mid, payload) for mid, payload in element_list]
+        except Exception as e:
+            if "NOGROUP" in str(e):
+                self.__known_groups.discard((queue_name, group_name))
+                self.create_consumer_group(queue_name, group_name)
+            else:
+                logging.exception(
+                    "RedisDB.queue_consumer_batch " + str(queue_name) + " got exception: " + str(e)
+                )
+                self.__open__()
+        return []
+
+    def queue_ack(self, queue_name, group_name, msg_ids) -> bool:
+        """
+        参数:
+            queue_name — 队列名称。
+            group_name — 消费组名称。
+            msg_ids — 需要确认的消息ID列表。
+        返回值: True表示确认成功；否则为False。
+        功能: 通过管道一次性确认多条消息。
+        """
+        if not msg_ids:
+            return True
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            for i in range(0, len(msg_ids), 1000):
+                pipeline.xack(queue_name, group_name, *msg_ids[i:i + 1000])
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.queue_ack " + str(queue_name) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def queue_autoclaim(self, queue_name, group_name, consumer_name, min_idle_ms, start_id="0-0", count=100):
+        """
+        参数:
+            queue_name — 队列名称。
+            group_name — 消费组名称。
+            consumer_name — 接收消息的消费者标识符。
+            min_idle_ms — 只转移空闲时间超过该毫秒数的消息。
+            start_id — 扫描起始ID，首次为"0-0"，之后传入上次返回的游标。
+            count — 单次最多转移的消息数。
+        返回值: (下一次扫描的游标, Payload列表, 无法解析的(消息ID, 原始字段)列表)；游标为"0-0"表示已扫描完毕。
+        功能: 通过XAUTOCLAIM把组内任意消费者长时间未确认的消息转移给当前消费者。
+        """
+        try:
+            res = self.REDIS.xautoclaim(queue_name, group_name, consumer_name, min_idle_time=min_idle_ms,
+                                        start_id=start_id, count=count)
+            next_id, messages = res[0], res[1]
+            payloads, bad_entries = [], []
+            for msg_id, fields in messages:
+                try:
+                    payloads.append(Payload(self.REDIS, queue_name, group_name, msg_id, fields))
+                except Exception:
+                    bad_entries.append((msg_id, fields or {}))
+            return next_id, payloads, bad_entries
+        except Exception as e:
+            logging.warning("RedisDB.queue_autoclaim " + str(queue_name) + " got exception: " + str(e))
+            self.__open__()
+        return "0-0", [], []
+
+    def queue_delivery_counts(self, queue_name, group_name, msg_ids) -> dict:
+        """
+        参数:
+            queue_name — 队列名称。
+            group_name — 消费组名称。
+            msg_ids — 待查询的消息ID列表。
+        返回值: {消息ID: 已投递次数}。
+        功能: 通过一次XPENDING查询一批待确认消息的投递次数。
+        """
+        if not msg_ids:
+            return {}
+        try:
+            ids = sorted(msg_ids, key=lambda i: tuple(int(x) for x in i.split("-")))
+            pendings = self.REDIS.xpending_range(queue_name, group_name, min=ids[0], max=ids[-1], count=len(ids) * 2)
+            wanted = set(msg_ids)
+            return {p["message_id"]: p["times_delivered"] for p in pendings if p["message_id"] in wanted}
+        except Exception as e:
+            logging.warning("RedisDB.queue_delivery_counts " + str(queue_name) + " got exception: " + str(e))
+            self.__open__()
+        return {}
+
+    def queue_dead_letter(self, queue_name, group_name, dead_queue_name, entries, reason="") -> bool:
+        """
+        参数:
+            queue_name — 原队列名称。
+            group_name — 消费组名称。
+            dead_queue_name — 死信队列名称。
+            entries — (消息ID, 消息字段) 列表。
+            reason — 进入死信队列的原因。
+        返回值: True表示转移成功；否则为False。
+        功能: 在一个事务中把消息写入死信队列并在原消费组中确认，避免毒消息被反复投递。
+        """
+        if not entries:
+            return True
+        try:
+            pipeline = self.REDIS.pipeline(transaction=True)
+            for msg_id, fields in entries:
+                dead = dict(fields)
+                dead.update({"origin_queue": queue_name, "origin_id": msg_id, "reason": reason})
+                pipeline.xadd(dead_queue_name, dead, maxlen=settings.SVR_QUEUE_MAX_LEN * 100, approximate=True)
+                pipeline.xack(queue_name, group_name, msg_id)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.queue_dead_letter " + str(queue_name) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def get_unacked_for(self, consumer_name, queue_name, group_name):
         """
         参数:
@@ -8,6 +8,11 @@ from app.utils import datetime_format, current_timestamp
 class CommonService:
     model = None
 
+    @classmethod
+    def on_change(cls):
+        """数据发生增删改后调用，子类可覆盖以失效相关缓存"""
+        pass
+
     @classmethod
     @DB.connection_context()
     def query(cls, cols=None, reverse=None, order_by=None, **kwargs):
@@ -52,6 +57,7 @@ class CommonService:
         # if "id" not in kwargs:
         #    kwargs["id"] = get_uuid()
         sample_obj = cls.model(**kwargs).save(force_insert=True)
+        cls.on_change()
         return sample_obj
     
     @classmethod
@@ -64,6 +70,7 @@ class CommonService:
         kwargs["update_time"] = current_timestamp()
         kwargs["update_date"] = datetime_format(datetime.now())
         sample_obj = cls.model(**kwargs).save(force_insert=True)
+        cls.on_change()
         return sample_obj
 
     @classmethod
@@ -75,6 +82,7 @@ class CommonService:
                 d["create_date"] = datetime_format(datetime.now())
             for i in range(0, len(data_list), batch_size):
                 cls.model.insert_many(data_list[i:i + batch_size]).execute()
+        cls.on_change()
 
     @classmethod
     @DB.connection_context()
@@ -85,6 +93,7 @@ class CommonService:
                 data["update_date"] = datetime_format(datetime.now())
                 cls.model.update(data).where(
                     cls.model.id == data["id"]).execute()
+        cls.on_change()
 
     @classmethod
     @DB.connection_context()
@@ -92,6 +101,7 @@ class CommonService:
         data["update_time"] = current_timestamp()
         data["update_date"] = datetime_format(datetime.now())
         num = cls.model.update(data).where(cls.model.id == pid).execute()
+        cls.on_change()
         return num
 
     @classmethod
@@ -115,20 +125,25 @@ class CommonService:
     @classmethod
     @DB.connection_context()
     def delete_by_id(cls, pid):
-        return cls.model.delete().where(cls.model.id == pid).execute()
+        num = cls.model.delete().where(cls.model.id == pid).execute()
+        cls.on_change()
+        return num
 
     @classmethod
     @DB.connection_context()
     def filter_delete(cls, filters):
         with DB.atomic():
             num = cls.model.delete().where(*filters).execute()
-            return num
+        cls.on_change()
+        return num
 
     @classmethod
     @DB.connection_context()
     def filter_update(cls, filters, update_data):
         with DB.atomic():
-            return cls.model.update(update_data).where(*filters).execute()
+            num = cls.model.update(update_data).where(*filters).execute()
+        cls.on_change()
+        return num
 
     @staticmethod
     def cut_list(tar_list, n):
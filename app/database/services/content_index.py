@@ -0,0 +1,53 @@
+import xxhash
+
+from app.database.redis_database import REDIS_CONN
+from app.database.settings import KB_CONTENT_INDEX_PREFIX, KB_ENTRY_INDEX_PREFIX, KB_DEDUP_STATS_PREFIX
+
+
+class KbContentIndex:
+    """
+    知识库的内容寻址去重索引，保存在 Redis 中。
+
+    - 图片哈希 -> 对象名：相同图片只写入对象存储一次，之后的数据直接引用已有对象；
+    - 已入库的 (图片, 文本) 哈希集合：完全相同的数据跳过模型编码与向量写入。
+    图片与文本共同编码为一个向量，因此图片相同但文本不同的数据仍需重新编码。
+    """
+
+    def __init__(self, kb_id):
+        self.kb_id = kb_id
+        self._content_key = f"{KB_CONTENT_INDEX_PREFIX}{kb_id}"
+        self._entry_key = f"{KB_ENTRY_INDEX_PREFIX}{kb_id}"
+        self._stats_key = f"{KB_DEDUP_STATS_PREFIX}{kb_id}"
+
+    @staticmethod
+    def image_digest(binary: bytes):
+        return xxhash.xxh3_128_hexdigest(binary)
+
+    @staticmethod
+    def entry_digest(image_digest, text):
+        return xxhash.xxh3_128_hexdigest(f"{image_digest}:{text or ''}".encode("utf-8"))
+
+    @staticmethod
+    def object_name(image_digest, suffix):
+        """对象名由内容哈希决定，并发写入同一图片时结果一致"""
+        return f"{image_digest}.{suffix or 'jpg'}"
+
+    def get_object(self, image_digest):
+        return REDIS_CONN.hget(self._content_key, image_digest)
+
+    def add_object(self, image_digest, file_name):
+        return REDIS_CONN.hset(self._content_key, image_digest, file_name)
+
+    def has_entry(self, entry_digest):
+        return REDIS_CONN.sismember(self._entry_key, entry_digest)
+
+    def add_entry(self, entry_digest):
+        return REDIS_CONN.sadd(self._entry_key, entry_digest)
+
+    def count(self, field, n=1):
+        if n:
+            REDIS_CONN.hincrby(self._stats_key, field, n)
+
+    def stats(self):
+        res = REDIS_CONN.hgetall(self._stats_key) or {}
+        return {k: int(v) for k, v in res.items()}
@@ -1,5 +1,15 @@
+import json
+import logging
+import threading
+import time
+
 from app.database.services.commom_service import CommonService
-from app.database.db_models import File, DB
+from app.database.db_models import File, Task, Knowledgebase, DB
+from app.database import TaskStatus
+from app.database.redis_database import REDIS_CONN
+from app.database.settings import FILE_CANCEL_SET_NAME, FILE_CANCEL_CHANNEL, FILE_VECTOR_IDS_PREFIX
+from app.database.vector_database import build_filter_expr
+from app import settings
 
 class FileService(CommonService):
     model = File
@@ -9,3 +19,159 @@ class FileService(CommonService):
     def get_file_by_id(cls, file_id):
         return None
 
+    @classmethod
+    def update_by_id(cls, pid, data):
+        num = super().update_by_id(pid, data)
+        if "run" in data:
+            publish_file_run(pid, data["run"])
+        return num
+
+    @classmethod
+    def cancel(cls, file_id):
+        return cls.update_by_id(file_id, {"run": TaskStatus.CANCEL.value})
+
+    @classmethod
+    def delete_vectors(cls, collection_name, file_id):
+        """
+        参数:
+            collection_name — 文件所在的向量集合。
+            file_id — 文件id。
+        返回值: 向量库 delete 删除的条数。
+        功能: 优先按记录的向量 id 删除文件的向量（主键查找，不扫描标量字段），没有记录时退回按 file_id 过滤删除。
+        """
+        ids = get_file_vector_ids(file_id)
+        expr = f"id in {ids}" if ids else build_filter_expr(file_ids=[file_id])
+        res = settings.vectorDatabase.delete(collection_name, expr)
+        if ids and not res:
+            # 保留映射，重试时仍可按 id 删除
+            raise Exception(f"fail to delete {len(ids)} vectors of file {file_id} from {collection_name}")
+        REDIS_CONN.REDIS.delete(FILE_VECTOR_IDS_PREFIX + str(file_id))
+        return res
+
+    @classmethod
+    @DB.connection_context()
+    def delete_file(cls, file):
+        """
+        参数: file — 文件记录。
+        返回值: 删除的向量条数。
+        功能: 删除文件的向量、文件 -> 向量 id 映射、任务与文件记录，映射的生命周期与文件记录一致；
+            对象存储中的原始文件由调用方删除。
+        """
+        kb = Knowledgebase.get_or_none(Knowledgebase.id == file.kb_id)
+        deleted = 0
+        if kb:
+            deleted = cls.delete_vectors(kb.collection, file.id)
+        else:
+            REDIS_CONN.REDIS.delete(FILE_VECTOR_IDS_PREFIX + str(file.id))
+        Task.delete().where(Task.file_id == file.id).execute()
+        cls.delete_by_id(file.id)
+        return deleted
+
+    @classmethod
+    @DB.connection_context()
+    def get_canceled_file_ids(cls):
+        """
+        返回值: 已取消且仍有未结束任务（0 <= progress < 1）的文件id集合。
+        功能: 以数据库的 run 字段为准，任务全部结束的文件不再需要取消检查。
+        """
+        files = (
+            cls.model.select(cls.model.id).distinct()
+                .join(Task, on=(Task.file_id == cls.model.id))
+                .where(cls.model.run == TaskStatus.CANCEL.value, Task.progress >= 0, Task.progress < 1)
+        )
+        return {str(f.id) for f in files}
+
+
+def record_file_vector_ids(file_id, ids):
+    """记录文件写入向量库后得到的向量 id，重试产生的 id 一并记录"""
+    if file_id and ids:
+        REDIS_CONN.sadd(FILE_VECTOR_IDS_PREFIX + str(file_id), *[str(i) for i in ids])
+
+
+def get_file_vector_ids(file_id):
+    """读取文件对应的向量 id 列表，没有记录时返回空列表"""
+    return sorted(int(i) for i in (REDIS_CONN.smembers(FILE_VECTOR_IDS_PREFIX + str(file_id)) or []))
+
+
+def publish_file_run(file_id, run):
+    """
+    参数:
+        file_id — 文件id。
+        run — 文件新的运行状态。
+    功能: 文件被取消时写入Redis中的已取消集合并发布通知；重新运行时从集合中移除，执行器据此维护本地的已取消集合。
+    """
+    canceled = run == TaskStatus.CANCEL.value
+    if canceled:
+        REDIS_CONN.sadd(FILE_CANCEL_SET_NAME, str(file_id))
+    else:
+        REDIS_CONN.srem(FILE_CANCEL_SET_NAME, str(file_id))
+    REDIS_CONN.publish(FILE_CANCEL_CHANNEL, json.dumps({"file_id": str(file_id), "canceled": canceled}))
+
+
+class CanceledFiles:
+    """
+    执行器本地的已取消文件集合。
+
+    后台线程订阅取消通知并实时更新集合；每 reload_interval 秒以数据库 run 字段为准重建集合，
+    补上只改了数据库、没有发通知的取消，并从Redis集合中移除任务已全部结束的文件。
+    取消检查只是一次内存查找，不再访问数据库。
+    """
+
+    def __init__(self, reload_interval=60):
+        self.reload_interval = reload_interval
+        self._files = set()
+        self._thread = None
+
+    def start(self):
+        """先同步加载一次，避免启动后第一批任务在集合为空时被当作未取消"""
+        if self._thread is None:
+            try:
+                self.reload()
+            except Exception:
+                logging.exception("CanceledFiles initial reload got exception")
+            self._thread = threading.Thread(target=self._run, name="canceled_files", daemon=True)
+            self._thread.start()
+
+    def is_canceled(self, file_id) -> bool:
+        return str(file_id) in self._files
+
+    def reload(self):
+        """
+        功能: 以数据库为准重建已取消集合，并清理Redis集合中任务已结束的成员；
+            数据库不可用时退回Redis集合。
+        """
+        members = set(REDIS_CONN.smembers(FILE_CANCEL_SET_NAME) or [])
+        try:
+            files = FileService.get_canceled_file_ids()
+        except Exception:
+            logging.exception("CanceledFiles fail to load canceled files from database")
+            self._files = members
+            return
+        for file_id in members - files:
+            REDIS_CONN.srem(FILE_CANCEL_SET_NAME, file_id)
+        self._files = files
+
+    def _apply(self, data):
+        msg = json.loads(data)
+        if msg["canceled"]:
+            self._files.add(msg["file_id"])
+        else:
+            self._files.discard(msg["file_id"])
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = REDIS_CONN.REDIS.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(FILE_CANCEL_CHANNEL)
+                self.reload()
+                reloaded_at = time.time()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._apply(message["data"])
+                    if time.time() - reloaded_at >= self.reload_interval:
+                        self.reload()
+                        reloaded_at = time.time()
+            except Exception:
+                logging.exception("CanceledFiles subscription got exception")
+                time.sleep(1)
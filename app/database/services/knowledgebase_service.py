@@ -1,9 +1,14 @@
 from app.database.services.commom_service import CommonService
 from app.database.db_models import Knowledgebase, DB
+from app.database.services.model_cache import bump_model_cache_version, KB_CACHE_VERSION_KEY
 
 class KnowledgebaseService(CommonService):
     model = Knowledgebase
 
+    @classmethod
+    def on_change(cls):
+        bump_model_cache_version(KB_CACHE_VERSION_KEY)
+
     @classmethod
     @DB.connection_context()
     def get_by_name(cls, kb_name):
@@ -4,13 +4,18 @@ import os
 
 from app.database.db_models import DB, LLM
 from app.database.services.commom_service import CommonService
+from app.database.services.model_cache import bump_model_cache_version, LLM_CACHE_VERSION_KEY
 from app.database import LLMType
-from app.models import EmbeddingModel, TTSModel, ASRModel
+from app.models import EmbeddingModel, RerankModel, TTSModel, ASRModel
 
 
 class LLMService(CommonService):
     model = LLM
 
+    @classmethod
+    def on_change(cls):
+        bump_model_cache_version(LLM_CACHE_VERSION_KEY)
+
     @classmethod
     @DB.connection_context()
     def get_api_key(cls, tenant_id, model_name):
@@ -26,7 +31,7 @@ class LLMService(CommonService):
     @classmethod
     @DB.connection_context()
     def get_model_config(cls, llm_type, llm_name=None):
-        model_config = cls.get_api_key(llm_name)
+        model_config = cls.get_api_key(None, llm_name)
         mdlnm, fid = LLMService.split_model_name_and_factory(llm_name)
         if model_config:
             model_config = model_config.to_dict()
@@ -57,7 +62,13 @@ class LLMService(CommonService):
             else:
                 config = {}
             return EmbeddingModel[model_config["llm_factory"]](
-                api_key=model_config["api_key"], model_name=model_config["llm_name"], base_url=model_config["api_base"], model_path=config["model_path"] if "model_path" in config else None)
+                key=model_config["api_key"], model_name=model_config["llm_name"], base_url=model_config.get("api_base", model_config.get("base_url")), model_path=config["model_path"] if "model_path" in config else None)
+
+        if llm_type == LLMType.RERANK:
+            if model_config["llm_factory"] not in RerankModel:
+                return
+            return RerankModel[model_config["llm_factory"]](
+                key=model_config["api_key"], model_name=model_config["llm_name"], base_url=model_config.get("api_base", model_config.get("base_url")))
 
         if llm_type == LLMType.ASR:
             if model_config["llm_factory"] not in ASRModel:
@@ -101,8 +112,7 @@ class LLMService(CommonService):
         arr = model_name.split("@")
         if len(arr) < 2:
             return model_name, None
-        if len(arr) > 2:
-            return "@".join(arr[0:-1]), arr[-1]
+        return "@".join(arr[0:-1]), arr[-1]
 
 
 class LLMBundle(object):
@@ -116,10 +126,10 @@ class LLMBundle(object):
         model_config = LLMService.get_model_config(llm_type, llm_name)
         self.max_length = model_config.get("max_tokens", 8192)
 
-    def encode(self, file):
-        embeddings, used_tokens = self.mdl.encode(file)
+    def encode(self, texts, images=None):
+        embeddings, used_tokens = self.mdl.encode(texts, images)
         if not LLMService.increase_usage(
-                self.llm_type, used_tokens):
+                self.llm_type, used_tokens, self.llm_name):
             logging.error(
                 "LLMBundle.encode can't update token usage for EMBEDDING used_tokens: {}".format(used_tokens))
         return embeddings, used_tokens
@@ -132,6 +142,14 @@ class LLMBundle(object):
                 "LLMBundle.encode_queries can't update token usage for EMBEDDING used_tokens: {}".format(used_tokens))
         return emd, used_tokens
 
+    def similarity(self, query: str, texts: list, timeout=None):
+        sim, used_tokens = self.mdl.similarity(query, texts, timeout=timeout)
+        if not LLMService.increase_usage(
+                self.llm_type, used_tokens, self.llm_name):
+            logging.error(
+                "LLMBundle.similarity can't update token usage for RERANK used_tokens: {}".format(used_tokens))
+        return sim
+
     def asr(self, audio):
         txt, used_tokens = self.mdl.asr(audio)
         if not LLMService.increase_usage(
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+
+from app import settings
+from app.database.redis_database import REDIS_CONN
+
+# 知识库元数据与模型配置各用一个版本号：知识库变更只失效维度与集合缓存，模型配置变更才重建 LLMBundle
+KB_CACHE_VERSION_KEY = "mme_model_cache_version:kb"
+LLM_CACHE_VERSION_KEY = "mme_model_cache_version:llm"
+
+
+def bump_model_cache_version(key=KB_CACHE_VERSION_KEY):
+    """
+    参数: key — KB_CACHE_VERSION_KEY（知识库变更）或 LLM_CACHE_VERSION_KEY（模型配置变更）。
+    功能: 递增对应的版本号，通知所有进程丢弃相应的本地缓存。
+    """
+    try:
+        REDIS_CONN.REDIS.incr(key)
+    except Exception as e:
+        logging.warning("bump_model_cache_version got exception: " + str(e))
+
+
+class BoundModelCache:
+    """
+    进程内的模型绑定缓存。
+
+    缓存已构造的 LLMBundle、模型输出维度以及已确认存在的向量集合，使每个任务的固定开销
+    只剩一次字典查找。每隔 check_interval 秒读取一次 Redis 中的两个版本号：知识库版本变化时
+    清空维度与集合缓存，模型配置版本变化时才丢弃 LLMBundle，避免新建知识库导致各执行器重新加载模型。
+    """
+
+    def __init__(self, check_interval=5):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._bundles = {}
+        self._dims = {}
+        self._collections = set()
+        self._versions = {KB_CACHE_VERSION_KEY: None, LLM_CACHE_VERSION_KEY: None}
+        self._last_check = 0
+
+    def _check_version(self):
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        for key, invalidate in ((KB_CACHE_VERSION_KEY, self.invalidate_kb), (LLM_CACHE_VERSION_KEY, self.invalidate_llm)):
+            version = REDIS_CONN.get(key)
+            if version != self._versions[key]:
+                if self._versions[key] is not None:
+                    logging.info(f"BoundModelCache {key} changed {self._versions[key]} -> {version}, invalidate")
+                self._versions[key] = version
+                invalidate()
+
+    def invalidate_kb(self):
+        with self._lock:
+            self._dims.clear()
+            self._collections.clear()
+
+    def invalidate_llm(self):
+        with self._lock:
+            self._bundles.clear()
+
+    def invalidate(self):
+        self.invalidate_kb()
+        self.invalidate_llm()
+
+    def get_bundle(self, llm_type, llm_name):
+        from app.database.services.llm_service import LLMBundle
+
+        self._check_version()
+        key = (llm_type, llm_name)
+        bundle = self._bundles.get(key)
+        if bundle is None:
+            with self._lock:
+                bundle = self._bundles.get(key)
+                if bundle is None:
+                    bundle = LLMBundle(llm_type, llm_name=llm_name)
+                    self._bundles[key] = bundle
+        return bundle
+
+    def get_dim(self, llm_name):
+        self._check_version()
+        return self._dims.get(llm_name)
+
+    def set_dim(self, llm_name, vector_size):
+        self._dims[llm_name] = vector_size
+
+    def ensure_collection(self, collection_name, kb_id, vector_size, index_params=None, partition_key=None, vector_dtype="float32"):
+        """集合已确认存在时直接返回，否则按知识库的索引、分区与精度配置创建（或确认）一次后记入缓存"""
+        self._check_version()
+        if collection_name in self._collections:
+            return True
+        res = settings.vectorDatabase.createCollection(collection_name, kb_id, vector_size, index_params, partition_key, vector_dtype)
+        if res is not True and not settings.vectorDatabase.collectionExist(collection_name, kb_id):
+            return False
+        with self._lock:
+            self._collections.add(collection_name)
+        return True
+
+
+BOUND_MODEL_CACHE = BoundModelCache()
@@ -1,6 +1,11 @@
 from datetime import datetime
+import atexit
+import logging
 import random
-import os
+import threading
+import time
+
+from peewee import fn
 
 from app.database.services.commom_service import CommonService
 from app.database.services.file_service import FileService
@@ -11,14 +16,8 @@ from app.database.settings import SVR_QUEUE_NAME
 from app.utils.db_utils import bulk_insert_into_db
 from app.utils import get_uuid
 
-def trim_header_by_lines(text: str, max_length) -> str:
-    len_text = len(text)
-    if len_text <= max_length:
-        return text
-    for i in range(len_text):
-        if text[i] == '\n' and len_text - i <= max_length:
-            return text[i + 1:]
-    return text
+TASK_MAX_RETRY = 3
+PROGRESS_MSG_MAX_LENGTH = 3000
 
 class TaskService(CommonService):
     model = Task
@@ -26,11 +25,23 @@ class TaskService(CommonService):
     @classmethod
     @DB.connection_context()
     def get_task(cls, task_id):
+        tasks = cls.get_task_batch([task_id])
+        return tasks[0] if tasks else None
+
+    @classmethod
+    @DB.connection_context()
+    def get_task_batch(cls, task_ids):
+        """
+        参数: task_ids — 任务id列表。
+        返回值: 可执行的任务字典列表；不存在或已重试3次以上的任务不会返回。
+        功能: 一次查询取出一批任务及其文件、知识库信息，并用一条UPDATE记录接收进度与重试次数。
+        """
+        if not task_ids:
+            return []
         fields = [
             cls.model.id,
             cls.model.file_id,
             cls.model.retry_count,
-            File.id,
             File.kb_id,
             File.name,
             File.size,
@@ -38,37 +49,40 @@ class TaskService(CommonService):
             File.type,
             File.parser_config,
             File.parser_type,
+            File.run,
             Knowledgebase.model,
             Knowledgebase.bucket,
-            Knowledgebase.parser_config,
+            Knowledgebase.collection,
+            Knowledgebase.parser_config.alias("kb_parser_config"),
             cls.model.update_time
         ]
         files = (
             cls.model.select(*fields)
                 .join(File, on=(cls.model.file_id == File.id))
                 .join(Knowledgebase, on=(File.kb_id == Knowledgebase.id))
-                .where(cls.model.id == task_id)
+                .where(cls.model.id.in_(task_ids))
         )
         files = list(files.dicts())
         if not files:
-            return None
-        
-        msg = f"\n{datetime.now().strftime('%H:%M:%S')} Task has been received."
-        prog = random.random() / 10.0
-        if files[0]["retry_count"] >= 3:
-            msg = "\nERROR: Task is abandoned after 3 times attempts."
-            prog = -1
-
-        cls.model.update(
-            progress_msg=cls.model.progress_msg + msg,
-            progress=prog,
-            retry_count=files[0]["retry_count"] + 1,
-        ).where(cls.model.id == files[0]["id"]).execute()
-
-        if files[0]["retry_count"] >= 3:
-            return None
-        
-        return files[0]
+            return []
+
+        tasks = [f for f in files if f["retry_count"] < TASK_MAX_RETRY]
+        abandoned = [f["id"] for f in files if f["retry_count"] >= TASK_MAX_RETRY]
+        if tasks:
+            msg = f"\n{datetime.now().strftime('%H:%M:%S')} Task has been received."
+            cls.model.update(
+                progress_msg=cls.model.progress_msg + msg,
+                progress=random.random() / 10.0,
+                retry_count=cls.model.retry_count + 1,
+            ).where(cls.model.id.in_([t["id"] for t in tasks])).execute()
+        if abandoned:
+            cls.model.update(
+                progress_msg=cls.model.progress_msg + f"\nERROR: Task is abandoned after {TASK_MAX_RETRY} times attempts.",
+                progress=-1,
+                retry_count=cls.model.retry_count + 1,
+            ).where(cls.model.id.in_(abandoned)).execute()
+
+        return tasks
     
     @classmethod
     @DB.connection_context()
@@ -90,33 +104,120 @@ class TaskService(CommonService):
     @DB.connection_context()
     def do_cancel(cls, id):
         task = cls.model.get_by_id(id)
-        _, file = FileService.get_by_id(task.doc_id)
-        return file.run == TaskStatus.CANCEL.value or file.progress < 0
+        _, file = FileService.get_by_id(task.file_id)
+        return file is not None and file.run == TaskStatus.CANCEL.value
 
     @classmethod
     @DB.connection_context()
     def update_progress(cls, id, info):
-        if os.environ.get("MACOS"):
-            if info["progress_msg"]:
-                task = cls.model.get_by_id(id)
-                progress_msg = trim_header_by_lines(task.progress_msg + "\n" + info["progress_msg"], 3000)
-                cls.model.update(progress_msg=progress_msg).where(cls.model.id == id).execute()
-            if "progress" in info:
-                cls.model.update(progress=info["progress"]).where(
-                    cls.model.id == id
-                ).execute()
-            return
-        
-        with DB.lock("update_progress", -1):
-            if info["progress_msg"]:
-                task = cls.model.get_by_id(id)
-                progress_msg = trim_header_by_lines(task.progress_msg + "\n" + info["progress_msg"], 3000)
-                cls.model.update(progress_msg=progress_msg).where(cls.model.id == id).execute()
-            if "progress" in info:
-                cls.model.update(progress=info["progress"]).where(
-                    cls.model.id == id
-                ).execute()
-    
+        """
+        参数:
+            id — 任务id。
+            info — {"progress_msg": 追加的进度消息, "progress": 进度值(可选)}。
+        功能: 用一条不加锁、不先读的UPDATE追加进度消息并更新进度，消息只保留末尾 PROGRESS_MSG_MAX_LENGTH 个字符。
+        """
+        data = {}
+        if info.get("progress_msg"):
+            data[cls.model.progress_msg] = fn.RIGHT(
+                fn.CONCAT(fn.COALESCE(cls.model.progress_msg, ""), "\n" + info["progress_msg"]),
+                PROGRESS_MSG_MAX_LENGTH,
+            )
+        if info.get("progress") is not None:
+            data[cls.model.progress] = info["progress"]
+        if not data:
+            return 0
+        return cls.model.update(data).where(cls.model.id == id).execute()
+
+
+class ProgressBuffer:
+    """
+    进程内的任务进度缓冲区。
+
+    执行器的进度消息先按任务合并在内存中，由后台线程每 interval 秒刷新一次，
+    每个任务每个周期只执行一条UPDATE，不再依赖全局数据库锁。
+    最终进度通过 write 同步落库；刷新失败的条目放回缓冲区，下个周期重试。
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        # 串行化落库，避免正在进行的周期刷新用旧进度覆盖同步写入的最终进度
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def add(self, task_id, info):
+        with self._lock:
+            self._merge(task_id, {"msgs": [info["progress_msg"]] if info.get("progress_msg") else [],
+                                  "progress": info.get("progress")})
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress_buffer", daemon=True)
+                self._thread.start()
+
+    def _merge(self, task_id, entry):
+        """调用方需持有 _lock；把 entry 合并到缓冲区，消息按先后顺序追加"""
+        pending = self._pending.setdefault(task_id, {"msgs": [], "progress": None})
+        pending["msgs"].extend(entry["msgs"])
+        if entry["progress"] is not None:
+            pending["progress"] = entry["progress"]
+
+    def _requeue(self, task_id, entry):
+        """刷新失败的条目放回缓冲区，排在失败后新到达的消息之前"""
+        with self._lock:
+            newer = self._pending.pop(task_id, None)
+            self._pending[task_id] = {"msgs": list(entry["msgs"]), "progress": entry["progress"]}
+            if newer:
+                self._merge(task_id, newer)
+
+    @staticmethod
+    def _update(task_id, entry):
+        TaskService.update_progress(task_id, {
+            "progress_msg": "\n".join(entry["msgs"]),
+            "progress": entry["progress"],
+        })
+
+    def write(self, task_id, info):
+        """
+        参数:
+            task_id — 任务id。
+            info — {"progress_msg": 进度消息, "progress": 进度值(可选)}。
+        功能: 合并该任务尚未刷新的缓冲内容后同步落库，用于最终进度（1.0 或 -1）。
+            落库失败时条目放回缓冲区并抛出异常，调用方据此不确认队列消息。
+        """
+        with self._write_lock:
+            with self._lock:
+                entry = self._pending.pop(task_id, None) or {"msgs": [], "progress": None}
+            if info.get("progress_msg"):
+                entry["msgs"].append(info["progress_msg"])
+            if info.get("progress") is not None:
+                entry["progress"] = info["progress"]
+            try:
+                self._update(task_id, entry)
+            except Exception:
+                self._requeue(task_id, entry)
+                raise
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for task_id, entry in pending.items():
+                try:
+                    self._update(task_id, entry)
+                except Exception:
+                    logging.exception(f"ProgressBuffer fail to flush progress of task {task_id}, will retry")
+                    self._requeue(task_id, entry)
+        return len(pending)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+PROGRESS_BUFFER = ProgressBuffer()
+atexit.register(PROGRESS_BUFFER.flush)
+
 def queue_tasks(file: dict, bucket: str, name: str):
     def new_task():
         return {"id": get_uuid(), "file_id": file["id"], "progress": 0.0}
@@ -132,6 +233,7 @@ def queue_tasks(file: dict, bucket: str, name: str):
     unfinished_task_array = [task for task in parse_task_array if task["progress"] < 1.0]
     for unfinished_task in unfinished_task_array:
         assert REDIS_CONN.queue_product(
-            SVR_QUEUE_NAME, messages=unfinished_task
+            SVR_QUEUE_NAME, message=unfinished_task
         ), "Can't access Redis. Please check the Redis' status."
+    return parse_task_array
     
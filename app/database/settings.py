@@ -3,8 +3,14 @@ from app.utils import get_base_config
 
 MILVUS = get_base_config('milvus', {})
 
+LOCAL_VECTOR = get_base_config('local_vector', {}) or {}
+
 MINIO = get_base_config('minio', {})
 
+LOCAL_STORAGE = get_base_config('local_storage', {}) or {}
+
+BLOB_CACHE = get_base_config('blob_cache', {}) or {}
+
 try:
     REDIS = get_base_config('redis')
 except Exception:
@@ -15,6 +21,19 @@ FILE_MAXIMUM_SIZE = int(os.environ.get("MAX_CONTENT_LENGTH", 128 * 1024 * 1024))
 SVR_QUEUE_NAME = "mme_svr_queue"
 SVR_QUEUE_RETENTION = 60*60
 SVR_QUEUE_MAX_LEN = 1024
+SVR_DEAD_LETTER_QUEUE_NAME = "mme_svr_queue_dead"
+SVR_TASK_BROKER_NAME = "mme__svr_task_broker"
+SVR_EXECUTOR_SET_NAME = "mme_task_executors"
+SVR_HEARTBEAT_INTERVAL = 30
+SVR_HEARTBEAT_RETENTION = 60 * 60
+FILE_CANCEL_SET_NAME = "mme_canceled_files"
+FILE_CANCEL_CHANNEL = "mme_file_cancel"
+# 知识库内容去重索引：图片哈希 -> 对象名、已入库的 (图片, 文本) 哈希集合，以及去重计数
+KB_CONTENT_INDEX_PREFIX = "mme_kb_content:"
+KB_ENTRY_INDEX_PREFIX = "mme_kb_entry:"
+KB_DEDUP_STATS_PREFIX = "mme_kb_dedup:"
+# 文件 -> 向量 id 集合，用于按 id 精确删除文件的向量；随文件记录一起删除
+FILE_VECTOR_IDS_PREFIX = "mme_file_vector_ids:"
 SVR_CONSUMER_NAME = "mme_svr_consumer"
 SVR_CONSUMER_GROUP_NAME = "mme_svr_consumer_group"
 PAGERANK_FLD = "pagerank_fea"
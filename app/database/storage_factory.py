@@ -2,14 +2,18 @@ import os
 from enum import Enum
 
 from app.database.minio_database import MinioDatabase
+from app.database.local_storage import LocalStorage, storage_base_url
+from app.database.blob_cache import BlobCache
 from app.database import settings
 
 class Storage(Enum):
     MINIO = 1
+    LOCAL = 2
 
 class StorageFactory:
     storage_mapping = {
         Storage.MINIO: MinioDatabase,
+        Storage.LOCAL: LocalStorage,
     }
 
     @classmethod
@@ -27,6 +31,8 @@ class UrlFactory:
             else:
                 url = f'http://{settings.MINIO["host"]}'
             return url
+        if storage == Storage.LOCAL:
+            return storage_base_url(settings.LOCAL_STORAGE.get("base_url"))
         
 
     
@@ -34,3 +40,16 @@ STORAGE_IMPL_TYPE = os.getenv('STORAGE_IMPL', 'MINIO')
 STORAGE_IMPL = StorageFactory.create(Storage[STORAGE_IMPL_TYPE.upper()])
 
 STORAGE_URL = UrlFactory.create(Storage[STORAGE_IMPL_TYPE.upper()])
+
+
+def with_blob_cache(storage):
+    """
+    参数: storage — 对象存储实现。
+    返回值: 开启 blob_cache（配置或环境变量 BLOB_CACHE=1）时返回带本地磁盘缓存的包装，否则原样返回。
+    """
+    enabled = os.getenv("BLOB_CACHE", str(settings.BLOB_CACHE.get("enabled", False))).lower() in ("1", "true")
+    if not enabled:
+        return storage
+    return BlobCache(storage,
+                     settings.BLOB_CACHE.get("path") or "/tmp/mme_blob_cache",
+                     int(settings.BLOB_CACHE.get("max_bytes", 10 * 1024 ** 3)))
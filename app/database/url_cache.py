@@ -0,0 +1,68 @@
+import threading
+import time
+
+from cachetools import LRUCache
+
+from app.utils import get_base_config
+from app.database.storage_factory import STORAGE_IMPL, STORAGE_URL
+
+PRESIGNED_URL_CONF = get_base_config('presigned_url', {}) or {}
+
+
+class PresignedUrlCache:
+    """
+    检索结果 URL 的预签名缓存。
+
+    同一对象的预签名 URL 在有效期内复用，剩余有效期不足 refresh_before 秒时重新签名，
+    保证返回给调用方的 URL 至少还能使用 refresh_before 秒。关闭时退回公开桶的直链。
+    """
+
+    def __init__(self, enabled=True, expires=3600, refresh_before=300, max_size=100000):
+        self.enabled = enabled
+        self.expires = expires
+        self.refresh_before = min(refresh_before, expires // 2)
+        self._cache = LRUCache(maxsize=max_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.signs = 0
+
+    def get(self, bucket, file_name):
+        """
+        参数: bucket/file_name — 对象所在的桶与对象名。
+        返回值: 可直接访问对象的 URL，签名失败时返回 None。
+        """
+        if not self.enabled:
+            return f"{STORAGE_URL}/{bucket}/{file_name}"
+        key = (bucket, file_name)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[1] - now > self.refresh_before:
+                self.hits += 1
+                return entry[0]
+        url = STORAGE_IMPL.get_presigned_url(bucket, file_name, self.expires)
+        if url:
+            with self._lock:
+                self._cache[key] = (url, now + self.expires)
+                self.signs += 1
+        return url
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.signs
+            return {
+                "enabled": self.enabled,
+                "size": len(self._cache),
+                "max_size": self._cache.maxsize,
+                "hits": self.hits,
+                "signs": self.signs,
+                "hit_ratio": round(self.hits / total, 4) if total else 0,
+            }
+
+
+PRESIGNED_URL_CACHE = PresignedUrlCache(
+    enabled=bool(PRESIGNED_URL_CONF.get("enabled", True)),
+    expires=int(PRESIGNED_URL_CONF.get("expires", 3600)),
+    refresh_before=int(PRESIGNED_URL_CONF.get("refresh_before", 300)),
+    max_size=int(PRESIGNED_URL_CONF.get("max_size", 100000)),
+)
@@ -1,5 +1,122 @@
+import json
 from abc import ABC, abstractmethod
 
+import ml_dtypes
+import numpy as np
+
+from app.utils import current_timestamp
+
+# 向量集合中数据的模态
+MODALITY_IMAGE = "image"
+MODALITY_IMAGE_TEXT = "image_text"
+
+# 可作为分区键的标量字段：按文件分区。每个知识库独占一个集合，集合内 kb_id 只有一个取值，按 kb_id 分区没有意义
+PARTITION_KEY_FIELDS = ("file_id",)
+
+# 向量存储精度：float16/bfloat16 只占 float32 一半的内存与传输量，内积分数与 float32 在同一量纲
+VECTOR_DTYPES = ("float32", "float16", "bfloat16")
+
+
+def encode_vector(vector, dtype="float32"):
+    """
+    参数: vector — 模型输出的向量（numpy 数组、列表或向量库返回的 bytes）；dtype — 存储精度。
+    返回值: 对应精度的一维 numpy 数组，bfloat16 使用 ml_dtypes.bfloat16，pymilvus 据此识别写入与检索的向量类型。
+    功能: 把向量转换为写入及检索向量库时使用的紧凑格式，全程不经过 Python float 列表。
+    """
+    if isinstance(vector, (bytes, bytearray)) or (isinstance(vector, list) and vector and isinstance(vector[0], (bytes, bytearray))):
+        vector = decode_vector(vector, dtype)
+    array = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if dtype == "float16":
+        return array.astype(np.float16)
+    if dtype == "bfloat16":
+        # ml_dtypes 的转换按最近偶数舍入
+        return array.astype(ml_dtypes.bfloat16)
+    return array
+
+
+def decode_vector(vector, dtype="float32"):
+    """encode_vector 的逆过程，同时兼容向量库返回的列表、numpy 数组或 bytes，返回 float32 数组"""
+    if isinstance(vector, list) and vector and isinstance(vector[0], (bytes, bytearray)):
+        vector = b"".join(vector)
+    if isinstance(vector, (bytes, bytearray)):
+        if dtype == "bfloat16":
+            return np.frombuffer(vector, dtype=ml_dtypes.bfloat16).astype(np.float32)
+        return np.frombuffer(vector, dtype=np.float16 if dtype == "float16" else np.float32).astype(np.float32)
+    return np.asarray(vector, dtype=np.float32).reshape(-1)
+
+
+# Milvus VARCHAR 的 max_length 按 UTF-8 字节计
+TEXT_MAX_BYTES = 65535
+# 与 S3/MinIO 对象名的上限一致
+FILE_NAME_MAX_BYTES = 1024
+
+
+def truncate_utf8(text, max_bytes):
+    """按 UTF-8 字节数截断字符串，不会截断半个字符"""
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", "ignore")
+
+
+def build_filter_expr(file_ids=None, modality=None, start_time=None, end_time=None, tags=None):
+    """
+    参数:
+        file_ids — 文件id列表，命中任意一个即可。
+        modality — 数据模态。
+        start_time/end_time — 写入时间范围（毫秒时间戳，闭区间）。
+        tags — 标签列表，命中任意一个即可。
+    返回值: Milvus 布尔表达式，没有任何条件时返回空字符串。
+    功能: 把结构化过滤条件转换为下推到向量库的过滤表达式，字符串值经 JSON 转义。
+    """
+    conditions = []
+    if file_ids:
+        conditions.append(f"file_id in {json.dumps([str(f) for f in file_ids], ensure_ascii=False)}")
+    if modality:
+        conditions.append(f"modality == {json.dumps(str(modality), ensure_ascii=False)}")
+    if start_time is not None:
+        conditions.append(f"create_time >= {int(start_time)}")
+    if end_time is not None:
+        conditions.append(f"create_time <= {int(end_time)}")
+    if tags:
+        conditions.append(f"json_contains_any(tags, {json.dumps([str(t) for t in tags], ensure_ascii=False)})")
+    return " and ".join(conditions)
+
+
+def build_vector_row(vector, bucket, file_name, text="", kb_id="", file_id="", content_hash="", modality=None, tags=None,
+                     vector_dtype="float32"):
+    """
+    参数:
+        vector — 向量。
+        bucket/file_name — 原始数据在对象存储中的位置。
+        text — 与图片一起编码的文本。
+        kb_id/file_id — 所属知识库与文件，批量与单条插入没有文件记录时为空。
+        content_hash — 图片内容哈希。
+        modality — 数据模态，为空时根据是否有文本推断。
+        tags — 标签列表，作为动态字段保存，可在检索时过滤。
+        vector_dtype — 向量集合的存储精度。
+    返回值: 写入向量集合的一行数据，包含集合 schema 中的全部标量字段。
+        文本按 UTF-8 字节截断；对象名超过 FILE_NAME_MAX_BYTES 字节时抛出 ValueError，截断会使其指向错误的对象。
+    """
+    text = truncate_utf8(text or "", TEXT_MAX_BYTES)
+    if len(file_name.encode("utf-8")) > FILE_NAME_MAX_BYTES:
+        raise ValueError(f"file name exceeds {FILE_NAME_MAX_BYTES} bytes")
+    row = {
+        "vector": encode_vector(vector, vector_dtype),
+        "bucket": bucket,
+        "file_name": file_name,
+        "text": text,
+        "kb_id": str(kb_id or ""),
+        "file_id": str(file_id or ""),
+        "hash": content_hash or "",
+        "create_time": current_timestamp(),
+        "modality": modality or (MODALITY_IMAGE_TEXT if text else MODALITY_IMAGE),
+    }
+    if tags:
+        row["tags"] = [str(t) for t in tags]
+    return row
+
+
 class VectorDatabase(ABC):
     """
     向量数据库操作
@@ -20,9 +137,11 @@ class VectorDatabase(ABC):
         raise NotImplementedError("Not implemented")
     
     @abstractmethod
-    def createCollection(self, collectionName: str, knowledgebaseId: str, vectorSize: int):
+    def createCollection(self, collectionName: str, knowledgebaseId: str, vectorSize: int, indexParams: dict = None, partitionKey: str = None,
+                         vectorDtype: str = "float32"):
         """
-        Create a collection with given name
+        Create a collection with given name, indexParams is the index spec of the knowledgebase,
+        partitionKey is one of PARTITION_KEY_FIELDS or None, vectorDtype is one of VECTOR_DTYPES
         """
         raise NotImplementedError("Not implemented")
 
@@ -44,9 +163,10 @@ class VectorDatabase(ABC):
     Table operations
     """
     @abstractmethod
-    def search(self, collection_name: str, data: list, limit: int, search_params, output_fields) -> list:
+    def search(self, collection_name: str, data: list, limit: int, search_params, output_fields, filter: str = "") -> list:
         """
-        Search for similar vectors in the specified table.
+        Search for similar vectors in the specified table, filter is a boolean expression
+        pushed down to the engine, search_params may carry radius/range_filter for range search.
         """
         raise NotImplementedError("Not implemented")
     
@@ -0,0 +1,210 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app import settings
+from app.utils import get_base_config
+
+WRITER_CONF = get_base_config('vector_writer', {}) or {}
+
+
+class VectorWriteError(Exception):
+    pass
+
+
+class _WriteRequest:
+    def __init__(self, rows, immediate=False):
+        self.rows = rows
+        self.immediate = immediate
+        self.future = Future()
+        self.enqueued_at = time.time()
+
+
+class BufferedVectorWriter:
+    """
+    带缓冲的向量写入器。
+
+    按集合累积待写入的数据，达到 max_rows 条或最早一条等待超过 max_wait 秒时批量写入；
+    写入失败按指数退避重试 max_retries 次，仍失败时逐个请求单独写入一次，只让出错的请求失败。
+    每次 write() 的数据总在同一批中写入，返回的 Future 在成功时给出与 rows 同序的 id 列表，
+    最终失败时抛出 VectorWriteError。未完成的数据超过 max_pending_rows 条时 write() 阻塞，
+    向量库变慢时把背压传回调用方。
+    """
+
+    def __init__(self, max_rows=512, max_wait=1.0, max_retries=3, backoff=0.5, workers=2, max_pending_rows=4096):
+        self.max_rows = max_rows
+        self.max_pending_rows = max(max_pending_rows, max_rows)
+        self._pending_rows = 0
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.workers = workers
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._pool = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vector_writer")
+            self._thread = threading.Thread(target=self._run, name="vector_writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def write(self, collection_name, rows, immediate=False) -> Future:
+        """
+        参数:
+            collection_name — 向量集合名；rows — 待写入的数据列表。
+            immediate — 为 True 时不等待攒批，立即写出该集合中缓冲的数据，适合交互式的单条写入。
+        返回值: Future，结果为写入后的 id 列表。
+        """
+        self.start()
+        req = _WriteRequest(rows, immediate)
+        if not rows:
+            req.future.set_result([])
+            return req.future
+        with self._cond:
+            # 未完成的数据过多时阻塞，单次写入超过上限时只在没有积压时放行
+            while self._pending_rows and self._pending_rows + len(rows) > self.max_pending_rows:
+                self._cond.wait()
+            self._pending_rows += len(rows)
+            self._pending.setdefault(collection_name, deque()).append(req)
+            if immediate or sum(len(r.rows) for r in self._pending[collection_name]) >= self.max_rows:
+                self._cond.notify_all()
+        return req.future
+
+    def _take_ready(self, force=False):
+        """取出所有已满、已超时或要求立即写出的批次，每批不拆分单次 write() 的数据"""
+        now = time.time()
+        batches = []
+        for collection_name, requests in self._pending.items():
+            while requests:
+                size = sum(len(r.rows) for r in requests)
+                ready = force or size >= self.max_rows or now - requests[0].enqueued_at >= self.max_wait \
+                    or any(r.immediate for r in requests)
+                if not ready:
+                    break
+                batch, count = [], 0
+                while requests and (not batch or count + len(requests[0].rows) <= self.max_rows):
+                    req = requests.popleft()
+                    batch.append(req)
+                    count += len(req.rows)
+                batches.append((collection_name, batch))
+        return batches
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                self._cond.wait(timeout=min(self.max_wait, 0.1))
+                batches = self._take_ready()
+            for collection_name, batch in batches:
+                self._pool.submit(self._flush, collection_name, batch)
+
+    def _insert(self, collection_name, rows):
+        res = settings.vectorDatabase.insert(collection_name=collection_name, data=rows)
+        ids = list(res.get("ids") or []) if isinstance(res, dict) else list(getattr(res, "primary_keys", []) or [])
+        if not res or len(ids) != len(rows):
+            raise VectorWriteError(f"insert {len(rows)} rows into {collection_name} returned {len(ids)} ids")
+        return ids
+
+    def _done(self, req, ids=None, exc=None):
+        with self._cond:
+            self._pending_rows -= len(req.rows)
+            self._cond.notify_all()
+        with self._stats_lock:
+            if exc is None:
+                self.written += len(req.rows)
+            else:
+                self.failed += len(req.rows)
+        if exc is None:
+            req.future.set_result(ids)
+        else:
+            req.future.set_exception(exc)
+
+    def _flush(self, collection_name, batch):
+        rows = [row for req in batch for row in req.rows]
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.5))
+            try:
+                ids = self._insert(collection_name, rows)
+                break
+            except Exception as e:
+                error = e
+                logging.warning(f"BufferedVectorWriter insert into {collection_name} attempt {attempt + 1} failed: {e}")
+        else:
+            if len(batch) == 1:
+                self._done(batch[0], exc=VectorWriteError(
+                    f"insert into {collection_name} failed after {self.max_retries + 1} attempts: {error}"))
+                return
+            # 整批失败时逐个请求单独写入，一条坏数据不会拖累同批的其它任务
+            for req in batch:
+                try:
+                    ids = self._insert(collection_name, req.rows)
+                    with self._stats_lock:
+                        self.batches += 1
+                    self._done(req, ids=ids)
+                except Exception as e:
+                    self._done(req, exc=VectorWriteError(
+                        f"insert into {collection_name} failed after {self.max_retries + 2} attempts: {e}"))
+            return
+
+        with self._stats_lock:
+            self.batches += 1
+        offset = 0
+        for req in batch:
+            self._done(req, ids=ids[offset:offset + len(req.rows)])
+            offset += len(req.rows)
+
+    def flush(self):
+        """立即写出所有缓冲的数据并等待完成"""
+        with self._cond:
+            batches = self._take_ready(force=True)
+        for collection_name, batch in batches:
+            self._flush(collection_name, batch)
+
+    def close(self):
+        self._stop_event.set()
+        self.flush()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._cond:
+            pending = sum(len(r.rows) for requests in self._pending.values() for r in requests)
+            in_flight = self._pending_rows - pending
+        with self._stats_lock:
+            return {
+                "pending": pending,
+                "in_flight": in_flight,
+                "written": self.written,
+                "failed": self.failed,
+                "retries": self.retries,
+                "batches": self.batches,
+                "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0,
+            }
+
+
+VECTOR_WRITER = BufferedVectorWriter(
+    max_rows=int(WRITER_CONF.get("max_rows", 512)),
+    max_wait=float(WRITER_CONF.get("max_wait_ms", 1000)) / 1000,
+    max_retries=int(WRITER_CONF.get("max_retries", 3)),
+    backoff=float(WRITER_CONF.get("backoff_ms", 500)) / 1000,
+    workers=int(WRITER_CONF.get("workers", 2)),
+    max_pending_rows=int(WRITER_CONF.get("max_pending_rows", 4096)),
+)
@@ -2,6 +2,7 @@ from .embedding_model import (
     BaaiVlEmbedding,
     QwenMultiModelEmbed
 )
+from .rerank_model import QwenRerank
 
 EmbeddingModelFactory = {
     "BAAI": BaaiVlEmbedding,
@@ -13,6 +14,10 @@ EmbeddingModel = {
     "Tongyi-Qianwen": QwenMultiModelEmbed,
 }
 
+RerankModel = {
+    "Tongyi-Qianwen": QwenRerank,
+}
+
 TTSModel = {}
 
 ASRModel = {}
\ No newline at end of file
@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app.utils import get_base_config
+from app.utils.model_utils import num_tokens_from_string
+
+BATCHER_CONF = get_base_config('embedding_batcher', {}) or {}
+
+
+class BatchStats:
+    def __init__(self, max_batch_size):
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.infer_total = 0.0
+
+    def record(self, batch_size, waits, infer_time, failed=False):
+        self.requests += batch_size
+        self.batches += 1
+        if failed:
+            self.failed_batches += 1
+        self.wait_total += sum(waits)
+        self.wait_max = max([self.wait_max] + waits)
+        self.infer_total += infer_time
+
+    def to_dict(self):
+        avg_batch = self.requests / self.batches if self.batches else 0
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(avg_batch, 2),
+            "fill_rate": round(avg_batch / self.max_batch_size, 3) if self.max_batch_size else 0,
+            "avg_queue_wait_ms": round(self.wait_total / self.requests * 1000, 3) if self.requests else 0,
+            "max_queue_wait_ms": round(self.wait_max * 1000, 3),
+            "avg_infer_ms": round(self.infer_total / self.batches * 1000, 3) if self.batches else 0,
+        }
+
+
+class _EncodeRequest:
+    __slots__ = ("text", "image", "future", "enqueued_at")
+
+    def __init__(self, text, image):
+        self.text = text
+        self.image = image
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    嵌入模型动态微批处理器。
+
+    并发请求按模态（纯文本、纯图片、图文混合）分别排队，每个队列由一个后台线程
+    攒够 max_batch_size 条或等待 max_wait_ms 后，调用模型的 encode_batch 做一次前向，
+    再把向量分发回各个等待的调用方。图片在调用方线程解码校验，整批失败时逐条重试，
+    一个请求的坏数据不会让同批的其他请求失败。
+    """
+    MODALITIES = ("text", "image", "mixed")
+
+    def __init__(self, model, max_batch_size=None, max_wait_ms=None, timeout=None):
+        self.model = model
+        self.max_batch_size = int(max_batch_size or BATCHER_CONF.get("max_batch_size", 8))
+        self.max_wait = float(max_wait_ms if max_wait_ms is not None else BATCHER_CONF.get("max_wait_ms", 10)) / 1000
+        # encode_queries 等待结果的默认超时（秒）
+        self.timeout = float(timeout or BATCHER_CONF.get("timeout", 60))
+        self._queues = {m: queue.Queue() for m in self.MODALITIES}
+        self._stats = {m: BatchStats(self.max_batch_size) for m in self.MODALITIES}
+        self._stats_lock = threading.Lock()
+        # 串行化 submit 的关闭检查与入队、close 的置位与清空队列，关闭后不会再有请求无人处理
+        self._submit_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._workers = []
+        for m in self.MODALITIES:
+            worker = threading.Thread(target=self._run, args=(m,), name=f"embedding_batcher_{m}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    @staticmethod
+    def modality_of(text, image):
+        if text and image:
+            return "mixed"
+        if image:
+            return "image"
+        if text:
+            return "text"
+        raise ValueError("text or image is required")
+
+    def submit(self, text=None, image=None) -> Future:
+        """图片无法解码时在调用方线程直接抛出异常，不进入队列"""
+        modality = self.modality_of(text, image)
+        if image and hasattr(self.model, "prepare_image"):
+            image = self.model.prepare_image(image)
+        req = _EncodeRequest(text, image)
+        with self._submit_lock:
+            if self._stop_event.is_set():
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._queues[modality].put(req)
+        return req.future
+
+    def encode_queries(self, text=None, image=None, timeout=None):
+        """与 BaaiVlEmbedding.encode_queries 返回值一致：(float32 numpy 向量, token 数)；timeout 为空时使用 self.timeout"""
+        vector = self.submit(text, image).result(timeout or self.timeout)
+        return vector, num_tokens_from_string(text)
+
+    def _collect(self, q):
+        try:
+            first = q.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, modality):
+        q = self._queues[modality]
+        while not self._stop_event.is_set():
+            batch = self._collect(q)
+            if batch:
+                self._process(modality, batch)
+        self._drain(q)
+
+    @staticmethod
+    def _drain(q):
+        """关闭时让剩余的等待方尽快失败，而不是一直阻塞"""
+        while True:
+            try:
+                q.get_nowait().future.set_exception(RuntimeError("EmbeddingBatcher is closed"))
+            except queue.Empty:
+                break
+
+    def _process(self, modality, batch):
+        start_ts = time.perf_counter()
+        waits = [start_ts - r.enqueued_at for r in batch]
+        texts = [r.text for r in batch] if modality != "image" else None
+        images = [r.image for r in batch] if modality != "text" else None
+        failed = False
+        try:
+            vectors = self.model.encode_batch(texts, images)
+            for r, v in zip(batch, vectors):
+                r.future.set_result(v)
+        except Exception as e:
+            failed = True
+            logging.exception(f"EmbeddingBatcher {modality} batch of {len(batch)} failed")
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+            else:
+                self._process_one_by_one(batch)
+        with self._stats_lock:
+            self._stats[modality].record(len(batch), waits, time.perf_counter() - start_ts, failed)
+
+    def _process_one_by_one(self, batch):
+        """整批失败后逐条重新编码，只有出错的请求收到异常"""
+        for r in batch:
+            if r.future.done():
+                continue
+            try:
+                r.future.set_result(self.model.encode_batch([r.text] if r.text else None, [r.image] if r.image else None)[0])
+            except Exception as e:
+                r.future.set_exception(e)
+
+    def stats(self):
+        with self._stats_lock:
+            res = {m: s.to_dict() for m, s in self._stats.items()}
+        for m, q in self._queues.items():
+            res[m]["queue_size"] = q.qsize()
+        return res
+
+    def close(self):
+        with self._submit_lock:
+            self._stop_event.set()
+            for q in self._queues.values():
+                self._drain(q)
@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+import xxhash
+from cachetools import TTLCache
+
+from app.utils import get_base_config
+from app.database.redis_database import REDIS_CONN
+
+EMBEDDING_CACHE_CONF = get_base_config('embedding_cache', {}) or {}
+
+
+class EmbeddingCache:
+    """
+    查询向量的两级缓存。
+
+    第一级为进程内带 TTL 的 LRU，第二级为可选的 Redis 共享缓存。键由模型名、模型版本
+    以及文本和图片字节的 xxhash 组成；向量以 float32/float16 字节紧凑存储。
+    """
+
+    KEY_PREFIX = "mme_qemb:"
+
+    def __init__(self, enabled=True, max_size=10000, ttl=3600, use_redis=False, redis_ttl=86400,
+                 dtype="float16", version="v1"):
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+        self.dtype = np.dtype(dtype)
+        self.version = version
+        self._local = TTLCache(maxsize=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def make_key(self, model_name, text=None, image=None):
+        h = xxhash.xxh3_128()
+        if text:
+            h.update(b"t:")
+            h.update(text.encode("utf-8"))
+        if image:
+            h.update(b"i:")
+            h.update(image)
+        return f"{self.KEY_PREFIX}{model_name}:{self.version}:{self.dtype.name}:{h.hexdigest()}"
+
+    def get(self, key):
+        with self._lock:
+            vec = self._local.get(key)
+            if vec is not None:
+                self.local_hits += 1
+                return vec
+        if self.use_redis:
+            raw = REDIS_CONN.get_bytes(key)
+            if raw:
+                vec = np.frombuffer(raw, dtype=self.dtype)
+                with self._lock:
+                    self._local[key] = vec
+                    self.redis_hits += 1
+                return vec
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, vector):
+        """
+        返回值: 按缓存精度存储的向量，调用方应使用它而不是模型原始输出，保证命中与未命中时分数一致。
+        功能: 写入两级缓存；空向量（模型调用失败时的返回值）不写入缓存，抛出 ValueError。
+        """
+        vec = np.asarray(vector, dtype=self.dtype)
+        if vec.size == 0:
+            raise ValueError(f"refuse to cache empty embedding for {key}")
+        with self._lock:
+            self._local[key] = vec
+        if self.use_redis:
+            REDIS_CONN.set_bytes(key, vec.tobytes(), self.redis_ttl)
+        return vec
+
+    def get_or_compute(self, model_name, text, image, compute):
+        """
+        参数:
+            model_name — 模型标识，不同模型的向量互不复用。
+            text/image — 查询文本与图片字节。
+            compute — 未命中时调用，返回向量。
+        返回值: float32 numpy 向量；未命中时同样返回按缓存精度舍入后的向量，与之后命中时完全一致。
+        功能: 先查进程内缓存，再查 Redis，均未命中时计算并回填两级缓存。compute 返回空向量时抛出
+            ValueError，不缓存失败结果。
+        """
+        if not self.enabled:
+            return self._compute(model_name, compute)
+        key = self.make_key(model_name, text, image)
+        vec = self.get(key)
+        if vec is None:
+            vec = self.put(key, self._compute(model_name, compute))
+        return vec.astype(np.float32)
+
+    @staticmethod
+    def _compute(model_name, compute):
+        vec = np.asarray(compute(), dtype=np.float32)
+        if vec.size == 0:
+            raise ValueError(f"model {model_name} returned an empty embedding")
+        return vec
+
+    def stats(self):
+        with self._lock:
+            total = self.local_hits + self.redis_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._local),
+                "max_size": self._local.maxsize,
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.local_hits + self.redis_hits) / total, 4) if total else 0,
+            }
+
+
+EMBEDDING_CACHE = EmbeddingCache(
+    enabled=bool(EMBEDDING_CACHE_CONF.get("enabled", True)),
+    max_size=int(EMBEDDING_CACHE_CONF.get("max_size", 10000)),
+    ttl=int(EMBEDDING_CACHE_CONF.get("ttl", 3600)),
+    use_redis=bool(EMBEDDING_CACHE_CONF.get("redis", False)),
+    redis_ttl=int(EMBEDDING_CACHE_CONF.get("redis_ttl", 86400)),
+    dtype=EMBEDDING_CACHE_CONF.get("dtype", "float16"),
+    version=str(EMBEDDING_CACHE_CONF.get("version", "v1")),
+)
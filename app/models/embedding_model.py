@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-import threading
 import re
 import numpy as np
 from http import HTTPStatus
@@ -33,27 +32,42 @@ class Base(ABC):
         return 0
     
 class BaaiVlEmbedding(Base):
-    _model = None
-    _model_name = ""
-    _model_lock = threading.Lock()
-    def __init__(self, model_path):
-        with BaaiVlEmbedding._model_lock:
-            from transformers import AutoModel
-
-            BaaiVlEmbedding._model = AutoModel.from_pretrained(model_path, trust_remote_code=True) # You must set trust_remote_code=True
+    """
+    BGE-VL 本地多模态嵌入模型。
+
+    每个实例持有自己的模型权重，加载开销较大，请通过 ``app.models.registry.MODEL_REGISTRY``
+    获取共享实例，而不是在每个请求中直接构造。
+    """
+    def __init__(self, model_path, model_name=None, device=None, dtype=None, **kwargs):
+        import torch
+        from transformers import AutoModel
+
+        self._model = AutoModel.from_pretrained(model_path, trust_remote_code=True) # You must set trust_remote_code=True
+        if model_name:
+            self._model_name = model_name
+        else:
             match = re.search(r"/([a-zA-Z0-9_-]+)$", model_path)
-            if match:
-                result = match.group(1) 
-                BaaiVlEmbedding._model_name = result
-            BaaiVlEmbedding._model.set_processor(model_path)
-            BaaiVlEmbedding._model.eval()
-        self._model_name = BaaiVlEmbedding._model_name
-        self._model = BaaiVlEmbedding._model
+            self._model_name = match.group(1) if match else ""
+        self._model.set_processor(model_path)
+        if dtype:
+            self._model = self._model.to(getattr(torch, dtype))
+        if device:
+            self._model = self._model.to(device)
+        self._model.eval()
+
+    def memory_usage(self) -> int:
+        """返回模型参数与缓冲区占用的字节数"""
+        size = 0
+        for t in list(self._model.parameters()) + list(self._model.buffers()):
+            size += t.numel() * t.element_size()
+        return size
 
     def encode(self, texts: list, images: list):
         if texts is None and images is None:
             return np.array([]), 0
         
+        texts = texts or []
+        images = images or []
         if len(texts) != len(images) and len(texts) != 0 and len(images) != 0:
             raise Exception("The number of texts and images must be equal!")
 
@@ -64,25 +78,53 @@ class BaaiVlEmbedding(Base):
         import torch
         with torch.no_grad():
             result = self._model.encode(
-                images = images, 
-                text = texts
+                images = images or None, 
+                text = texts or None
             )
 
         return result.numpy(), token_count
     
+    @staticmethod
+    def _to_image_fileobj(image):
+        # 将二进制数据包装成 BytesIO，并使用 PIL 打开图像；已经是 prepare_image 的结果时回到开头直接使用
+        if hasattr(image, "read"):
+            image.seek(0)
+            return image
+        try:
+            pil_image = Image.open(BytesIO(image))
+            return pil_to_fileobj(pil_image)
+        except Exception as e:
+            raise ValueError(f"Invalid image: {e}")
+
+    @classmethod
+    def prepare_image(cls, image):
+        """
+        参数: image — 图片二进制。
+        返回值: 解码后重新编码为 JPEG 的文件对象，可直接传给 encode_batch。
+        功能: 在编码前单独解码校验图片，无法解码时抛出 ValueError，调用方可只让这一条数据失败。
+        """
+        return cls._to_image_fileobj(image)
+
+    def encode_batch(self, texts: list | None, images: list | None):
+        """
+        参数:
+            texts — 文本列表，可为 None。
+            images — 图片二进制列表，可为 None；与 texts 同时给出时长度必须相同，按位置组合编码。
+        返回值: 形状为 (batch, dim) 的 numpy 数组。
+        功能: 在一次 torch.no_grad() 前向中完成整批编码。
+        """
+        import torch
+
+        if texts and images and len(texts) != len(images):
+            raise Exception("The number of texts and images must be equal!")
+        image_fileobjs = [self._to_image_fileobj(image) for image in images] if images else None
+        with torch.no_grad():
+            result = self._model.encode(text=texts or None, images=image_fileobjs)
+        return result.numpy()
+
     def encode_queries(self, text, image):
-        if image:
-            # 将二进制数据包装成 BytesIO
-            img_stream = BytesIO(image)
-            
-            # 使用 PIL 打开图像
-            try:
-                pil_image = Image.open(img_stream)
-                img_fileobj = pil_to_fileobj(pil_image)
-            except Exception as e:
-                raise Exception(f"Invalid image: {e}")
         token_count = num_tokens_from_string(text)
-        return self._model.encode(text = [text] if text else None, images = [img_fileobj] if image else None).tolist()[0], token_count
+        return self.encode_batch([text] if text else None, [image] if image else None)[0], token_count
     
 
 class QwenMultiModelEmbed(Base):
@@ -90,15 +132,27 @@ class QwenMultiModelEmbed(Base):
         self.model_name = model_name
         self.key = key
 
-    def encode(self, texts, images, videos):
+    def encode(self, texts, images=None, videos=None):
         import dashscope
 
+        n = max(len(texts or []), len(images or []), len(videos or []))
+        texts = texts or [None] * n
+        images = images or [None] * n
+        videos = videos or [None] * n
+
         # 构建输入数据
         inputs = []
         for text, image, video in zip(texts, images, videos):
             input = {}
             if text is not None:
                 input['text'] = text
+            if isinstance(image, BytesIO):
+                image = image.getvalue()
+            elif hasattr(image, "read"):
+                image.seek(0)
+                image = image.read()
+            if isinstance(image, bytes):
+                image = f"data:image/jpeg;base64,{base64.b64encode(image).decode('utf-8')}"
             if image is not None:
                 input['image'] = image
             if video is not None:
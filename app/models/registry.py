@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils import get_base_config
+from . import EmbeddingModelFactory
+from .batcher import EmbeddingBatcher
+from .settings import BAAI_VL_MODEL_PATH
+
+REGISTRY_CONF = get_base_config('model_registry', {}) or {}
+
+
+class ModelEntry:
+    def __init__(self, key, model, load_time, memory):
+        self.key = key
+        self.model = model
+        self.load_time = load_time
+        self.memory = memory
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        self.batcher = None
+
+    def close(self):
+        if self.batcher:
+            self.batcher.close()
+            self.batcher = None
+
+    def to_dict(self):
+        factory, model_name, model_path, device, dtype, _ = self.key
+        return {
+            "factory": factory,
+            "model_name": model_name,
+            "model_path": model_path,
+            "device": device,
+            "dtype": dtype,
+            "load_time": round(self.load_time, 3),
+            "memory": self.memory,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "hits": self.hits,
+            "batcher": self.batcher.stats() if self.batcher else None,
+        }
+
+
+class ModelRegistry:
+    """
+    进程级嵌入模型注册表。
+
+    以 (factory, model_name, model_path, device, dtype) 为键，每个模型在进程内只加载一次，
+    由所有 Flask 线程共享；超过 max_size 时按 LRU 淘汰，空闲超过 idle_ttl 秒的模型会被释放。
+    """
+
+    def __init__(self, max_size=4, idle_ttl=3600):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # 每个键一把加载锁，避免不同模型的加载互相阻塞
+        self._loading_locks = {}
+
+    @staticmethod
+    def make_key(factory, model_name=None, model_path=None, device=None, dtype=None, **kwargs):
+        return (factory, model_name, model_path, device, dtype, tuple(sorted(kwargs.items())))
+
+    def get(self, factory, model_name=None, model_path=None, device=None, dtype=None, **kwargs):
+        return self._get_entry(factory, model_name, model_path, device, dtype, **kwargs).model
+
+    def get_batcher(self, factory, model_name=None, model_path=None, device=None, dtype=None, **kwargs) -> EmbeddingBatcher:
+        """
+        返回值: 绑定在共享模型上的 EmbeddingBatcher，模型需实现 encode_batch。
+        功能: 与 get() 参数相同；批处理器随模型一起被淘汰。
+        """
+        entry = self._get_entry(factory, model_name, model_path, device, dtype, **kwargs)
+        with self._lock:
+            if entry.batcher is None:
+                if not hasattr(entry.model, "encode_batch"):
+                    raise LookupError(f"Embedding model factory {factory} does not support batching")
+                entry.batcher = EmbeddingBatcher(entry.model)
+            return entry.batcher
+
+    def _get_entry(self, factory, model_name=None, model_path=None, device=None, dtype=None, **kwargs) -> ModelEntry:
+        """
+        参数:
+            factory — EmbeddingModelFactory 中的工厂名，例如 "BAAI"、"Tongyi-Qianwen"。
+            model_name/model_path/device/dtype — 模型标识及加载选项，同时作为缓存键。
+            kwargs — 其余构造参数（如 key），同样参与缓存键。
+        返回值: 已加载模型的登记项。
+        功能: 命中则直接返回共享实例，否则加载并登记。
+        """
+        if factory not in EmbeddingModelFactory:
+            raise LookupError(f"Embedding model factory {factory} not supported")
+        key = self.make_key(factory, model_name, model_path, device, dtype, **kwargs)
+        entry = self._touch(key)
+        if entry:
+            return entry
+
+        with self._lock:
+            load_lock = self._loading_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            entry = self._touch(key)
+            if entry:
+                return entry
+            entry = self._load(key, factory, model_name, model_path, device, dtype, **kwargs)
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._loading_locks.pop(key, None)
+            self.evict()
+            return entry
+
+    def _touch(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.last_used = time.time()
+            entry.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def _load(self, key, factory, model_name, model_path, device, dtype, **kwargs):
+        ctor_kwargs = dict(kwargs)
+        for k, v in (("model_name", model_name), ("model_path", model_path), ("device", device), ("dtype", dtype)):
+            if v is not None:
+                ctor_kwargs[k] = v
+        start_ts = time.perf_counter()
+        model = EmbeddingModelFactory[factory](**ctor_kwargs)
+        load_time = time.perf_counter() - start_ts
+        memory = 0
+        if hasattr(model, "memory_usage"):
+            try:
+                memory = model.memory_usage()
+            except Exception:
+                logging.exception(f"ModelRegistry fail to measure memory of {factory}/{model_name or model_path}")
+        logging.info(f"ModelRegistry loaded {factory}/{model_name or model_path} in {load_time:.2f}s, memory: {memory} bytes")
+        return ModelEntry(key, model, load_time, memory)
+
+    def evict(self, now=None):
+        """淘汰空闲超时以及超出容量的模型，返回被淘汰的数量"""
+        now = now or time.time()
+        evicted = []
+        with self._lock:
+            if self.idle_ttl and self.idle_ttl > 0:
+                for key, entry in list(self._entries.items()):
+                    if now - entry.last_used > self.idle_ttl:
+                        evicted.append(self._entries.pop(key))
+            while self.max_size and len(self._entries) > self.max_size:
+                _, entry = self._entries.popitem(last=False)
+                evicted.append(entry)
+        for entry in evicted:
+            entry.close()
+            logging.info(f"ModelRegistry evicted {entry.key[0]}/{entry.key[1] or entry.key[2]}")
+        return len(evicted)
+
+    def warmup(self, specs=None):
+        """
+        参数: specs — 模型规格列表，每项为 get() 的关键字参数；为空时读取配置 model_registry.warmup。
+        功能: 在服务启动时预先加载模型，单个模型加载失败不影响其余模型。
+        """
+        specs = specs if specs is not None else REGISTRY_CONF.get("warmup", [])
+        for spec in specs or []:
+            spec = dict(spec)
+            if spec.get("factory") == "BAAI" and not spec.get("model_path"):
+                spec["model_path"] = BAAI_VL_MODEL_PATH
+            try:
+                self.get(**spec)
+            except Exception:
+                logging.exception(f"ModelRegistry warmup {spec} failed")
+
+    def stats(self):
+        with self._lock:
+            return [entry.to_dict() for entry in self._entries.values()]
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.close()
+
+
+MODEL_REGISTRY = ModelRegistry(
+    max_size=int(REGISTRY_CONF.get("max_size", 4)),
+    idle_ttl=int(REGISTRY_CONF.get("idle_ttl", 3600)),
+)
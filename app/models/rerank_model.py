@@ -0,0 +1,42 @@
+from abc import ABC
+from http import HTTPStatus
+
+import numpy as np
+
+
+class Base(ABC):
+    def __init__(self, key, model_name, base_url=None, **kwargs):
+        pass
+
+    def similarity(self, query: str, texts: list, timeout=None):
+        """
+        参数: query — 查询文本；texts — 候选文本列表；timeout — 请求超时秒数，为空时使用 SDK 默认值。
+        返回值: (与 texts 同序的相关性分数数组, 消耗的 token 数)。
+        """
+        raise NotImplementedError("Please implement similarity method!")
+
+
+class QwenRerank(Base):
+    def __init__(self, key, model_name="gte-rerank", base_url=None, **kwargs):
+        self.key = key
+        self.model_name = model_name
+
+    def similarity(self, query: str, texts: list, timeout=None):
+        import dashscope
+
+        kwargs = {"request_timeout": timeout} if timeout else {}
+        resp = dashscope.TextReRank.call(
+            api_key=self.key,
+            model=self.model_name,
+            query=query,
+            documents=texts,
+            top_n=len(texts),
+            return_documents=False,
+            **kwargs
+        )
+        scores = np.zeros(len(texts), dtype=float)
+        if resp.status_code == HTTPStatus.OK:
+            for r in resp.output.results:
+                scores[r.index] = r.relevance_score
+            return scores, resp.usage.total_tokens
+        raise Exception(f"rerank with {self.model_name} failed: {resp.code} {resp.message}")
@@ -11,6 +11,7 @@ import os
 from app.constants import MME_VERSION
 from app import settings 
 from app.api import app
+from app.models.registry import MODEL_REGISTRY
 
 stop_event = threading.Event()
 
@@ -18,6 +19,7 @@ def update_progress():
     while not stop_event.is_set():
         try:
             stop_event.wait(6)
+            MODEL_REGISTRY.evict()
         except Exception:
             logging.exception("update_progress exception")
 
@@ -44,6 +46,8 @@ if __name__ == '__main__':
 
     settings.init_settings()
 
+    MODEL_REGISTRY.warmup()
+
     thread = ThreadPoolExecutor(max_workers=1)
     thread.submit(update_progress)
 
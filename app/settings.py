@@ -34,6 +34,11 @@ def init_settings():
     if lower_case_doc_engine == "milvus":
         from app.database.milvus_database import MilvusDatabase
         vectorDatabase = MilvusDatabase()
+    elif lower_case_doc_engine == "local":
+        import atexit
+        from app.database.local_vector_database import LocalVectorDatabase
+        vectorDatabase = LocalVectorDatabase()
+        atexit.register(vectorDatabase.save)
     else:
         raise Exception(f"Not supported vector engine: {VECTOR_ENGINE}")
 
@@ -0,0 +1,424 @@
+import base64
+import json
+import logging
+import os
+import queue
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import wait
+from functools import partial
+from io import BytesIO
+
+from PIL import Image
+
+from app.utils import get_base_config
+from app.database.redis_database import REDIS_CONN
+from app.database.services.content_index import KbContentIndex
+from app.database.storage_factory import STORAGE_IMPL
+from app.database.vector_database import build_vector_row
+from app.database.vector_writer import VECTOR_WRITER
+from app.database.index_spec import get_kb_vector_dtype
+from app.models.registry import MODEL_REGISTRY
+from app.models.settings import BAAI_VL_MODEL_PATH
+
+BULK_CONF = get_base_config('bulk_ingest', {}) or {}
+EMBED_BATCH_SIZE = int(BULK_CONF.get("embed_batch_size", 32))
+INSERT_BATCH_SIZE = int(BULK_CONF.get("insert_batch_size", 512))
+MAX_PENDING = int(BULK_CONF.get("max_pending", 256))
+JOB_RETENTION = int(BULK_CONF.get("job_retention", 24 * 60 * 60))
+# max_content_length 为 0 时批量上传使用的上限（1 PiB），相当于不限制
+BULK_UNLIMITED_CONTENT_LENGTH = 1 << 50
+
+IMAGE_SUFFIXES = {"jpg", "jpeg", "png", "bmp", "gif", "webp"}
+JOB_KEY_PREFIX = "mme_bulk_job:"
+
+_SENTINEL = object()
+
+
+def _split_name(name):
+    name = os.path.basename(name)
+    stem, _, suffix = name.rpartition(".")
+    return (stem, suffix.lower()) if stem else (name, "")
+
+
+def _merge_member(sample, name, data):
+    _, suffix = _split_name(name)
+    if suffix in IMAGE_SUFFIXES:
+        sample["image"] = data
+        sample["suffix"] = suffix
+    elif suffix == "txt":
+        sample["text"] = data.decode("utf-8").strip()
+
+
+def iter_tar(stream):
+    """
+    流式读取 tar(.gz) 包，按 webdataset 约定将相邻且同名（不含后缀）的图片与 .txt 组成一条数据，
+    整个包不会被读入内存。
+    """
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        current_stem, sample = None, {}
+        for member in tar:
+            if not member.isfile():
+                continue
+            stem, _ = _split_name(member.name)
+            if stem != current_stem:
+                if "image" in sample:
+                    yield sample
+                current_stem, sample = stem, {}
+            _merge_member(sample, member.name, tar.extractfile(member).read())
+        if "image" in sample:
+            yield sample
+
+
+def iter_zip(stream):
+    """zip 需要随机访问，先落盘到临时文件，再按同名规则逐条读取"""
+    with tempfile.TemporaryFile() as tmp:
+        while True:
+            chunk = stream.read(1024 * 1024)
+            if not chunk:
+                break
+            tmp.write(chunk)
+        tmp.seek(0)
+        with zipfile.ZipFile(tmp) as zf:
+            groups = {}
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                groups.setdefault(_split_name(info.filename)[0], []).append(info.filename)
+            for names in groups.values():
+                sample = {}
+                for name in names:
+                    _merge_member(sample, name, zf.read(name))
+                if "image" in sample:
+                    yield sample
+
+
+def iter_jsonl(stream):
+    """每行一个 JSON：{"text": "...", "image": "<base64>", "suffix": "jpg", "tags": ["..."]}"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        row = json.loads(line)
+        if not row.get("image"):
+            continue
+        yield {
+            "image": base64.b64decode(row["image"]),
+            "text": row.get("text") or None,
+            "suffix": row.get("suffix", "jpg"),
+            "tags": row.get("tags") or None,
+        }
+
+
+def iter_multipart(files, form):
+    """multipart 表单：多个 images 文件字段，与同序的 texts 字段一一对应"""
+    texts = form.getlist("texts")
+    for i, image in enumerate(files.getlist("images")):
+        yield {
+            "image": image.read(),
+            "text": texts[i] if i < len(texts) and texts[i] else None,
+            "suffix": image.filename.split('.')[-1].lower(),
+        }
+
+
+def prepare_sample_image(kb, sample):
+    """
+    参数: kb — 知识库记录；sample — 含 image 二进制的数据。
+    功能: 编码前逐条解码校验图片，无法解码时抛出 ValueError，避免一张坏图让整批编码失败；
+        BaaiVl 直接保留解码后的 JPEG 文件对象交给 encode_batch，不重复解码。
+    """
+    if kb.model == "BaaiVl":
+        sample["image"] = MODEL_REGISTRY.get("BAAI", model_path=BAAI_VL_MODEL_PATH).prepare_image(sample["image"])
+        return
+    try:
+        with Image.open(BytesIO(sample["image"])) as img:
+            img.load()
+    except Exception as e:
+        raise ValueError(f"Invalid image: {e}")
+
+
+def embed_samples(kb, samples):
+    """
+    参数: kb — 知识库记录；samples — 含 image/text 的数据列表。
+    返回值: 与 samples 同序的向量列表。
+    功能: 按知识库模型批量编码；有无文本的数据分开编码，保证同一批内模态一致。
+    """
+    vectors = [None] * len(samples)
+    groups = {True: [], False: []}
+    for i, s in enumerate(samples):
+        groups[bool(s.get("text"))].append(i)
+
+    for with_text, idxs in groups.items():
+        if not idxs:
+            continue
+        texts = [samples[i]["text"] for i in idxs] if with_text else None
+        images = [samples[i]["image"] for i in idxs]
+        if kb.model == "BaaiVl":
+            embed_model = MODEL_REGISTRY.get("BAAI", model_path=BAAI_VL_MODEL_PATH)
+            res = embed_model.encode_batch(texts, images)
+        elif kb.model == "Qwen":
+            embed_model = MODEL_REGISTRY.get("Tongyi-Qianwen", model_name="multimodal-embedding-v1", key="sk-83e82632fcca46b388b454c5efa116fa")
+            images = [f"data:image/{samples[i]['suffix']};base64,{base64.b64encode(samples[i]['image']).decode('utf-8')}" for i in idxs]
+            res, _ = embed_model.encode(texts or [None] * len(idxs), images, [None] * len(idxs))
+            if len(res) != len(idxs):
+                raise Exception(f"model {kb.model} returned {len(res)} embeddings for {len(idxs)} inputs")
+        else:
+            raise LookupError(f"model {kb.model} not support")
+        for i, v in zip(idxs, res):
+            vectors[i] = v
+    return vectors
+
+
+class BulkIngestJob:
+    """
+    批量入库任务。
+
+    请求线程边读取上传流边并发写入对象存储，并把数据放入有界队列；后台线程按
+    EMBED_BATCH_SIZE 批量编码，按 INSERT_BATCH_SIZE 批量写入向量库。进度保存在 Redis 中供轮询。
+    """
+
+    def __init__(self, kb):
+        self.id = uuid.uuid4().hex
+        self.kb = kb
+        self.status = "running"
+        self.message = ""
+        self.received = 0
+        self.uploaded = 0
+        self.embedded = 0
+        self.inserted = 0
+        self.failed = 0
+        self.duplicate_objects = 0
+        self.duplicate_entries = 0
+        self.start_at = time.time()
+        self.end_at = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._upload_slots = threading.BoundedSemaphore(MAX_PENDING)
+        self._uploads = set()
+        # 上传中的图片：image_digest -> (对象名, Future)，上传结束即移除，此后由内容索引去重
+        self._upload_futures = {}
+        self._worker = threading.Thread(target=self._run, name=f"bulk_ingest_{self.id[:8]}", daemon=True)
+        self._last_saved = 0
+        self._content_index = KbContentIndex(kb.id)
+        self._vector_dtype = get_kb_vector_dtype(kb.parser_config)
+        # 处理中（尚未写入或失败）的数据，避免同一批上传中的重复项在索引更新前被重复处理；
+        # 写入或失败后即移除，大小受有界队列与批大小限制
+        self._inflight_entries = set()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kb_id": self.kb.id,
+            "status": self.status,
+            "message": self.message,
+            "received": self.received,
+            "uploaded": self.uploaded,
+            "embedded": self.embedded,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "duplicate_objects": self.duplicate_objects,
+            "duplicate_entries": self.duplicate_entries,
+            "start_at": self.start_at,
+            "end_at": self.end_at,
+        }
+
+    def save(self, force=True):
+        now = time.time()
+        if not force and now - self._last_saved < 1:
+            return
+        self._last_saved = now
+        REDIS_CONN.set_obj(JOB_KEY_PREFIX + self.id, self.to_dict(), JOB_RETENTION)
+
+    @staticmethod
+    def get_progress(job_id):
+        res = REDIS_CONN.get(JOB_KEY_PREFIX + job_id)
+        return json.loads(res) if res else None
+
+    def _count(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def _upload(self, image_digest, file_name, binary):
+        """提交到对象存储的共享上传线程池，上传完成后在回调中更新内容索引与计数；返回上传的 Future"""
+        future = STORAGE_IMPL.put_async(self.kb.bucket, file_name, binary)
+        with self._lock:
+            self._uploads.add(future)
+            self._upload_futures[image_digest] = (file_name, future)
+        future.add_done_callback(partial(self._on_uploaded, image_digest, file_name))
+        return future
+
+    @staticmethod
+    def _upload_succeeded(future):
+        try:
+            return future.result() is not None
+        except Exception:
+            return False
+
+    def _on_uploaded(self, image_digest, file_name, future):
+        try:
+            if future.result() is None:
+                raise Exception(f"put {self.kb.bucket}/{file_name} failed")
+            self._content_index.add_object(image_digest, file_name)
+            self._count("uploaded")
+        except Exception:
+            # 失败计数在 _embed_and_buffer 中按数据条数累计
+            logging.exception(f"BulkIngestJob {self.id} upload {file_name} failed")
+        finally:
+            with self._lock:
+                self._uploads.discard(future)
+                self._upload_futures.pop(image_digest, None)
+            self._upload_slots.release()
+
+    def _release(self, entry_digest):
+        """数据写入或失败后移出处理中集合；失败的数据可由同一任务中后续的重复项重新入库"""
+        with self._lock:
+            self._inflight_entries.discard(entry_digest)
+
+    def feed(self, samples):
+        """在请求线程中消费上传流，直到流读完；编码与写入在后台继续进行"""
+        self.save()
+        self._worker.start()
+        try:
+            for sample in samples:
+                self._count("received")
+                if self._dedup(sample):
+                    self.save(force=False)
+                    continue
+                self._queue.put(sample)
+                self.save(force=False)
+        except Exception as e:
+            logging.exception(f"BulkIngestJob {self.id} read stream failed")
+            self.message = f"read stream failed: {e}"
+        finally:
+            self._queue.put(_SENTINEL)
+        return self.id
+
+    def _dedup(self, sample):
+        """
+        返回值: True 表示数据已入库，直接跳过。
+        功能: 计算内容哈希；图片已存在时复用对象名，否则提交上传。
+        """
+        image_digest = sample["hash"] = KbContentIndex.image_digest(sample["image"])
+        sample["entry_digest"] = KbContentIndex.entry_digest(image_digest, sample.get("text"))
+        with self._lock:
+            inflight = sample["entry_digest"] in self._inflight_entries
+        if inflight or self._content_index.has_entry(sample["entry_digest"]):
+            self._count("duplicate_entries")
+            return True
+        with self._lock:
+            self._inflight_entries.add(sample["entry_digest"])
+            uploading = self._upload_futures.get(image_digest)
+
+        if uploading:
+            # 同一任务内的重复图片仍在上传，写入前同样要等待上传结果
+            sample["file_name"], sample["upload"] = uploading
+            self._count("duplicate_objects")
+            return False
+        # 上传完成时先写内容索引再移出上传中集合，因此这里查不到的图片确实尚未上传
+        file_name = self._content_index.get_object(image_digest)
+        if file_name:
+            sample["file_name"] = file_name
+            self._count("duplicate_objects")
+        else:
+            sample["file_name"] = KbContentIndex.object_name(image_digest, sample.get("suffix"))
+            self._upload_slots.acquire()
+            sample["upload"] = self._upload(image_digest, sample["file_name"], sample["image"])
+        return False
+
+    def _embed_and_buffer(self, batch, rows):
+        # 等待图片上传完成，上传失败的数据不再编码写入，避免向量指向不存在的对象
+        uploaded = []
+        for sample in batch:
+            upload = sample.pop("upload", None)
+            if upload is not None and not self._upload_succeeded(upload):
+                self._count("failed")
+                self._release(sample["entry_digest"])
+                continue
+            uploaded.append(sample)
+        batch = []
+        for sample in uploaded:
+            try:
+                prepare_sample_image(self.kb, sample)
+                batch.append(sample)
+            except Exception as e:
+                logging.warning(f"BulkIngestJob {self.id} skip {sample['file_name']}: {e}")
+                self.message = f"embed failed: {e}"
+                self._count("failed")
+                self._release(sample["entry_digest"])
+        if not batch:
+            return
+        try:
+            vectors = embed_samples(self.kb, batch)
+        except Exception:
+            logging.exception(f"BulkIngestJob {self.id} embed batch of {len(batch)} failed, retry one by one")
+            batch, vectors = self._embed_one_by_one(batch)
+        self._count("embedded", len(batch))
+        for s, v in zip(batch, vectors):
+            row = build_vector_row(v, bucket=self.kb.bucket, file_name=s["file_name"], text=s.get("text"),
+                                   kb_id=self.kb.id, content_hash=s["hash"], tags=s.get("tags"), vector_dtype=self._vector_dtype)
+            rows.append((row, s["entry_digest"]))
+
+    def _embed_one_by_one(self, batch):
+        """整批编码失败后逐条重试，只把出错的数据计为失败；返回成功的数据及其向量"""
+        embedded, vectors = [], []
+        for sample in batch:
+            try:
+                vectors.append(embed_samples(self.kb, [sample])[0])
+                embedded.append(sample)
+            except Exception as e:
+                logging.warning(f"BulkIngestJob {self.id} embed {sample['file_name']} failed: {e}")
+                self.message = f"embed failed: {e}"
+                self._count("failed")
+                self._release(sample["entry_digest"])
+        return embedded, vectors
+
+    def _insert(self, rows):
+        if not rows:
+            return
+        try:
+            VECTOR_WRITER.write(self.kb.collection, [row for row, _ in rows]).result()
+            for _, entry_digest in rows:
+                self._content_index.add_entry(entry_digest)
+            self._count("inserted", len(rows))
+        except Exception as e:
+            logging.warning(f"bulk ingest insert into {self.kb.collection} failed: {e}")
+            self._count("failed", len(rows))
+        for _, entry_digest in rows:
+            self._release(entry_digest)
+        rows.clear()
+
+    def _run(self):
+        batch, rows, sample = [], [], None
+        try:
+            while True:
+                sample = self._queue.get()
+                if sample is not _SENTINEL:
+                    batch.append(sample)
+                if len(batch) >= EMBED_BATCH_SIZE or (sample is _SENTINEL and batch):
+                    self._embed_and_buffer(batch, rows)
+                    batch = []
+                if len(rows) >= INSERT_BATCH_SIZE or sample is _SENTINEL:
+                    self._insert(rows)
+                self.save(force=False)
+                if sample is _SENTINEL:
+                    break
+            with self._lock:
+                uploads = list(self._uploads)
+            wait(uploads)
+            self.status = "done" if not self.failed and not self.message else "failed"
+        except Exception as e:
+            logging.exception(f"BulkIngestJob {self.id} failed")
+            self.status = "failed"
+            self.message = str(e)
+            # 丢弃剩余数据，避免请求线程阻塞在有界队列上
+            while sample is not _SENTINEL:
+                sample = self._queue.get()
+        finally:
+            self.end_at = time.time()
+            self._content_index.count("duplicate_objects", self.duplicate_objects)
+            self._content_index.count("duplicate_entries", self.duplicate_entries)
+            self.save()
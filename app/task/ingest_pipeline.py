@@ -0,0 +1,145 @@
+import logging
+import queue
+import threading
+import time
+
+
+class StageStats:
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.start_at = time.time()
+        # 最近一分钟内每秒完成数，用于计算瞬时吞吐
+        self._window = {}
+
+    def record(self, ok, failed, busy):
+        now = int(time.time())
+        self.processed += ok
+        self.failed += failed
+        self.batches += 1
+        self.busy += busy
+        self._window[now] = self._window.get(now, 0) + ok + failed
+        for ts in [ts for ts in self._window if ts < now - 60]:
+            del self._window[ts]
+
+    def to_dict(self):
+        elapsed = max(time.time() - self.start_at, 1e-6)
+        window = sum(self._window.values())
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round((self.processed + self.failed) / self.batches, 2) if self.batches else 0,
+            "throughput": round(window / min(elapsed, 60), 3),
+            "utilization": round(self.busy / elapsed, 3),
+        }
+
+
+class Stage:
+    """
+    流水线中的一个阶段。
+
+    每个阶段有自己的有界输入队列和 workers 个工作线程；下游队列满时 put 会阻塞，
+    从而把背压逐级传回上游。func 接收一批数据（最多 batch_size 条，最多等待 max_wait 秒），
+    返回需要传给下一阶段的数据列表；抛出异常时整批交给 on_error 处理。
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=64, batch_size=1, max_wait=0.05, on_error=None):
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.batch_size = max(int(batch_size), 1)
+        self.max_wait = max_wait
+        self.on_error = on_error
+        self.input = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.stats = StageStats()
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"stage_{self.name}_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def put(self, item):
+        self.input.put(item)
+        with self._stats_lock:
+            self.stats.received += 1
+
+    def _collect(self):
+        try:
+            first = self.input.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.input.get(timeout=remaining) if remaining > 0 else self.input.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            start_ts = time.perf_counter()
+            try:
+                outputs = self.func(batch) or []
+                failed = len(batch) - len(outputs) if self.next_stage else 0
+            except Exception as e:
+                logging.exception(f"stage {self.name} failed on batch of {len(batch)}")
+                outputs, failed = [], len(batch)
+                if self.on_error:
+                    for item in batch:
+                        try:
+                            self.on_error(item, e)
+                        except Exception:
+                            logging.exception(f"stage {self.name} on_error failed")
+            with self._stats_lock:
+                self.stats.record(len(batch) - failed, failed, time.perf_counter() - start_ts)
+            if self.next_stage:
+                for item in outputs:
+                    self.next_stage.put(item)
+
+    def to_dict(self):
+        with self._stats_lock:
+            res = self.stats.to_dict()
+        res.update({"workers": self.workers, "batch_size": self.batch_size, "queue_size": self.input.qsize()})
+        return res
+
+
+class Pipeline:
+    """按顺序串联多个 Stage"""
+
+    def __init__(self, stages):
+        self.stages = stages
+        for upstream, downstream in zip(stages, stages[1:]):
+            upstream.next_stage = downstream
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def submit(self, item):
+        self.stages[0].put(item)
+
+    def stats(self):
+        return {stage.name: stage.to_dict() for stage in self.stages}
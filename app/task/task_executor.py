@@ -9,7 +9,6 @@ import re
 import time
 import threading
 from functools import partial
-from io import BytesIO
 from multiprocessing.context import TimeoutError
 from timeit import default_timer as timer
 import tracemalloc
@@ -17,16 +16,27 @@ import signal
 import random
 import sys
 from peewee import DoesNotExist
+from PIL import Image
 
 from app.utils.log_utils import get_project_base_directory, initRootLogger
 from app.database.redis_database import REDIS_CONN, Payload
-from app.database.services.task_service import TaskService
-from app.database.services.file_service import FileService
-from app.database.db_models import close_connection
-from app.database.settings import SVR_QUEUE_NAME, FILE_MAXIMUM_SIZE
-from app.database import TaskStatus, LLMType
-from app.database.storage_factory import STORAGE_IMPL
-from app.database.services.llm_service import LLMBundle
+from app.database.services.task_service import TaskService, TASK_MAX_RETRY, PROGRESS_BUFFER
+from app.database.services.file_service import CanceledFiles, record_file_vector_ids
+from app.database.db_models import close_connection, Task
+from app.database.settings import (
+    SVR_QUEUE_NAME, SVR_DEAD_LETTER_QUEUE_NAME, SVR_TASK_BROKER_NAME, SVR_EXECUTOR_SET_NAME,
+    SVR_HEARTBEAT_INTERVAL, SVR_HEARTBEAT_RETENTION, FILE_MAXIMUM_SIZE
+)
+from app.database import TaskStatus, LLMType, FileType
+from app.database.storage_factory import STORAGE_IMPL, with_blob_cache
+from app.database.blob_cache import BlobCache
+from app.database.services.model_cache import BOUND_MODEL_CACHE
+from app.database.index_spec import get_kb_index_spec, get_kb_partition_key, get_kb_vector_dtype
+from app.database.vector_database import build_vector_row, encode_vector
+from app.database.vector_writer import VECTOR_WRITER
+from app.task.ingest_pipeline import Pipeline, Stage
+from app.utils import get_base_config
+from app.utils.file_utils import pil_to_fileobj
 from app import settings
 
 CONSUMER_NO = "0" if len(sys.argv) < 2 else sys.argv[1]
@@ -34,15 +44,30 @@ CONSUMER_NAME = "task_executor_" + CONSUMER_NO
 initRootLogger(CONSUMER_NAME)
 
 CONSUMER_NAME = "task_consumer_" + CONSUMER_NO
-PAYLOAD: Payload | None = None
+SVR_TASK_BROKER = SVR_TASK_BROKER_NAME
+EXECUTOR_CONF = get_base_config("task_executor", {}) or {}
+# 执行器读取对象时可经过本地磁盘缓存，重试与重新编码不再重复下载
+STORAGE = with_blob_cache(STORAGE_IMPL)
+COLLECT_BATCH_SIZE = int(EXECUTOR_CONF.get("collect_batch_size", 32))
+COLLECT_BLOCK_MS = int(EXECUTOR_CONF.get("collect_block_ms", 5000))
+RECLAIM_INTERVAL = int(EXECUTOR_CONF.get("reclaim_interval", 60))
+RECLAIM_MIN_IDLE_MS = int(EXECUTOR_CONF.get("reclaim_min_idle_ms", 10 * 60 * 1000))
+RECLAIM_MAX_DELIVERIES = int(EXECUTOR_CONF.get("reclaim_max_deliveries", 5))
+# 启动时从该消息 id 开始回放本消费者未确认的消息，回放完毕后置为 None
+RECOVER_FROM: str | None = "0"
 BOOT_AT = datetime.now().astimezone().isoformat(timespec="milliseconds")
 PENDING_TASKS = 0
 LAG_TASKS = 0
 
 mt_lock = threading.Lock()
+ack_lock = threading.Lock()
+ACK_BUFFER = []
 DONE_TASKS = 0
 FAILED_TASKS = 0
 CURRENT_TASK = None
+IN_FLIGHT_TASKS = {}
+IN_FLIGHT_MSG_IDS = set()
+CANCELED_FILES = CanceledFiles(reload_interval=int(EXECUTOR_CONF.get("cancel_reload_interval", 60)))
 
 tracemalloc_started = False
 
@@ -78,26 +103,30 @@ class TaskCanceledException(Exception):
     def __init__(self, msg):
         self.msg = msg
 
+def is_task_canceled(task_id):
+    """执行中的任务查本地已取消集合；未知任务才回退到数据库查询"""
+    with mt_lock:
+        task = IN_FLIGHT_TASKS.get(task_id)
+    if task:
+        return CANCELED_FILES.is_canceled(task["file_id"])
+    return TaskService.do_cancel(task_id)
+
+
 def set_progress(task_id, prog=None, msg="Processing..."):
     """
     参数:
         task_id: 当前任务的唯一标识符。
-        from_page: 起始页码（默认为0）。
-        to_page: 结束页码（默认为-1）。
         prog: 进度值，可以为空或负数表示错误状态。
         msg: 进度消息内容。
     返回值: 无返回值，但会更新数据库中的任务进度信息，并在特定条件下抛出异常。
-    功能: 更新指定任务的进度和状态，包括取消任务的处理逻辑。如果任务被取消，则调用PAYLOAD.ack()确认消息已消费，并引发TaskCanceledException异常。
+    功能: 更新指定任务的进度和状态，包括取消任务的处理逻辑。中间进度写入进程内缓冲区，由后台线程合并后批量落库；最终进度（1.0 或负数）同步落库，失败时抛出异常。如果任务被取消，则引发TaskCanceledException异常；队列消息由任务的持有方确认。
     """
-    global PAYLOAD
     if prog is not None and prog < 0:
         msg = "[ERROR]" + msg
     try:
-        cancel = TaskService.do_cancel(task_id)
+        cancel = is_task_canceled(task_id)
     except DoesNotExist:
         logging.warning(f"set_progress task {task_id} is unknown")
-        if PAYLOAD:
-            PAYLOAD.ack()
         return
     if cancel:
         msg += " [Canceled]"
@@ -110,137 +139,467 @@ def set_progress(task_id, prog=None, msg="Processing..."):
         d["progress"] = prog
 
     print(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}")
-    try:
-        TaskService.update_progress(task_id, d)
-    except DoesNotExist:
-        logging.warning(f"set_progress task {task_id} is unknown")
-        if PAYLOAD:
-            PAYLOAD.ack()
-            PAYLOAD = None
-        return
-    
-    close_connection()
-    if cancel and PAYLOAD:
-        PAYLOAD.ack()
-        PAYLOAD = None
+    if prog is not None and (prog >= 1.0 or prog < 0):
+        try:
+            PROGRESS_BUFFER.write(task_id, d)
+        finally:
+            close_connection()
+    else:
+        PROGRESS_BUFFER.add(task_id, d)
+        close_connection()
+    if cancel:
         raise TaskCanceledException(msg)
 
 
 def collect():
     """
     参数: 无
-    返回值: 如果成功获取到有效任务则返回该任务字典；否则返回None。
-    功能: 从Redis队列中拉取未确认的消息作为新任务。首先尝试获取未确认的消息，若没有则作为消费者等待新消息到来。获取到消息后，检查对应的任务是否存在及是否已被取消，若无效则记录日志并返回None。
+    返回值: (任务字典, Payload) 列表；没有有效任务时返回空列表。
+    功能: 通过一次阻塞的XREADGROUP从Redis队列中批量拉取消息。启动后先回放本消费者尚未确认的消息，回放完毕后等待新消息到来。
     """
-    global CONSUMER_NAME, PAYLOAD, DONE_TASKS, FAILED_TASKS
+    global RECOVER_FROM
     try:
-        PAYLOAD = REDIS_CONN.get_unacked_for(CONSUMER_NAME, SVR_QUEUE_NAME, "mme__svr_task_broker")
-        if not PAYLOAD:
-            time.sleep(1)
-            return None
+        payloads = []
+        if RECOVER_FROM is not None:
+            payloads = REDIS_CONN.queue_consumer_batch(SVR_QUEUE_NAME, SVR_TASK_BROKER, CONSUMER_NAME,
+                                                       count=COLLECT_BATCH_SIZE, block=None, msg_id=RECOVER_FROM)
+            RECOVER_FROM = payloads[-1].get_msg_id() if payloads else None
+        if not payloads:
+            payloads = REDIS_CONN.queue_consumer_batch(SVR_QUEUE_NAME, SVR_TASK_BROKER, CONSUMER_NAME,
+                                                       count=COLLECT_BATCH_SIZE, block=COLLECT_BLOCK_MS)
+        if not payloads:
+            return []
     except Exception:
         logging.exception("Get task event from queue exception")
-        return None
-    
-    msg = PAYLOAD.get_message()
-    if not msg:
-        return None
-    
-    task = None
-    canceled = False
+        return []
+    return prepare_tasks(payloads)
+
+
+def cancel_task(task, payload):
+    """尚未执行即被取消的任务：同步写入最终进度后确认消息；写入失败时不确认，留待重新投递"""
+    global DONE_TASKS
+    msg = datetime.now().strftime("%H:%M:%S") + " Task has been canceled."
     try:
-        task = TaskService.get_task(msg["id"])
-        if task:
-            _, file = FileService.get_by_id(task["file_id"])
-            canceled = file.run == TaskStatus.CANCEL.value or file.progress < 0
-    except DoesNotExist:
-        pass
+        PROGRESS_BUFFER.write(task["id"], {"progress_msg": msg, "progress": -1})
     except Exception:
+        logging.exception(f"cancel_task set progress for task {task['id']} failed, message left unacked")
+        return
+    ack_later(payload)
+    with mt_lock:
+        DONE_TASKS += 1
+
+
+def prepare_tasks(payloads):
+    """
+    参数: payloads — 从队列中取得的Payload列表。
+    返回值: (任务字典, Payload) 列表。
+    功能: 批量查询任务，任务不存在、已放弃或已被取消的消息直接确认并丢弃。
+    """
+    global DONE_TASKS
+    payload_by_id = {}
+    for payload in payloads:
+        msg = payload.get_message()
+        if msg and msg.get("id"):
+            payload_by_id[str(msg["id"])] = payload
+        else:
+            ack_later(payload)
+
+    try:
+        tasks = TaskService.get_task_batch(list(payload_by_id.keys()))
+    except Exception:
+        # 不确认消息，留待重新投递
         logging.exception("collect get_task exception")
-    if not task or canceled:
-        state = "is unknow" if not task else "has been cancelled"
+        flush_acks()
+        return []
+
+    res = []
+    for task in tasks:
+        payload = payload_by_id.pop(str(task["id"]))
+        # 本地集合之外再看数据库的 run 字段，只改了数据库的取消同样生效
+        if task.get("run") == TaskStatus.CANCEL.value or CANCELED_FILES.is_canceled(task["file_id"]):
+            cancel_task(task, payload)
+            continue
+        task["task_type"] = payload.get_message().get("task_type", "")
+        res.append((task, payload))
+    for task_id, payload in payload_by_id.items():
+        print(f"collect task {task_id} is unknown or has been cancelled")
+        ack_later(payload)
+    with mt_lock:
+        DONE_TASKS += len(payload_by_id)
+    flush_acks()
+    return res
+
+
+def reclaim(pipeline: Pipeline):
+    """
+    功能: 扫描整个消费组中空闲超过 RECLAIM_MIN_IDLE_MS 的待确认消息（例如所属执行器已崩溃），
+    通过XAUTOCLAIM转移给当前消费者继续处理。投递次数超过 RECLAIM_MAX_DELIVERIES、
+    任务重试次数达到上限或无法解析的消息转入死信队列。
+    """
+    start_id = "0-0"
+    while True:
+        start_id, payloads, bad_entries = REDIS_CONN.queue_autoclaim(
+            SVR_QUEUE_NAME, SVR_TASK_BROKER, CONSUMER_NAME, RECLAIM_MIN_IDLE_MS, start_id, COLLECT_BATCH_SIZE)
+        if bad_entries:
+            REDIS_CONN.queue_dead_letter(SVR_QUEUE_NAME, SVR_TASK_BROKER, SVR_DEAD_LETTER_QUEUE_NAME, bad_entries,
+                                         reason="malformed message")
         with mt_lock:
-            DONE_TASKS += 1
-        print(f"collect task {msg['id']} {state}")
-        return None
-    
-    task["task_type"] = msg.get("task_type", "")
-    return task
+            payloads = [p for p in payloads if p.get_msg_id() not in IN_FLIGHT_MSG_IDS]
+
+        if payloads:
+            deliveries = REDIS_CONN.queue_delivery_counts(SVR_QUEUE_NAME, SVR_TASK_BROKER, [p.get_msg_id() for p in payloads])
+            task_ids = [p.get_message().get("id") for p in payloads]
+            retries = {str(t.id): t.retry_count for t in TaskService.get_by_ids(task_ids, cols=[Task.id, Task.retry_count])}
+            poison, alive = [], []
+            for p in payloads:
+                task_id = str(p.get_message().get("id"))
+                if deliveries.get(p.get_msg_id(), 0) > RECLAIM_MAX_DELIVERIES or retries.get(task_id, 0) >= TASK_MAX_RETRY:
+                    poison.append(p)
+                else:
+                    alive.append(p)
+            if poison:
+                logging.warning(f"reclaim dead-letter {len(poison)} messages: {[p.get_msg_id() for p in poison]}")
+                REDIS_CONN.queue_dead_letter(SVR_QUEUE_NAME, SVR_TASK_BROKER, SVR_DEAD_LETTER_QUEUE_NAME,
+                                             [(p.get_msg_id(), {"message": json.dumps(p.get_message())}) for p in poison],
+                                             reason="exceeded retry limit")
+                poison_ids = [p.get_message().get("id") for p in poison if p.get_message().get("id")]
+                if poison_ids:
+                    TaskService.filter_update([Task.id.in_(poison_ids)], {
+                        Task.progress: -1,
+                        Task.progress_msg: Task.progress_msg + "\nERROR: Task is moved to dead letter queue after too many attempts.",
+                    })
+            if alive:
+                logging.info(f"reclaim {len(alive)} idle messages")
+                submit_tasks(pipeline, prepare_tasks(alive))
+
+        if start_id in ("0-0", b"0-0"):
+            break
+
+
+def reclaim_loop(pipeline: Pipeline):
+    while True:
+        time.sleep(RECLAIM_INTERVAL)
+        try:
+            reclaim(pipeline)
+        except Exception:
+            logging.exception("reclaim got exception")
+
+
+def ack_later(payload):
+    with ack_lock:
+        ACK_BUFFER.append(payload.get_msg_id())
+
 
+def flush_acks():
+    """通过管道一次性确认缓冲区中的消息"""
+    with ack_lock:
+        msg_ids = ACK_BUFFER[:]
+        ACK_BUFFER.clear()
+    if msg_ids and not REDIS_CONN.queue_ack(SVR_QUEUE_NAME, SVR_TASK_BROKER, msg_ids):
+        logging.warning(f"fail to ack {len(msg_ids)} messages, they will be redelivered")
 
-def get_storage_binary(bucket, name):
-    return STORAGE_IMPL.get(bucket, name)
+
+def get_storage_fileobj(bucket, name):
+    """流式下载对象到内存或临时文件，超过 FILE_MAXIMUM_SIZE 时抛出异常"""
+    return STORAGE.spool(bucket, name, max_size=FILE_MAXIMUM_SIZE)
 
 def init_kb(row, vector_size: int):
     collection_name = row.get("collection_name", "")
     if not collection_name:
         raise ValueError("collection_name is required")
-    return settings.vectorDatabase.createCollection(collection_name, row.get("kb_id", ""), vector_size)
+    index_spec = get_kb_index_spec(row.get("kb_parser_config"))
+    partition_key = get_kb_partition_key(row.get("kb_parser_config"))
+    vector_dtype = get_kb_vector_dtype(row.get("kb_parser_config"))
+    if not BOUND_MODEL_CACHE.ensure_collection(collection_name, row.get("kb_id", ""), vector_size, index_spec, partition_key, vector_dtype):
+        raise Exception(f"collection {collection_name} can not be created")
+    return True
 
 
-def do_handle_task(task):
-    task_id = task["id"]
-    task_embedding = task["embedding"]
-    task_language = task["language"]
+def finish_task(item, prog, msg):
+    """
+    更新任务最终进度并确认队列消息；任务在处理过程中被取消时按完成计数。
+    最终进度落库失败时不确认消息，由 reclaim 重新投递，避免进程崩溃后丢失任务结果。
+    """
+    global DONE_TASKS, FAILED_TASKS
+    task = item["task"]
+    persisted = False
+    try:
+        set_progress(task["id"], prog=prog, msg=msg)
+        persisted = True
+    except TaskCanceledException:
+        prog = 1.0
+        persisted = True
+    except Exception:
+        logging.exception(f"finish_task set_progress for task {task['id']} failed, message left unacked")
+    finally:
+        if item.get("payload") and persisted:
+            ack_later(item["payload"])
+        with mt_lock:
+            if prog is not None and prog < 0:
+                FAILED_TASKS += 1
+            else:
+                DONE_TASKS += 1
+            IN_FLIGHT_TASKS.pop(task["id"], None)
+            if item.get("payload"):
+                IN_FLIGHT_MSG_IDS.discard(item["payload"].get_msg_id())
 
-    progress_callback = partial(set_progress, task_id)
 
+def fail_task(item, e):
+    error_message = f"{item['task'].get('name', '')} ingest failed: {str(e)}"
+    logging.error(f"task {item['task']['id']} {error_message}")
+    finish_task(item, -1, error_message)
+
+
+def prefetch_stage(batch):
+    """从对象存储读取原始文件；已取消的任务在此直接结束，不再占用后续阶段"""
+    outputs = []
+    for item in batch:
+        task = item["task"]
+        try:
+            if CANCELED_FILES.is_canceled(task["file_id"]):
+                finish_task(item, -1, "Task has been canceled.")
+                continue
+            if task["type"] != FileType.IMAGE.value:
+                raise Exception(f"file type {task['type']} not supported")
+            try:
+                item["fileobj"] = get_storage_fileobj(task["bucket"], task["name"])
+            except ValueError as e:
+                raise Exception(f"file size exceeds {FILE_MAXIMUM_SIZE} bytes: {e}")
+            except Exception as e:
+                raise Exception(f"fail to get {task['bucket']}/{task['name']} from storage: {e}")
+            outputs.append(item)
+        except Exception as e:
+            fail_task(item, e)
+    flush_acks()
+    return outputs
+
+
+def decode_stage(batch):
+    """
+    直接从下载的文件对象计算内容哈希并解码图片。
+    RGB 的 JPEG 原样交给模型，其它格式才重新编码为 JPEG，避免多余的内存拷贝。
+    """
+    outputs = []
+    for item in batch:
+        fileobj = item.pop("fileobj")
+        try:
+            h = xxhash.xxh3_128()
+            for chunk in iter(partial(fileobj.read, 1024 * 1024), b""):
+                h.update(chunk)
+            item["hash"] = h.hexdigest()
+            fileobj.seek(0)
+            img = Image.open(fileobj)
+            img.load()
+            if img.format == "JPEG" and img.mode == "RGB":
+                fileobj.seek(0)
+                item["image"] = fileobj
+            else:
+                item["image"] = pil_to_fileobj(img)
+                fileobj.close()
+            outputs.append(item)
+        except Exception as e:
+            fileobj.close()
+            fail_task(item, f"Invalid image: {e}")
+    flush_acks()
+    return outputs
+
+
+def encode_stage(batch):
+    """
+    按嵌入模型分组后整批编码；同一组内有无文本的数据分开编码，保证模态一致。
+    首批向量的维度即用于确保向量集合存在。
+    """
+    groups = {}
+    for item in batch:
+        task = item["task"]
+        groups.setdefault((task["model"], bool(task.get("content"))), []).append(item)
+
+    outputs = []
+    for (model_name, with_text), items in groups.items():
+        try:
+            embedding_model = BOUND_MODEL_CACHE.get_bundle(LLMType.EMBEDDING, model_name)
+            texts = [item["task"]["content"] for item in items] if with_text else None
+            images = [item.pop("image") for item in items]
+            try:
+                vts, _ = embedding_model.encode(texts, images)
+            finally:
+                for image in images:
+                    image.close()
+            if len(vts) != len(items):
+                raise Exception(f"model {model_name} returned {len(vts)} embeddings for {len(items)} inputs")
+            vector_size = BOUND_MODEL_CACHE.get_dim(model_name)
+            if vector_size is None:
+                vector_size = len(vts[0])
+                BOUND_MODEL_CACHE.set_dim(model_name, vector_size)
+            if any(len(v) != vector_size for v in vts):
+                raise Exception(f"model {model_name} returned embeddings whose size is not {vector_size}")
+            for item in items:
+                init_kb(item["task"], vector_size)
+            for item, v in zip(items, vts):
+                # 编码后立即转换为知识库的存储精度，降低流水线中的内存占用
+                item["vector"] = encode_vector(v, get_kb_vector_dtype(item["task"].get("kb_parser_config")))
+            outputs.extend(items)
+        except Exception as e:
+            logging.exception(f"encode batch of {len(items)} with {model_name} failed")
+            for item in items:
+                fail_task(item, e)
+    flush_acks()
+    return outputs
+
+
+def insert_stage(batch):
+    """按向量集合分组交给缓冲写入器，写入完成后在回调中结束任务；写入器积压过多时在此阻塞，形成背压"""
+    groups = {}
+    for item in batch:
+        groups.setdefault(item["task"]["collection_name"], []).append(item)
+
+    for collection_name, items in groups.items():
+        for item in items:
+            try:
+                row = build_vector_row(
+                    item["vector"],
+                    bucket=item["task"]["bucket"],
+                    file_name=item["task"]["name"],
+                    text=item["task"].get("content"),
+                    kb_id=item["task"].get("kb_id"),
+                    file_id=item["task"].get("file_id"),
+                    content_hash=item.get("hash"),
+                    vector_dtype=get_kb_vector_dtype(item["task"].get("kb_parser_config")),
+                )
+            except Exception as e:
+                fail_task(item, e)
+                continue
+            future = VECTOR_WRITER.write(collection_name, [row])
+            future.add_done_callback(partial(on_inserted, item))
+    flush_acks()
+    return []
+
+
+def on_inserted(item, future):
+    """缓冲写入完成的回调：成功时记录文件的向量 id 并结束任务，重试耗尽时标记任务失败"""
     try:
-        task_canceled = TaskService.do_cancel(task_id)
-    except DoesNotExist:
-        logging.warning(f"task {task_id} is unknown")
-        return
-    if task_canceled:
-        progress_callback(-1, msg="Task has been canceled.")
-        return
-    
-    try:
-        embedding_model = LLMBundle(LLMType.EMBEDDING, llm_name=task_embedding, lang=task_language)
-        vts, _ = embedding_model.encode(["ok"])
-        vector_size = len(vts[0])
-    except Exception as e:
-        error_message = f'Fail to bind embedding model: {str(e)}'
-        progress_callback(-1, msg=error_message)
-        logging.exception(error_message)
-        raise
-    
-    init_kb(task, vector_size)
-
-    if task.get("task_type", "") == "image":
-        start_ts = timer()
+        ids = future.result()
         try:
-            image_binary = get_storage_binary(task["bucket"], task["name"])
-            v, c = embedding_model.encode([task.get("content", "")], [image_binary])
-        except
+            record_file_vector_ids(item["task"].get("file_id"), ids)
+        except Exception:
+            logging.exception(f"record vector ids for task {item['task']['id']} failed")
+        finish_task(item, 1.0, "Done.")
+    except Exception as e:
+        fail_task(item, e)
+    flush_acks()
 
 
+def build_pipeline():
+    conf = EXECUTOR_CONF
+    max_wait = float(conf.get("max_wait_ms", 50)) / 1000
+    queue_size = int(conf.get("queue_size", 64))
+    return Pipeline([
+        Stage("prefetch", prefetch_stage, workers=conf.get("prefetch_workers", 4), queue_size=queue_size, on_error=fail_task),
+        Stage("decode", decode_stage, workers=conf.get("decode_workers", 4), queue_size=queue_size, on_error=fail_task),
+        Stage("encode", encode_stage, workers=conf.get("encode_workers", 1), queue_size=queue_size,
+              batch_size=conf.get("encode_batch_size", 16), max_wait=max_wait, on_error=fail_task),
+        Stage("insert", insert_stage, workers=conf.get("insert_workers", 1), queue_size=queue_size,
+              batch_size=conf.get("insert_batch_size", 256), max_wait=max_wait, on_error=fail_task),
+    ])
 
 
+def submit_tasks(pipeline: Pipeline, tasks):
+    """把任务提交到流水线；流水线入口队列已满时在此阻塞，形成背压"""
+    global mt_lock, CURRENT_TASK
+    for task, payload in tasks:
+        task["collection_name"] = task.get("collection", "")
+        print(f"handle_task submit task {task['id']}")
+        with mt_lock:
+            CURRENT_TASK = copy.deepcopy(task)
+            IN_FLIGHT_TASKS[task["id"]] = task
+            IN_FLIGHT_MSG_IDS.add(payload.get_msg_id())
+        pipeline.submit({"task": task, "payload": payload})
 
 
-def handle_task():
-    global PAYLOAD, mt_lock, DONE_TASKS, FAILED_TASKS, CURRENT_TASK
-    task = collect()
-    if task:
+def handle_task(pipeline: Pipeline):
+    submit_tasks(pipeline, collect())
+    flush_acks()
+
+
+def get_rss():
+    """当前进程常驻内存字节数"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        import resource
+        # 非 Linux 平台退化为峰值常驻内存
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def report_status(pipeline: Pipeline):
+    """
+    功能: 周期性地把执行器的心跳写入Redis。每个执行器一个有序集合（以时间戳为分数），
+    内容包括队列积压、已完成/失败数、当前任务、常驻内存、最近一分钟吞吐以及各阶段统计。
+    """
+    global PENDING_TASKS, LAG_TASKS
+    REDIS_CONN.sadd(SVR_EXECUTOR_SET_NAME, CONSUMER_NAME)
+    samples = []
+    while True:
         try:
-            print(f"handle_task begin for task {json.dumps(task)}")
-            with mt_lock:
-                CURRENT_TASK = copy.deepcopy(task)
-            do_handle_task(task)
-            while mt_lock:
-                DONE_TASKS += 1
-                CURRENT_TASK = None
-            print(f"handle_task done for task {json.dumps(task)}")
-        except TaskCanceledException:
+            now = time.time()
+            group_info = REDIS_CONN.queue_info(SVR_QUEUE_NAME, SVR_TASK_BROKER)
+            if group_info:
+                PENDING_TASKS = int(group_info.get("pending", 0))
+                LAG_TASKS = int(group_info.get("lag") or 0)
+
             with mt_lock:
-                DONE_TASKS += 1
-                CURRENT_TASK = None
-            try:
-                set_progress(task["id"], prog=-1, msg="handle_task got TaskCanceledException")
-            except Exception:
-                pass
-            logging.debug("handle_task got TaskCanceledException", exc_info=True)
-    if PAYLOAD:
-        PAYLOAD.ack()
-        PAYLOAD = None
+                done, failed = DONE_TASKS, FAILED_TASKS
+                current = CURRENT_TASK["id"] if CURRENT_TASK else None
+                in_flight = len(IN_FLIGHT_TASKS)
+            samples.append((now, done + failed))
+            while samples and samples[0][0] < now - 60:
+                samples.pop(0)
+            elapsed = now - samples[0][0]
+            tasks_per_second = (samples[-1][1] - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+
+            heartbeat = json.dumps({
+                "name": CONSUMER_NAME,
+                "now": datetime.now().astimezone().isoformat(timespec="milliseconds"),
+                "boot_at": BOOT_AT,
+                "pending": PENDING_TASKS,
+                "lag": LAG_TASKS,
+                "done": done,
+                "failed": failed,
+                "in_flight": in_flight,
+                "current": current,
+                "rss": get_rss(),
+                "tasks_per_second": round(tasks_per_second, 3),
+                "stages": pipeline.stats(),
+                "vector_writer": VECTOR_WRITER.stats(),
+                "blob_cache": STORAGE.stats() if isinstance(STORAGE, BlobCache) else None,
+            })
+            REDIS_CONN.zadd(CONSUMER_NAME, heartbeat, now)
+            REDIS_CONN.zremrangebyscore(CONSUMER_NAME, 0, now - SVR_HEARTBEAT_RETENTION)
+        except Exception:
+            logging.exception("report_status got exception")
+        time.sleep(SVR_HEARTBEAT_INTERVAL)
+
+
+def main():
+    logging.info(f"{CONSUMER_NAME} started at {BOOT_AT}")
+    settings.init_settings()
+    signal.signal(signal.SIGUSR1, start_tracemalloc_and_snapshot)
+    signal.signal(signal.SIGUSR2, stop_tracemalloc)
+
+    REDIS_CONN.create_consumer_group(SVR_QUEUE_NAME, SVR_TASK_BROKER)
+    CANCELED_FILES.start()
+    pipeline = build_pipeline()
+    pipeline.start()
+    threading.Thread(target=reclaim_loop, args=(pipeline,), name="reclaim", daemon=True).start()
+    threading.Thread(target=report_status, args=(pipeline,), name="report_status", daemon=True).start()
+    while True:
+        try:
+            handle_task(pipeline)
+        except Exception:
+            logging.exception("handle_task got exception")
+
 
+if __name__ == "__main__":
+    main()